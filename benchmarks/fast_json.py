@@ -0,0 +1,108 @@
+"""
+Cost of turning book, review and tag responses into bytes, default path against FAST_JSON.
+
+Builds ORM objects in memory (no database needed) and times, per response model, what
+FastAPI does after the endpoint returns (response_model validation, JSON mode dump and
+stdlib json encoding) against compile_serializer plus orjson. Both must produce the same
+bytes, the benchmark stops if they do not.
+
+    python -m benchmarks.fast_json
+    python -m benchmarks.fast_json --books 100 --reviews 10 --runs 500
+"""
+from fastapi.routing import APIRoute, serialize_response
+from fastapi.responses import JSONResponse
+from typing import Iterable, List, Optional
+from datetime import date, datetime, timedelta
+from src.books.structs import BookPage, BookDetailResponse
+from src.reviews.structs import ReviewResponse
+from src.tags.structs import TagResponse
+from src.db.models import Book, Review, Tag
+from src.fast_json import compile_serializer, dumps
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+
+def make_books(books : int, reviews : int) -> List[Book]:
+
+    tags = [Tag(id = uuid.uuid4(), name = f'tag-{i}', created_at = datetime(2025, 1, 1, 12, 0, 0, i)) for i in range(5)]
+
+    result = []
+
+    for i in range(books):
+        book = Book(
+            id = uuid.uuid4(), title = f'Bench book {i} – ünïcode', author = f'Author {i % 50}', published_date = date(1950, 1, 1) + timedelta(days = i * 7919 % 27000),
+            page_count = 50 + i * 31 % 1200, language = 'en', user_id = uuid.uuid4(), version = 1, review_count = reviews, rating_sum = 4 * reviews,
+            rating_avg = 4 if reviews else 0, created_at = datetime(2025, 1, 1) + timedelta(seconds = i, microseconds = i), updated_at = datetime(2025, 1, 2)
+        )
+        book.reviews = [
+            Review(id = uuid.uuid4(), rating = 4, review = f'Review {j} of book {i}', user_id = uuid.uuid4(), book_id = book.id, created_at = datetime(2025, 2, 1, 0, 0, j), updated_at = datetime(2025, 2, 1))
+            for j in range(reviews)
+        ]
+        book.tags = tags[:i % 5]
+
+        result.append(book)
+
+    return result
+
+
+async def default_body(route : APIRoute, content) -> bytes:
+
+    return JSONResponse(await serialize_response(field = route.response_field, response_content = content)).body
+
+
+async def time_case(model, content, runs : int) -> dict:
+
+    route = APIRoute('/', lambda: None, response_model = model)
+    serializer = compile_serializer(model)
+
+    expected = await default_body(route, content)
+
+    if dumps(serializer, content) != expected:
+        raise SystemExit(f'{model} serializes differently with FAST_JSON')
+
+    default, fast = [], []
+
+    for _ in range(runs):
+        started = time.perf_counter()
+        await default_body(route, content)
+        default.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        dumps(serializer, content)
+        fast.append((time.perf_counter() - started) * 1000)
+
+    return {'default' : statistics.median(default), 'fast' : statistics.median(fast), 'bytes' : len(expected)}
+
+
+async def main(argv : Optional[Iterable[str]] = None):
+
+    parser = argparse.ArgumentParser(description = 'Benchmark response serialization with and without FAST_JSON')
+    parser.add_argument('--books', type = int, default = 20, help = 'books on the listing page')
+    parser.add_argument('--reviews', type = int, default = 20, help = 'reviews on the book detail')
+    parser.add_argument('--runs', type = int, default = 1000, help = 'timed runs per case')
+
+    args = parser.parse_args(argv)
+
+    books = make_books(args.books, args.reviews)
+
+    cases = [
+        ('book page', BookPage, {'books' : books, 'next_cursor' : 'cursor'}),
+        ('book detail', BookDetailResponse, books[-1]),
+        ('review list', List[ReviewResponse], books[-1].reviews),
+        ('tag list', List[TagResponse], books[-1].tags),
+    ]
+
+    print(f'{args.runs} runs per case, median in ms\n')
+    print(f'{"case":<16}{"bytes":>10}{"default":>10}{"fast":>10}{"speedup":>10}')
+
+    for name, model, content in cases:
+        result = await time_case(model, content, args.runs)
+
+        print(f'{name:<16}{result["bytes"]:>10}{result["default"]:>10.3f}{result["fast"]:>10.3f}{result["default"] / result["fast"]:>9.1f}x')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,141 @@
+"""
+Latency of an unrelated endpoint while a worker is flooded with logins.
+
+Runs the app in process (one event loop, like one worker) and probes
+GET /api/v1/metrics/db-pool, which needs no query once the admin's role is cached, first on its own and then while
+LOGINS clients log in back to back. With bcrypt on the password pool the probe's p99
+should barely move, `--inline` runs bcrypt on the event loop as before for comparison.
+
+Needs the database of DATABASE_URL migrated to head, a verified benchmark user and
+a verified admin for the probe are created in it when missing:
+
+    python -m benchmarks.login_storm
+    python -m benchmarks.login_storm --logins 32 --seconds 10 --inline
+"""
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Iterable, Optional
+from src.main import app
+from src.auth.password_pool import password_pool
+from src.auth.utils import create_access_token, generate_hash_password
+from src.db.main import create_db_engine
+from src.config import Config
+import argparse
+import asyncio
+import statistics
+import time
+
+BENCHMARK_EMAIL = 'login-storm@bookly.com'
+BENCHMARK_PASSWORD = 'login-storm-password'
+ADMIN_EMAIL = 'login-storm-admin@bookly.com'
+
+
+async def create_user(database_url : str) -> str:
+    """Creates the benchmark user and the probing admin when missing, returns the admin's id"""
+
+    engine = create_db_engine(database_url)
+
+    try:
+        async with AsyncSession(engine) as session:
+            await session.exec(text(
+                """
+                INSERT INTO users (id, username, password, email, first_name, last_name, role, is_verified, created_at, updated_at)
+                VALUES (gen_random_uuid(), 'login_storm', :password, :email, 'Login', 'Storm', 'user', true, now(), now()),
+                       (gen_random_uuid(), 'login_storm_admin', :password, :admin_email, 'Login', 'Storm', 'admin', true, now(), now())
+                ON CONFLICT (email) DO NOTHING
+                """
+            ), params = {'email' : BENCHMARK_EMAIL, 'admin_email' : ADMIN_EMAIL, 'password' : generate_hash_password(BENCHMARK_PASSWORD)})
+            await session.commit()
+
+            admin_id = (await session.exec(text('SELECT id FROM users WHERE email = :email'), params = {'email' : ADMIN_EMAIL})).scalar_one()
+
+    finally:
+        await engine.dispose()
+
+    return str(admin_id)
+
+
+async def probe(client : AsyncClient, token : str, until : float) -> list:
+
+    timings = []
+
+    while time.perf_counter() < until:
+        started = time.perf_counter()
+        response = await client.get('/api/v1/metrics/db-pool', headers = {'Authorization' : f'Bearer {token}'})
+        timings.append((time.perf_counter() - started) * 1000)
+
+        assert response.status_code == 200, response.text
+
+        await asyncio.sleep(0.01)
+
+    return timings
+
+
+async def login(client : AsyncClient, until : float) -> dict:
+
+    statuses = {}
+
+    while time.perf_counter() < until:
+        response = await client.post('/api/v1/auth/login', json = {'email' : BENCHMARK_EMAIL, 'password' : BENCHMARK_PASSWORD})
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    return statuses
+
+
+def report_line(name : str, timings : list) -> str:
+
+    quantiles = statistics.quantiles(timings, n = 100, method = 'inclusive')
+
+    return f'{name:<24}{len(timings):>8}{quantiles[49]:>10.2f}{quantiles[98]:>10.2f}{max(timings):>10.2f}'
+
+
+async def main(argv : Optional[Iterable[str]] = None):
+
+    parser = argparse.ArgumentParser(description = 'Probe latency during a login storm')
+    parser.add_argument('--logins', type = int, default = 16, help = 'concurrent clients logging in back to back')
+    parser.add_argument('--seconds', type = float, default = 5, help = 'length of each phase')
+    parser.add_argument('--inline', action = 'store_true', help = 'run bcrypt on the event loop, the behaviour before the password pool')
+    parser.add_argument('--database-url', default = Config.DATABASE_URL)
+
+    args = parser.parse_args(argv)
+
+    admin_id = await create_user(args.database_url)
+
+    Config.RATE_LIMIT_PER_EMAIL = Config.RATE_LIMIT_PER_IP = 0  # the storm is one email from one address, it measures bcrypt and not the login limits
+
+    if args.inline:
+        async def inline(function, *args):
+            return function(*args)
+
+        password_pool.run = inline
+
+    token = create_access_token(user_data = {'email' : ADMIN_EMAIL, 'user_id' : admin_id, 'role' : 'admin'})
+
+    async with AsyncClient(transport = ASGITransport(app = app), base_url = 'http://localhost') as client:
+        await probe(client, token, time.perf_counter() + 0.5)  # warm up
+
+        idle = await probe(client, token, time.perf_counter() + args.seconds)
+
+        until = time.perf_counter() + args.seconds
+
+        storm, *statuses = await asyncio.gather(probe(client, token, until), *[login(client, until) for _ in range(args.logins)])
+
+    logins = {}
+
+    for status in statuses:
+        for code, count in status.items():
+            logins[code] = logins.get(code, 0) + count
+
+    print(f'bcrypt {"on the event loop" if args.inline else f"on {password_pool.size} pool threads"}, {args.logins} clients logging in\n')
+    print(f'{"probe":<24}{"calls":>8}{"p50 ms":>10}{"p99 ms":>10}{"max ms":>10}')
+    print(report_line('idle', idle))
+    print(report_line('during login storm', storm))
+    print(f'\nlogins by status: {logins}')
+
+    if not args.inline:
+        print(f'password pool: {password_pool.stats()}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
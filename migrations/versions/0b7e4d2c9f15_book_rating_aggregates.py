@@ -0,0 +1,55 @@
+"""book rating aggregates
+
+Revision ID: 0b7e4d2c9f15
+Revises: f2b6d94a1c58
+Create Date: 2026-10-18 17:08:51.204663
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b7e4d2c9f15'
+down_revision: Union[str, None] = 'f2b6d94a1c58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('books', sa.Column('review_count', postgresql.INTEGER(), server_default='0', nullable=False))
+    op.add_column('books', sa.Column('rating_sum', postgresql.INTEGER(), server_default='0', nullable=False))
+
+    # Backfill from the existing reviews, from here on ReviewService keeps both columns in step
+    op.execute('''
+        UPDATE books
+        SET review_count = totals.review_count, rating_sum = totals.rating_sum
+        FROM (SELECT book_id, count(*) AS review_count, sum(rating) AS rating_sum FROM reviews GROUP BY book_id) AS totals
+        WHERE books.id = totals.book_id
+    ''')
+
+    # Adding a stored generated column rewrites the books table, run it in a quiet window
+    op.add_column('books', sa.Column(
+        'rating_avg',
+        postgresql.DOUBLE_PRECISION(),
+        sa.Computed('CASE WHEN review_count > 0 THEN rating_sum::double precision / review_count ELSE 0 END', persisted=True),
+        nullable=False
+    ))
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_books_rating_avg_id', 'books', ['rating_avg', 'id'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_books_rating_avg_id', table_name='books', postgresql_concurrently=True)
+
+    op.drop_column('books', 'rating_avg')
+    op.drop_column('books', 'rating_sum')
+    op.drop_column('books', 'review_count')
@@ -0,0 +1,43 @@
+"""book filter indexes
+
+Revision ID: 3a9f1e6b7c42
+Revises: 0b7e4d2c9f15
+Create Date: 2026-10-18 18:12:40.915307
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3a9f1e6b7c42'
+down_revision: Union[str, None] = '0b7e4d2c9f15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = [
+    ('ix_books_published_date_id', 'books', ['published_date', 'id']),
+    ('ix_books_author_created_at_id', 'books', ['author', 'created_at', 'id']),
+    ('ix_books_author_rating_avg_id', 'books', ['author', 'rating_avg', 'id']),
+    ('ix_books_language_created_at_id', 'books', ['language', 'created_at', 'id']),
+    ('ix_books_language_rating_avg_id', 'books', ['language', 'rating_avg', 'id']),
+    ('ix_booktags_tag_id_book_id', 'booktags', ['tag_id', 'book_id']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,46 @@
+"""index hot lookup columns
+
+Revision ID: 5c1e9a7d2b44
+Revises: 944fb65cba0a
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e9a7d2b44'
+down_revision: Union[str, None] = '944fb65cba0a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction, so the indexes are built
+    # in autocommit mode without locking the tables against writes.
+    # The unique indexes fail if duplicate emails / tag names already exist, clean those up first.
+    # The book listings continue after (created_at, id) of the previous page, the row value
+    # comparison can only be an index condition when id is part of the index too.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_users_email', 'users', ['email'], unique=True, postgresql_concurrently=True)
+        op.create_index('ix_tags_name', 'tags', ['name'], unique=True, postgresql_concurrently=True)
+        op.create_index('ix_books_created_at_id', 'books', ['created_at', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_books_user_id_created_at_id', 'books', ['user_id', 'created_at', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_reviews_book_id_created_at', 'reviews', ['book_id', 'created_at'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_reviews_user_id_created_at', 'reviews', ['user_id', 'created_at'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_reviews_user_id_created_at', table_name='reviews', postgresql_concurrently=True)
+        op.drop_index('ix_reviews_book_id_created_at', table_name='reviews', postgresql_concurrently=True)
+        op.drop_index('ix_books_user_id_created_at_id', table_name='books', postgresql_concurrently=True)
+        op.drop_index('ix_books_created_at_id', table_name='books', postgresql_concurrently=True)
+        op.drop_index('ix_tags_name', table_name='tags', postgresql_concurrently=True)
+        op.drop_index('ix_users_email', table_name='users', postgresql_concurrently=True)
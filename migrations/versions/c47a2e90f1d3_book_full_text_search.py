@@ -0,0 +1,42 @@
+"""book full text search
+
+Revision ID: c47a2e90f1d3
+Revises: 5c1e9a7d2b44
+Create Date: 2026-10-18 13:05:47.903115
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c47a2e90f1d3'
+down_revision: Union[str, None] = '5c1e9a7d2b44'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Adding a stored generated column rewrites the books table, run it in a quiet window
+    op.add_column('books', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(author, ''))", persisted=True),
+        nullable=True
+    ))
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_books_search_vector', 'books', ['search_vector'], unique=False, postgresql_using='gin', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_books_search_vector', table_name='books', postgresql_using='gin', postgresql_concurrently=True)
+
+    op.drop_column('books', 'search_vector')
@@ -0,0 +1,31 @@
+"""book version for etags
+
+Revision ID: e5a8c3d7f210
+Revises: c47a2e90f1d3
+Create Date: 2026-10-18 15:42:10.318744
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a8c3d7f210'
+down_revision: Union[str, None] = 'c47a2e90f1d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # A constant default is stored in the catalog, existing rows are not rewritten
+    op.add_column('books', sa.Column('version', postgresql.INTEGER(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('books', 'version')
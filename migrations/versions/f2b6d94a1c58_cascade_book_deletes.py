@@ -0,0 +1,41 @@
+"""cascade book deletes
+
+Revision ID: f2b6d94a1c58
+Revises: e5a8c3d7f210
+Create Date: 2026-10-18 16:20:33.571902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b6d94a1c58'
+down_revision: Union[str, None] = 'e5a8c3d7f210'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def replace_book_fk(table: str, ondelete: Union[str, None]) -> None:
+    # NOT VALID skips the scan of existing rows while the tables are locked. The autocommit block
+    # commits the swap first, releasing those locks, so VALIDATE scans without blocking writes
+    op.drop_constraint(f'{table}_book_id_fkey', table, type_='foreignkey')
+    op.create_foreign_key(f'{table}_book_id_fkey', table, 'books', ['book_id'], ['id'], ondelete=ondelete, postgresql_not_valid=True)
+
+    with op.get_context().autocommit_block():
+        op.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {table}_book_id_fkey')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    replace_book_fk('reviews', 'CASCADE')
+    replace_book_fk('booktags', 'CASCADE')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    replace_book_fk('booktags', None)
+    replace_book_fk('reviews', None)
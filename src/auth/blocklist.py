@@ -0,0 +1,318 @@
+"""
+Blocklist of revoked tokens (logout), checked on every authenticated request.
+
+Revoked jtis are stored in Redis (in process memory without REDIS_URL) with a TTL equal
+to the remaining lifetime of the token, after that the token is rejected as expired
+anyway. Every worker also keeps a Bloom filter of the revoked jtis, filled from the
+store and kept current over pub/sub, so the common case (a token that was never revoked)
+is answered locally. Only a filter hit is confirmed against the store. A rebuilt filter
+is sized for twice the revocations it was loaded with, and once that fills up it is
+rebuilt at most every REBUILD_INTERVAL seconds, never per request.
+
+When the store can not be reached the last loaded filter answers alone: a filter hit
+is rejected, as it may well be revoked, a miss is let through. Until a filter was loaded
+every token is rejected. BLOCKLIST_FAIL_OPEN lets every token through instead. The filter
+is reloaded once the store answers again.
+"""
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from typing import Callable, Dict, List, Optional
+from src.config import Config
+import asyncio
+import hashlib
+import logging
+import math
+import time
+import uuid
+
+CHANNEL = 'bookly:revoked'
+REBUILD_INTERVAL = 60  # seconds between rebuilds of a filter that filled up
+
+
+def blocklist_key(jti : str) -> str:
+
+    return f'bookly:revoked:{jti}'
+
+
+def revocation_id(token_data : dict) -> str:
+    """
+    jti of a token. Tokens issued before jti was a real uuid all carry the same one,
+    they are told apart by their user, expiry and kind instead
+    """
+
+    jti = str(token_data.get('jti'))
+
+    try:
+        return str(uuid.UUID(jti))
+    except ValueError:
+        legacy = f"{token_data['user'].get('user_id')}:{token_data.get('exp')}:{token_data.get('refresh')}"
+
+        return 'legacy-' + hashlib.sha256(legacy.encode()).hexdigest()
+
+
+class BloomFilter:
+    """Set membership with no false negatives and about `error_rate` false positives up to `capacity` items"""
+
+    def __init__(self, capacity : int, error_rate : float):
+
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, item : str) -> List[int]:
+
+        digest = hashlib.blake2b(item.encode(), digest_size = 16).digest()
+
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1  # double hashing, k positions from two hashes
+
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item : str) -> None:
+        """Adds `item`, an item already in the filter (or a false positive) is not counted again"""
+
+        added = False
+
+        for position in self.positions(item):
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                self.bits[position >> 3] |= 1 << (position & 7)
+                added = True
+
+        self.count += added
+
+    def full(self) -> bool:
+
+        return self.count >= self.capacity
+
+    def __contains__(self, item : str) -> bool:
+
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+
+class MemoryBlocklistBackend:
+    """Process local store, revocations reach the subscribers of the same process right away"""
+
+    name = 'memory'
+
+    def __init__(self):
+
+        self.entries : Dict[str, float] = {}
+        self.subscribers : List[Callable[[str], None]] = []
+
+    async def add(self, jti : str, ttl : int) -> None:
+
+        self.entries[jti] = time.monotonic() + ttl
+
+        for callback in self.subscribers:
+            callback(jti)
+
+    async def exists(self, jti : str) -> bool:
+
+        expires_at = self.entries.get(jti)
+
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.entries[jti]
+            return False
+
+        return expires_at is not None
+
+    async def members(self) -> List[str]:
+
+        now = time.monotonic()
+
+        return [jti for jti, expires_at in self.entries.items() if expires_at > now]
+
+    async def follow(self, callback : Callable[[str], None]) -> None:
+
+        if callback not in self.subscribers:
+            self.subscribers.append(callback)
+
+    def following(self) -> bool:
+
+        return True
+
+
+class RedisBlocklistBackend:
+
+    name = 'redis'
+
+    def __init__(self, url : str):
+
+        self.client = Redis.from_url(url, decode_responses = True)
+        self.listener : Optional[asyncio.Task] = None
+
+    async def add(self, jti : str, ttl : int) -> None:
+
+        async with self.client.pipeline(transaction = False) as pipeline:
+            pipeline.set(blocklist_key(jti), 1, ex = ttl)
+            pipeline.publish(CHANNEL, jti)
+            await pipeline.execute()
+
+    async def exists(self, jti : str) -> bool:
+
+        return bool(await self.client.exists(blocklist_key(jti)))
+
+    async def members(self) -> List[str]:
+
+        prefix = len(blocklist_key(''))
+
+        return [key[prefix:] async for key in self.client.scan_iter(match = blocklist_key('*'), count = 1000)]
+
+    async def follow(self, callback : Callable[[str], None]) -> None:
+
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(CHANNEL)  # subscribed before the caller loads the members, so no revocation falls in between
+
+        self.listener = asyncio.create_task(self.listen(pubsub, callback))
+
+    async def listen(self, pubsub, callback : Callable[[str], None]) -> None:
+
+        try:
+            async for message in pubsub.listen():
+                if message['type'] == 'message':
+                    callback(message['data'])
+
+        except (RedisError, OSError) as e:
+            logging.warning(f'Blocklist subscription lost, the filter is reloaded on the next request: {e}')
+
+        finally:
+            await pubsub.aclose()
+
+    def following(self) -> bool:
+
+        return self.listener is not None and not self.listener.done()
+
+
+class TokenBlocklist:
+
+    def __init__(self, backend, capacity : int = 100000, error_rate : float = 0.001, fail_open : bool = False):
+
+        self.backend = backend
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.fail_open = fail_open
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.loaded = False  # self.bloom holds every revocation of the store as of its load
+        self.loaded_at = 0.0  # time.monotonic() of the last complete load
+        self.arrived : Optional[List[str]] = None  # revocations received while a load runs, added to the filter it builds
+        self.synced_loop = None  # event loop the filter was last loaded in
+        self.followed_loop = None  # event loop of the subscription, a listener of a closed loop never fires
+        self.loading : Optional[asyncio.Task] = None  # requests arriving while the filter loads wait for the same load
+        self.lookups = 0
+        self.filtered = 0  # answered by the filter alone
+        self.false_positives = 0
+        self.errors = 0
+
+    def remember(self, jti : str) -> None:
+
+        self.bloom.add(jti)
+
+        if self.arrived is not None:
+            self.arrived.append(jti)
+
+    async def sync(self) -> None:
+        """Makes sure the filter is loaded and follows new revocations in the running event loop"""
+
+        loop = asyncio.get_running_loop()
+
+        if self.synced_loop is loop and self.backend.following() and (not self.bloom.full() or time.monotonic() - self.loaded_at < REBUILD_INTERVAL):
+            return  # a full filter only lets more of the never revoked tokens reach the store until it is rebuilt
+
+        if self.loading is None or self.loading.done() or self.loading.get_loop() is not loop:
+            self.loading = loop.create_task(self.load(loop))
+
+        await asyncio.shield(self.loading)
+
+    async def load(self, loop) -> None:
+
+        self.synced_loop = None
+
+        self.arrived = []  # the current filter keeps answering should the store fail halfway
+
+        try:
+            if not self.backend.following() or self.followed_loop is not loop:
+                await self.backend.follow(self.remember)
+                self.followed_loop = loop
+
+            members = await self.backend.members()
+
+            jtis = members + self.arrived
+
+        finally:
+            self.arrived = None
+
+        bloom = BloomFilter(max(self.capacity, 2 * len(jtis)), self.error_rate)  # expired jtis are not loaded again, room is left for as many new ones
+
+        for jti in jtis:
+            bloom.add(jti)
+
+        self.bloom = bloom
+        self.loaded = True
+        self.loaded_at = time.monotonic()
+        self.synced_loop = loop
+
+    async def revoke(self, token_data : dict) -> None:
+
+        ttl = math.ceil(token_data['exp'] - time.time())
+
+        if ttl <= 0:  # expired already, it is rejected without the blocklist
+            return
+
+        jti = revocation_id(token_data)
+
+        await self.backend.add(jti, ttl)
+
+        self.remember(jti)
+
+    async def is_revoked(self, token_data : dict) -> bool:
+
+        self.lookups += 1
+
+        jti = revocation_id(token_data)
+
+        try:
+            await self.sync()
+
+            if jti not in self.bloom:
+                self.filtered += 1
+                return False
+
+            revoked = await self.backend.exists(jti)
+
+        except (RedisError, OSError) as e:
+            self.errors += 1
+            self.synced_loop = None
+
+            if self.fail_open:
+                logging.warning(f'Blocklist lookup of {jti} failed, the token is let through: {e}')
+                return False
+
+            revoked = not self.loaded or jti in self.bloom  # no filter to tell, or it may be revoked
+
+            logging.warning(f'Blocklist lookup of {jti} failed, the token is {"rejected" if revoked else "let through by the filter"}: {e}')
+            return revoked
+
+        if not revoked:
+            self.false_positives += 1
+
+        return revoked
+
+    def stats(self) -> dict:
+
+        return {
+            'backend' : self.backend.name,
+            'lookups' : self.lookups,
+            'filtered' : self.filtered,
+            'false_positives' : self.false_positives,
+            'errors' : self.errors,
+            'filter_entries' : self.bloom.count
+        }
+
+
+token_blocklist = TokenBlocklist(
+    RedisBlocklistBackend(Config.REDIS_URL) if Config.REDIS_URL else MemoryBlocklistBackend(),
+    Config.BLOCKLIST_FILTER_CAPACITY,
+    Config.BLOCKLIST_FILTER_ERROR_RATE,
+    Config.BLOCKLIST_FAIL_OPEN
+)
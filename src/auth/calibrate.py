@@ -0,0 +1,80 @@
+"""
+Recommends BCRYPT_ROUNDS for the host it runs on.
+
+Every extra round doubles the time of a bcrypt hash. This times hashes at increasing
+costs and recommends the highest one whose median hash still fits the target latency,
+run it on the production hardware and put the result in the environment:
+
+    python -m src.auth.calibrate
+    python -m src.auth.calibrate --target-ms 100 --samples 5
+
+Existing hashes keep working with a new cost, each is rehashed at its user's next login.
+"""
+from passlib.hash import bcrypt
+from typing import Iterable, List, Optional, Tuple
+from src.config import Config
+import argparse
+import statistics
+import time
+
+MIN_ROUNDS = 4  # lowest cost bcrypt accepts
+MAX_ROUNDS = 31
+SAFE_ROUNDS = 10  # below this a stolen hash is cheap to brute force, whatever the latency
+
+
+def time_hash(rounds : int, samples : int) -> float:
+    """Median milliseconds of a bcrypt hash at `rounds`"""
+
+    hasher = bcrypt.using(rounds = rounds)
+
+    timings = []
+
+    for _ in range(samples):
+        started = time.perf_counter()
+        hasher.hash('calibration-password')
+        timings.append((time.perf_counter() - started) * 1000)
+
+    return statistics.median(timings)
+
+
+def calibrate(target_ms : float, samples : int = 3, max_rounds : int = MAX_ROUNDS) -> Tuple[int, List[Tuple[int, float]]]:
+    """Recommended cost and the (rounds, median ms) measured, the timing stops at the first cost over the target"""
+
+    time_hash(MIN_ROUNDS, 1)  # the first hash loads the bcrypt backend, it is not counted
+
+    timings = []
+
+    for rounds in range(MIN_ROUNDS, max_rounds + 1):
+        timings.append((rounds, time_hash(rounds, samples)))
+
+        if timings[-1][1] > target_ms:
+            break
+
+    fitting = [rounds for rounds, milliseconds in timings if milliseconds <= target_ms]
+
+    return (fitting[-1] if fitting else MIN_ROUNDS), timings
+
+
+def main(argv : Optional[Iterable[str]] = None):
+
+    parser = argparse.ArgumentParser(description = 'Recommend a bcrypt cost for a target hash latency on this host')
+    parser.add_argument('--target-ms', type = float, default = 250, help = 'longest acceptable time of one hash')
+    parser.add_argument('--samples', type = int, default = 3, help = 'hashes timed per cost')
+
+    args = parser.parse_args(argv)
+
+    recommended, timings = calibrate(args.target_ms, args.samples)
+
+    print(f'{"rounds":>8}{"median ms":>12}')
+
+    for rounds, milliseconds in timings:
+        print(f'{rounds:>8}{milliseconds:>12.1f}{"  <- current" if rounds == Config.BCRYPT_ROUNDS else ""}')
+
+    print(f'\nBCRYPT_ROUNDS={recommended}')
+
+    if recommended < SAFE_ROUNDS:
+        print(f'warning: {recommended} rounds fits {args.target_ms:g}ms on this host but is below {SAFE_ROUNDS}, consider a higher target or faster hardware')
+
+
+if __name__ == '__main__':
+    main()
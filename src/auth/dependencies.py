@@ -2,18 +2,22 @@ from fastapi import Request
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer
 from fastapi.security.http import HTTPAuthorizationCredentials
-from .utils import decode_token
+from .token_cache import token_cache
+from .blocklist import token_blocklist
 from sqlmodel.ext.asyncio.session import AsyncSession
 from src.db.main import get_session
 from src.auth.services import UserService
 from typing import List
 from src.db.models import User
+from src.auth.structs import Principal
 from src.errors import (
     InvalidToken,
+    RevokedToken,
     AccessTokenRequired,
     RefreshTokenRequired,
     InsufficientPermission,
-    AccountNotVerified
+    AccountNotVerified,
+    UserNotFound
 )
 
 user_service = UserService()
@@ -28,23 +32,23 @@ class TokenBearer(HTTPBearer):
 
         token = creds.credentials
 
-        token_data = decode_token(token)
+        token_data = token_cache.decode(token)  # the signature is checked once per token, later requests reuse the verified claims
 
-        if not self.validate_token(token):
+        if token_data is None:
             raise InvalidToken()
         
         self.verify_token_data(token_data)
 
+        if await token_blocklist.is_revoked(token_data):  # answered by the local filter unless the token may be revoked
+            raise RevokedToken()
+
+        request.state.token_data = token_data  # lets request scoped dependencies (e.g. get_read_session) see who is calling
+
         return token_data
     
     def validate_token(self, token:str) -> bool:
 
-        token_data = decode_token(token)
-
-        if token_data is not None:
-            return True
-        else:
-            return False
+        return token_cache.decode(token) is not None
         
 
 class AccessTokenBearer(TokenBearer):
@@ -92,17 +96,35 @@ async def get_current_user(token_data: dict = Depends(AccessTokenBearer()), sess
             detail={'message':str(e)}
         )
     
+async def get_current_principal(token_data: dict = Depends(AccessTokenBearer()), session: AsyncSession = Depends(get_session)) -> Principal:
+    """
+    Id, role and verified flag of the authenticated user, served from the cache so
+    authorization usually runs without a query
+    """
+
+    user_id = token_data['user'].get('user_id')
+
+    if user_id is None:
+        raise InvalidToken()
+
+    principal = await user_service.get_principal(user_id, session)
+
+    if principal is None:
+        raise UserNotFound()
+
+    return principal
+
 class RoleChecker:
     def __init__(self, allowed_roles : List[str]) -> None:
         
         self.allowed_roles = allowed_roles
     
-    def __call__(self, current_user : User = Depends(get_current_user)) -> any:
+    def __call__(self, principal : Principal = Depends(get_current_principal)) -> any:
 
-        if not current_user.is_verified:
+        if not principal.is_verified:
             raise AccountNotVerified()
         
-        if current_user.role in self.allowed_roles:
+        if principal.role in self.allowed_roles:
 
             return True
 
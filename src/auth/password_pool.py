@@ -0,0 +1,89 @@
+"""
+Bounded worker pool for bcrypt.
+
+Hashing or checking a password takes tens of milliseconds of CPU, run on the event loop
+it stalls every other request of the worker. The pool runs them on PASSWORD_POOL_SIZE
+threads (bcrypt releases the GIL while it hashes) with at most PASSWORD_POOL_QUEUE calls
+waiting for a thread, beyond that PasswordPoolBusy is raised and the client gets a 503
+instead of queueing behind a login storm.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from typing import Callable
+from src.auth.utils import generate_hash_password, verify_password
+from src.errors import PasswordPoolBusy
+from src.config import Config
+import asyncio
+import time
+
+
+class PasswordPool:
+
+    def __init__(self, size : int = 4, queue : int = 64, window : int = 1000):
+
+        self.size = size
+        self.queue = queue
+        self.executor = ThreadPoolExecutor(max_workers = size, thread_name_prefix = 'bcrypt')
+        self.pending = 0  # calls submitted and not finished, running or waiting for a thread
+        self.completed = 0
+        self.rejected = 0
+        self.latencies = deque(maxlen = window)  # seconds of the most recent calls, time spent waiting for a thread excluded
+
+    def timed(self, function : Callable, *args):
+
+        started = time.perf_counter()
+
+        try:
+            return function(*args)
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+    async def run(self, function : Callable, *args):
+
+        if self.pending >= self.size + self.queue:
+            self.rejected += 1
+            raise PasswordPoolBusy()
+
+        self.pending += 1
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self.timed, function, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    async def hash(self, password : str) -> str:
+
+        return await self.run(generate_hash_password, password)
+
+    async def verify(self, plain_password : str, hashed_password : str) -> bool:
+
+        return await self.run(verify_password, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction : float) -> float:
+
+            if not latencies:
+                return 0.0
+
+            return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 2)
+
+        return {
+            'size' : self.size,
+            'queue_limit' : self.queue,
+            'running' : min(self.pending, self.size),
+            'queued' : max(self.pending - self.size, 0),
+            'completed' : self.completed,
+            'rejected' : self.rejected,
+            'latency_ms' : {
+                'p50' : percentile(0.5),
+                'p99' : percentile(0.99),
+                'max' : percentile(1.0)
+            }
+        }
+
+
+password_pool = PasswordPool(Config.PASSWORD_POOL_SIZE, Config.PASSWORD_POOL_QUEUE)
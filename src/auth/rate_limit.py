@@ -0,0 +1,152 @@
+"""
+Sliding window rate limits for the credential endpoints (login, signup, password reset).
+
+Every limit counts the attempts of one key (an email or a client IP) per route in fixed
+windows of RATE_LIMIT_WINDOW seconds, and weighs the previous window by how much of it
+still overlaps the sliding window ending now:
+
+    estimate = previous * (1 - elapsed / window) + current
+
+Every attempt is counted first and checked against the counts the increment returned,
+in one atomic step, so concurrent attempts can not all read the same count and slip
+through together. An attempt whose estimate, itself included, is over any of its limits
+raises RateLimited before the route touches the database or bcrypt. Rejected attempts
+stay counted, Retry-After is exact for a client that waits. Counters live in Redis when
+REDIS_URL is set, in process memory otherwise (tests and single worker setups). Like
+the cache, a Redis failure lets the attempt through.
+"""
+from fastapi import Request
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from typing import Dict, List, Tuple
+from src.errors import RateLimited
+from src.config import Config
+import logging
+import math
+import time
+
+
+class MemoryCounterBackend:
+
+    name = 'memory'
+
+    def __init__(self):
+
+        self.counters : Dict[str, Tuple[float, int]] = {}  # key -> (expires at, count)
+
+    def count(self, key : str, now : float) -> int:
+
+        expires_at, count = self.counters.get(key, (0, 0))
+
+        return count if expires_at > now else 0
+
+    async def increment(self, keys : List[Tuple[str, str]], ttl : int) -> List[Tuple[int, int]]:
+        """Counts one attempt on each (current, previous) window pair, returns their counts after it. Never awaits, so it is atomic on the event loop"""
+
+        now = time.time()
+        counts = []
+
+        for current, previous in keys:
+            count = self.count(current, now) + 1
+
+            self.counters[current] = (now + ttl, count)
+
+            counts.append((count, self.count(previous, now)))
+
+        return counts
+
+
+class RedisCounterBackend:
+
+    name = 'redis'
+
+    def __init__(self, url : str):
+
+        self.client = Redis.from_url(url, decode_responses = True)
+
+    async def increment(self, keys : List[Tuple[str, str]], ttl : int) -> List[Tuple[int, int]]:
+
+        async with self.client.pipeline(transaction = True) as pipeline:  # MULTI, no other client's command runs between the INCR and the reads
+            for current, previous in keys:
+                pipeline.incr(current)
+                pipeline.expire(current, ttl)
+                pipeline.get(previous)
+
+            replies = await pipeline.execute()
+
+        return [(int(replies[index]), int(replies[index + 2] or 0)) for index in range(0, len(replies), 3)]
+
+
+class RateLimiter:
+
+    def __init__(self, backend, window : int = 60):
+
+        self.backend = backend
+        self.window = window
+        self.rejections : Dict[str, int] = {}  # route:kind -> rejected attempts
+        self.errors = 0
+
+    def retry_after(self, previous : int, current : int, elapsed : float, limit : int) -> int:
+        """Seconds until the estimate of a key is at most limit - 1, so one more attempt fits"""
+
+        if current < limit:  # only the tail of the previous window is in the way
+            return math.ceil(self.window * (1 - (limit - 1 - current) / previous) - elapsed)
+
+        return math.ceil(self.window - elapsed + self.window * (1 - (limit - 1) / current))  # the current window has to become the previous one and fade
+
+    async def hit(self, route : str, limits : Dict[str, Tuple[str, int]]) -> None:
+        """
+        Counts one attempt at `route` against `limits`, kind (e.g. 'email') -> (key, allowed
+        attempts per window). Raises RateLimited when any of them is used up, a limit of 0 is off
+        """
+
+        limits = {kind : (key, limit) for kind, (key, limit) in limits.items() if limit > 0 and key}
+
+        if not limits:
+            return
+
+        now = time.time()
+        window = int(now // self.window)
+        elapsed = now - window * self.window
+
+        keys = {kind : (f'bookly:rate:{route}:{kind}:{key}:{window}', f'bookly:rate:{route}:{kind}:{key}:{window - 1}') for kind, (key, limit) in limits.items()}
+
+        try:
+            counts = await self.backend.increment(list(keys.values()), ttl = 2 * self.window)  # kept while it is the previous window
+
+        except (RedisError, OSError) as e:
+            self.errors += 1
+            logging.warning(f'Rate limit count for {route} failed, the attempt is let through: {e}')
+            return
+
+        retry_after = None
+
+        for (kind, (key, limit)), (current, previous) in zip(limits.items(), counts):
+            if previous * (1 - elapsed / self.window) + current > limit:  # this attempt is part of current
+                self.rejections[f'{route}:{kind}'] = self.rejections.get(f'{route}:{kind}', 0) + 1
+
+                retry_after = max(retry_after or 1, self.retry_after(previous, current, elapsed, limit))
+
+        if retry_after is not None:
+            raise RateLimited(retry_after = retry_after)
+
+    def stats(self) -> dict:
+
+        return {
+            'backend' : self.backend.name,
+            'window' : self.window,
+            'rejections' : dict(self.rejections),
+            'errors' : self.errors
+        }
+
+
+def credential_limits(request : Request, email : str) -> dict:
+    """Per email and per client IP limits of an attempt at a credential endpoint"""
+
+    return {
+        'email' : (email.strip().lower(), Config.RATE_LIMIT_PER_EMAIL),
+        'ip' : (request.client.host if request.client else '', Config.RATE_LIMIT_PER_IP)
+    }
+
+
+rate_limiter = RateLimiter(RedisCounterBackend(Config.REDIS_URL) if Config.REDIS_URL else MemoryCounterBackend(), Config.RATE_LIMIT_WINDOW)
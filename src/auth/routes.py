@@ -1,19 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, responses
+from fastapi import APIRouter, Depends, HTTPException, Request, status, BackgroundTasks, responses
 from fastapi.responses import JSONResponse
 
-from .structs import UserCreateModel, UserResponse, UserLoginModel, UserBooks, EmailRequest, PasswordResetRequest, PasswordConfirmRequest
+from .structs import UserCreateModel, UserResponse, UserLoginModel, UserBooks, EmailRequest, PasswordResetRequest, PasswordConfirmRequest, LogoutRequest
 from .services import UserService
-from .utils import create_access_token, decode_token,verify_password, create_url_safe_token, decode_url_safe_token, generate_hash_password
+from .utils import create_access_token, decode_token, create_url_safe_token, decode_url_safe_token, password_needs_update
+from .password_pool import password_pool
+from .token_cache import token_cache
+from .blocklist import token_blocklist
+from .rate_limit import rate_limiter, credential_limits
 from .dependencies import AccessTokenBearer, RefreshTokenBearer, RoleChecker, get_current_user
 
 from datetime import timedelta, datetime
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.db.main import get_session
-from src.errors import (UserAlreadyExists, UserNotFound, InvalidCredentials, InvalidToken)
-from src.mail import create_message, mail
+from src.errors import (UserNotFound, InvalidCredentials, InvalidToken)
+from src.mail import create_message, create_messages
+from src.mail_queue import queue_mail
 from src.config import Config
-from typing import Any
+from src.fields import FieldSelector, dump_fields
+from typing import Any, FrozenSet, Optional
 
 auth_router = APIRouter()
 user_service = UserService()  # Create an instance of UserService for handling user operations
@@ -28,15 +34,13 @@ async def send_mail(emails : EmailRequest, background_tasks : BackgroundTasks):
     
     emails = emails.addresses
 
-    html = '<h1>Welcome To The App</h1>'
-
-    message = create_message(
-        receipients = emails,
+    messages = create_messages(  # one message per address, the recipients do not see each other
         subject = 'Account Created Successfully',
-        body = html
+        template_name = 'welcome.html',
+        messages = [([email], {'email' : email}) for email in emails]
     )
 
-    background_tasks.add_task(mail.send_message, message)
+    await queue_mail(background_tasks, *messages)  # one task, sent over one SMTP connection
 
     return JSONResponse(
         content = {'message' : 'Email Sent Successfully'},
@@ -79,73 +83,37 @@ async def send_mail(emails : EmailRequest, background_tasks : BackgroundTasks):
                     "message": "Not Authorized"
                 }
             }
+        }},
+    429 : {
+        "description": "Too Many Attempts, see the Retry-After header",
+        "content": {
+            "application/json": {
+                "example": {
+                    "message": "Too many attempts"
+                }
+            }
         }}
 })
-async def create_user(user_data: UserCreateModel, background_tasks : BackgroundTasks,session: AsyncSession = Depends(get_session)):
+async def create_user(user_data: UserCreateModel, background_tasks : BackgroundTasks, request : Request, session: AsyncSession = Depends(get_session)):
     
     email = user_data.email 
 
-    user_exists = await user_service.user_exists(email, session)  # Check if the user already exists in the database
+    await rate_limiter.hit('signup', credential_limits(request, email))  # before any query or password hash
 
-    if user_exists:
-        raise UserAlreadyExists()
-    
-    new_user = await user_service.create_user(user_data,session)
+    new_user = await user_service.create_user(user_data,session)  # raises UserAlreadyExists when the email is taken, checked by the insert itself
 
     token = create_url_safe_token({"email" : email})
 
     link = f"http://{Config.DOMAIN}/api/v1/auth/verify/{token}"
 
-    html_message = f"""
-    <table width="100%" cellpadding="0" cellspacing="0" style="background-color: #f6f9fc; padding: 40px 0;">
-      <tr>
-        <td align="center">
-          <table width="600" cellpadding="0" cellspacing="0" style="background-color: #ffffff; border-radius: 8px; padding: 40px; box-shadow: 0 2px 8px rgba(0,0,0,0.1);">
-            <tr>
-              <td align="center" style="padding-bottom: 20px;">
-                <img src="https://static.vecteezy.com/system/resources/previews/020/336/484/non_2x/tesla-logo-tesla-icon-transparent-png-free-vector.jpg" alt="Train Grains Logo" width="150" style="display: block;" />
-              </td>
-            </tr>
-            <tr>
-              <td style="font-size: 20px; color: #333333; font-weight: bold; text-align: center;">
-                Verify Your Email
-              </td>
-            </tr>
-            <tr>
-              <td style="font-size: 16px; color: #555555; line-height: 1.6; padding: 20px 0; text-align: center;">
-                Hi there,<br />
-                Thank you for signing up. Please confirm your email address to activate your account.
-              </td>
-            </tr>
-            <tr>
-              <td align="center" style="padding: 20px;">
-                <a href="{link}" style="background-color: #007BFF; color: #ffffff; padding: 14px 24px; text-decoration: none; border-radius: 5px; display: inline-block;">
-                  Confirm Email
-                </a>
-              </td>
-            </tr>
-            <tr>
-              <td style="font-size: 14px; color: #999999; text-align: center; padding-top: 30px;">
-                If you did not sign up for this account, you can safely ignore this email.
-              </td>
-            </tr>
-            <tr>
-              <td style="font-size: 12px; color: #cccccc; text-align: center; padding-top: 20px;">
-                © {datetime.now().year} Train Grains, All rights reserved.
-              </td>
-            </tr>
-          </table>
-        </td>
-      </tr>
-    </table>
-    """
     message = create_message(
         receipients = [email],
         subject = 'Verify Your Account',
-        body = html_message
+        template_name = 'verify_email.html',
+        template_body = {'link' : link}
     )
 
-    background_tasks.add_task(mail.send_message, message)
+    await queue_mail(background_tasks, message)
 
     return {
             'message' : 'Account Created Successfully! Check your email to verify your account',
@@ -237,14 +205,19 @@ async def verify_account(token: str, session: AsyncSession = Depends(get_session
         'message' : "Email Doesn't Exists"}}}},
       403:{'description' : 'Forbidden Access', 'content':{'application/json' : {'example' : 
       {
-        'message' : "Login Failed, Forbidden Access"}}}}
+        'message' : "Login Failed, Forbidden Access"}}}},
+      429:{'description' : 'Too Many Attempts, see the Retry-After header', 'content':{'application/json' : {'example' : 
+      {
+        'message' : "Too many attempts"}}}}
     }
   )
-async def login_user(login_data:UserLoginModel, session: AsyncSession = Depends(get_session)):
+async def login_user(login_data:UserLoginModel, request : Request, background_tasks : BackgroundTasks, session: AsyncSession = Depends(get_session)):
     
     email = login_data.email
     password = login_data.password
 
+    await rate_limiter.hit('login', credential_limits(request, email))  # before the user lookup and bcrypt
+
     try:
     
       user = await user_service.get_user_by_email(email,session)
@@ -256,9 +229,12 @@ async def login_user(login_data:UserLoginModel, session: AsyncSession = Depends(
         )
 
     if user is not None:
-        password_valid = verify_password(password, user.password)
+        password_valid = await password_pool.verify(password, user.password)  # bcrypt runs on the password pool, not the event loop
 
         if password_valid:
+            if password_needs_update(user.password):  # hashed with another BCRYPT_ROUNDS, rehashed once the response is sent
+                background_tasks.add_task(user_service.rehash_password, user.id, password, user.password)
+
             access_token = create_access_token(
                 user_data = {
                     'email': user.email,
@@ -313,14 +289,46 @@ async def access_token(token_details:dict = Depends(RefreshTokenBearer())):
     raise InvalidToken()
 
 
+# POST /auth/logout
+@auth_router.post('/logout', status_code = status.HTTP_200_OK, responses = {200:{'description' : 'Logged Out', 'content' : {'application/json' : {'example' : {'message' : 'Logged out successfully'}}}},401:{'description' : 'Revoked Token', 'content' : {'application/json' : {'example' : {'message' : 'Token is either expired or has been revoked'}}}},403:{'description' : 'Forbidden Access', 'content' : {'application/json' : {'example' : {'message' : 'Token is invalid or expired'}}}}})
+async def logout(logout_data : Optional[LogoutRequest] = None, token_details : dict = Depends(AccessTokenBearer())):
+
+    """
+    Revokes the access token of the request, and the refresh token of the same user
+    when one is sent, until they would have expired anyway
+    """
+
+    refresh_details = None
+
+    if logout_data is not None and logout_data.refresh_token is not None:
+        refresh_details = token_cache.decode(logout_data.refresh_token)
+
+        if refresh_details is None or not refresh_details.get('refresh') or refresh_details['user'].get('user_id') != token_details['user'].get('user_id'):
+            raise InvalidToken()
+
+    await token_blocklist.revoke(token_details)
+
+    if refresh_details is not None:
+        await token_blocklist.revoke(refresh_details)
+
+    return JSONResponse(content = {'message' : 'Logged out successfully'})
+
 
 # GET /auth/me
-@auth_router.get('/me',response_model=UserBooks,responses = {500:{'description' : 'Internal Server Error', 'content' : {'application/json' : {'example' : {'message' : 'Customized Error Message'}}}},403:{'description' : 'Forbidden Access', 'content' : {'application/json' : {'example' : {'message' : 'Insufficient Permissions'}}}}})
+@auth_router.get('/me',response_model=UserBooks,responses = {500:{'description' : 'Internal Server Error', 'content' : {'application/json' : {'example' : {'message' : 'Customized Error Message'}}}},403:{'description' : 'Forbidden Access', 'content' : {'application/json' : {'example' : {'message' : 'Insufficient Permissions'}}}},400:{'description' : 'Invalid Fields', 'content' : {'application/json' : {'example' : {'message' : 'Unknown field requested in fields'}}}}})
 async def get_current_user(
     user = Depends(get_current_user),
-    _ : bool = Depends(role_checker)):
+    _ : bool = Depends(role_checker),
+    fields : Optional[FrozenSet[str]] = Depends(FieldSelector(UserBooks)),
+    session : AsyncSession = Depends(get_session)):
+
+    if fields is None:
+        return await user_service.get_user_with_books(user.id, session)
+
+    if fields & {'books', 'reviews'}:
+        user = await user_service.get_user_with_books(user.id, session, fields = fields)  # only the requested collections are loaded
 
-    return user
+    return JSONResponse(dump_fields(UserBooks, fields, user))  # without collections the user loaded for the token is enough
 
 
 @auth_router.post('/password-reset' , status_code = status.HTTP_201_CREATED, responses = {
@@ -339,12 +347,22 @@ async def get_current_user(
                     "example":{'message' : "Customized Error Message"}
                   }
                 }
+              },
+    429 : {
+            "description": "Too Many Attempts, see the Retry-After header",
+              "content": {
+                "application/json": {
+                    "example":{'message' : "Too many attempts"}
+                  }
+                }
               }
           })
-async def password_reset_request(email_data : PasswordResetRequest, background_tasks : BackgroundTasks):
+async def password_reset_request(email_data : PasswordResetRequest, background_tasks : BackgroundTasks, request : Request):
     
     email = email_data.email
 
+    await rate_limiter.hit('password-reset', credential_limits(request, email))
+
     try:
         
         token = create_url_safe_token({"email" : email})
@@ -358,59 +376,16 @@ async def password_reset_request(email_data : PasswordResetRequest, background_t
 
     link = f"http://{Config.DOMAIN}/api/v1/auth/password-reset-confirm/{token}"
 
-    html_message = f"""
-    <table width="100%" cellpadding="0" cellspacing="0" style="background-color: #f6f9fc; padding: 40px 0;">
-      <tr>
-        <td align="center">
-          <table width="600" cellpadding="0" cellspacing="0" style="background-color: #ffffff; border-radius: 8px; padding: 40px; box-shadow: 0 2px 8px rgba(0,0,0,0.1);">
-            <tr>
-              <td align="center" style="padding-bottom: 20px;">
-                <img src="https://static.vecteezy.com/system/resources/previews/020/336/484/non_2x/tesla-logo-tesla-icon-transparent-png-free-vector.jpg" alt="Train Grains Logo" width="150" style="display: block;" />
-              </td>
-            </tr>
-            <tr>
-              <td style="font-size: 20px; color: #333333; font-weight: bold; text-align: center;">
-                Reset Your Password
-              </td>
-            </tr>
-            <tr>
-              <td style="font-size: 16px; color: #555555; line-height: 1.6; padding: 20px 0; text-align: center;">
-                Hi there,<br />
-                Thank you for signing up. Please confirm your email address to activate your account.
-              </td>
-            </tr>
-            <tr>
-              <td align="center" style="padding: 20px;">
-                <a href="{link}" style="background-color: #007BFF; color: #ffffff; padding: 14px 24px; text-decoration: none; border-radius: 5px; display: inline-block;">
-                  Confirm Email
-                </a>
-              </td>
-            </tr>
-            <tr>
-              <td style="font-size: 14px; color: #999999; text-align: center; padding-top: 30px;">
-                If you did not sign up for this account, you can safely ignore this email.
-              </td>
-            </tr>
-            <tr>
-              <td style="font-size: 12px; color: #cccccc; text-align: center; padding-top: 20px;">
-                © {datetime.now().year} Train Grains, All rights reserved.
-              </td>
-            </tr>
-          </table>
-        </td>
-      </tr>
-    </table>
-    """
-    
     message = create_message(
         receipients = [email],
         subject = 'Reset Your Password',
-        body = html_message
+        template_name = 'password_reset.html',
+        template_body = {'link' : link}
     )
 
     try:
         
-        background_tasks.add_task(mail.send_message, message)
+        await queue_mail(background_tasks, message)
 
     except Exception as e:
         
@@ -465,7 +440,7 @@ async def reset_password(token : str, password : PasswordConfirmRequest, session
         if not user:
             raise UserNotFound()
         
-        password_hash  = generate_hash_password(new_password)
+        password_hash  = await password_pool.hash(new_password)
 
         await user_service.update_user(user, {'password' : password_hash}, session)
 
@@ -1,9 +1,19 @@
 from src.db.models import User
-from .structs import UserCreateModel
-from .utils import generate_hash_password
+from .structs import UserCreateModel, Principal
+from .password_pool import password_pool
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlmodel import select
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import selectinload
 from fastapi.responses import JSONResponse
+from src.fields import load_fields
+from src.cache import cache, principal_key, invalidate_principal
+from src.config import Config
+from src.db.main import async_session_maker
+from src.errors import PasswordPoolBusy, UserAlreadyExists
+import logging
+from typing import FrozenSet, Optional
 
 
 class UserService:
@@ -24,18 +34,33 @@ class UserService:
         return True if user is not None else False  # Return True if user exists, False otherwise
 
     async def create_user(self, user_data: UserCreateModel, session: AsyncSession) -> User:
-        """Create a new user in the database."""
+        """
+        Create a new user in the database, raises UserAlreadyExists when the email is taken.
+
+        One INSERT ... ON CONFLICT (email) DO NOTHING RETURNING, the unique index on email
+        decides between concurrent signups instead of a check that races with the insert.
+        """
         
         user_data_dict = user_data.model_dump()  # Convert Pydantic model to dictionary
 
-        new_user = User(
-            **user_data_dict  # Unpack the dictionary into the User model
-        )
-        new_user.password = generate_hash_password(user_data_dict['password'])  # Hash the password before saving
+        user_data_dict['password'] = await password_pool.hash(user_data_dict['password'])  # Hash the password before saving, off the event loop
         
-        new_user.role = 'user'
+        user_data_dict['role'] = 'user'
+
+        statement = (
+            pg_insert(User)
+            .values(**user_data_dict)  # id, timestamps and is_verified come from the column defaults
+            .on_conflict_do_nothing(index_elements = [User.email])
+            .returning(User)
+        )
 
-        session.add(new_user)  # Add the new user to the session
+        result = await session.exec(statement)
+
+        new_user = result.scalars().first()
+
+        if new_user is None:  # the email was taken, nothing was inserted
+            await session.rollback()
+            raise UserAlreadyExists()
 
         await session.commit()
 
@@ -56,6 +81,45 @@ class UserService:
             }
         )
 
+    async def get_principal(self, user_id: str, session: AsyncSession) -> Optional[Principal]:
+        """Id, role and verified flag of a user, read through the cache, the User row and its relations are never loaded"""
+
+        cached = await cache.get(principal_key(user_id))
+
+        if cached is not None:
+            return Principal.model_validate_json(cached)
+
+        statement = select(User.id, User.role, User.is_verified).where(User.id == user_id)
+
+        result = await session.exec(statement)
+
+        row = result.first()
+
+        if row is None:
+            return None
+
+        principal = Principal(id = row.id, role = row.role, is_verified = row.is_verified)
+
+        await cache.set(principal_key(user_id), principal.model_dump_json(), ttl = Config.CACHE_PRINCIPAL_TTL)
+
+        return principal
+
+    async def get_user_with_books(self, user_id: str, session: AsyncSession, fields: Optional[FrozenSet[str]] = None):
+        """Fetch a user together with their books and reviews (what UserBooks serializes), with `fields` only the requested columns and collections."""
+
+        options = load_fields(User, fields) if fields is not None else (selectinload(User.books), selectinload(User.reviews))
+
+        statement = (
+            select(User)
+            .where(User.id == user_id)
+            .options(*options)
+            .execution_options(populate_existing = True)  # the user may already be in the session without its relations
+        )
+
+        result = await session.exec(statement)
+
+        return result.first()
+
     async def update_user(self, user : User, user_data : dict, session : AsyncSession):
         
         
@@ -65,5 +129,23 @@ class UserService:
 
         await session.commit()
 
+        await invalidate_principal(user.id)  # a verified flag or role change applies to the next request
+
         return user
 
+    async def rehash_password(self, user_id, password: str, old_hash: str) -> None:
+        """
+        Replaces a hash made with an older cost by one with BCRYPT_ROUNDS. Runs after the login
+        response is sent, in its own session, and keeps a password changed in the meantime
+        """
+
+        try:
+            new_hash = await password_pool.hash(password)
+
+        except PasswordPoolBusy:
+            logging.info(f'Password rehash of user {user_id} skipped, the password pool is busy, the next login retries')
+            return
+
+        async with async_session_maker() as session:
+            await session.exec(update(User).where(User.id == user_id, User.password == old_hash).values(password = new_hash))
+            await session.commit()
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
 import uuid
-from typing import List
+from typing import List, Optional
 from src.db.models import Book  # As Book model is defined in src/books/models.py
 from src.reviews.structs import ReviewResponse
 
@@ -33,10 +33,19 @@ class UserBooks(UserResponse):
     reviews : List[ReviewResponse]
 
 
+class Principal(BaseModel):  # what authorization needs to know about the caller, cached by UserService.get_principal
+    id : uuid.UUID
+    role : str
+    is_verified : bool
+
+
 class UserLoginModel(BaseModel):
     email: str
     password: str
 
+class LogoutRequest(BaseModel):
+    refresh_token : Optional[str] = None  # revoked together with the access token when sent
+
 class EmailRequest(BaseModel):
     addresses : List[str]
 
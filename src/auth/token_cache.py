@@ -0,0 +1,88 @@
+"""
+Process local cache of verified JWT claims.
+
+Clients send the same access token with every request until it expires, so the claims of
+a token whose signature was checked once are kept, keyed by the SHA-256 of the token, and
+dropped at the token's `exp`. The cache only saves the signature check: revocation is
+checked by the caller on every request, cached or not, and discard() evicts a token
+right away (e.g. on logout). At most `max_entries` tokens are kept, least recently used
+first out.
+"""
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+from src.auth.utils import decode_token
+from src.config import Config
+import hashlib
+import time
+
+
+def token_key(token : str) -> str:
+
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenCache:
+
+    def __init__(self, max_entries : int = 10000, decode : Callable[[str], Optional[dict]] = decode_token):
+
+        self.max_entries = max_entries
+        self.decode_token = decode
+        self.entries : 'OrderedDict[str, Tuple[float, dict]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.verifications = 0
+
+    def decode(self, token : str) -> Optional[dict]:
+        """Claims of a valid token, verified at most once while it is cached. None for an invalid or expired token"""
+
+        key = token_key(token)
+
+        entry = self.entries.get(key)
+
+        if entry is not None:
+            expires_at, claims = entry
+
+            if expires_at > time.time():
+                self.hits += 1
+                self.entries.move_to_end(key)
+
+                return claims
+
+            del self.entries[key]  # expired, the decode below rejects it
+
+        self.misses += 1
+        self.verifications += 1
+
+        claims = self.decode_token(token)
+
+        if claims is not None and isinstance(claims.get('exp'), (int, float)) and self.max_entries > 0:  # tokens without exp are verified every time
+            self.entries[key] = (claims['exp'], claims)
+
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last = False)
+
+        return claims
+
+    def discard(self, token : str) -> None:
+
+        self.entries.pop(token_key(token), None)
+
+    def clear(self) -> None:
+
+        self.entries.clear()
+
+    def stats(self) -> dict:
+
+        lookups = self.hits + self.misses
+
+        return {
+            'entries' : len(self.entries),
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'verifications' : self.verifications,
+            'verifications_saved' : self.hits,
+            'hit_ratio' : round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+token_cache = TokenCache(Config.TOKEN_CACHE_SIZE)
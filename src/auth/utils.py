@@ -10,6 +10,7 @@ import logging
 
 passwd_context = CryptContext(
     schemes=["bcrypt"], # Use bcrypt for password hashing algorithm
+    bcrypt__rounds = Config.BCRYPT_ROUNDS  # cost of new hashes, hashes with another cost need an update
 )
 
 
@@ -26,13 +27,18 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return passwd_context.verify(plain_password, hashed_password)
 
 
+def password_needs_update(hashed_password: str) -> bool:
+    """True when the hash was made with another cost than BCRYPT_ROUNDS, the password is rehashed at the next login"""
+    return passwd_context.needs_update(hashed_password)
+
+
 def create_access_token(user_data: dict, expiry: timedelta = None, refresh: bool = False) -> str:
     
     payload = {}
 
     payload['user'] = user_data
     payload['exp'] = datetime.now() + (expiry if expiry is not None else timedelta(seconds=ACCESS_TOKEN_EXPIRY)) #1 hour expiry time by default
-    payload['jti'] = str(uuid.uuid4)  # Generate a unique identifier for the token
+    payload['jti'] = str(uuid.uuid4())  # Generate a unique identifier for the token, logout puts it on the blocklist
     payload['refresh'] = refresh
 
     token = jwt.encode(
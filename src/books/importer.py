@@ -0,0 +1,269 @@
+"""
+Streaming bulk import of books from NDJSON or CSV.
+
+The input is read chunk by chunk, every row is validated against BookCreateModel and
+valid rows are written in batches of IMPORT_BATCH_SIZE, so memory use does not grow
+with the size of the file. A batch the database rejects is split up until the failing
+rows are found, only those are reported. Used by POST /api/v1/books/import and from the command line:
+
+    python -m src.books.importer books.ndjson --user-id <admin user id>
+    python -m src.books.importer books.csv --user-id <admin user id> --format csv
+"""
+from pydantic import ValidationError
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import AsyncIterator, Iterable, Optional
+from datetime import datetime
+from .structs import BookCreateModel
+from .services import BookService
+from src.config import Config
+import argparse
+import asyncio
+import codecs
+import csv
+import json
+import uuid
+
+book_service = BookService()
+
+FORMATS = ('ndjson', 'csv')
+
+
+def detect_format(content_type : Optional[str], filename : Optional[str] = None) -> str:
+
+    if filename and filename.lower().endswith('.csv'):
+        return 'csv'
+
+    if content_type and 'csv' in content_type.lower():
+        return 'csv'
+
+    return 'ndjson'
+
+
+async def iter_lines(chunks : AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Splits a byte stream into text lines without reading it all"""
+
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+
+    pending = ''
+
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+
+        *lines, pending = pending.split('\n')
+
+        for line in lines:
+            yield line.rstrip('\r')
+
+    pending += decoder.decode(b'', final = True)
+
+    if pending:
+        yield pending.rstrip('\r')
+
+
+async def iter_ndjson(lines : AsyncIterator[str]) -> AsyncIterator[tuple]:
+    """Yields (line number, record or None, error or None) for every non blank line"""
+
+    line_number = 0
+
+    async for line in lines:
+        line_number += 1
+
+        if not line.strip():
+            continue
+
+        try:
+            record = json.loads(line)
+
+        except json.JSONDecodeError as e:
+            yield line_number, None, f'invalid JSON: {e.msg}'
+            continue
+
+        if not isinstance(record, dict):
+            yield line_number, None, 'each line must be a JSON object'
+            continue
+
+        yield line_number, record, None
+
+
+async def iter_csv(lines : AsyncIterator[str]) -> AsyncIterator[tuple]:
+    """Same as iter_ndjson for CSV with a header row, quoted fields may span lines"""
+
+    header = None
+    pending = ''
+    line_number = 0
+    start_line = 0
+
+    async for line in lines:
+        line_number += 1
+
+        if not pending:
+            start_line = line_number
+
+        pending = f'{pending}\n{line}' if pending else line
+
+        if pending.count('"') % 2:  # a quoted field continues on the next line
+            continue
+
+        text, pending = pending, ''
+
+        if not text.strip():
+            continue
+
+        try:
+            values = next(csv.reader([text]))
+
+        except csv.Error as e:
+            yield start_line, None, f'invalid CSV: {e}'
+            continue
+
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+
+        if len(values) != len(header):
+            yield start_line, None, f'expected {len(header)} columns, got {len(values)}'
+            continue
+
+        yield start_line, dict(zip(header, values)), None
+
+    if pending:
+        yield start_line, None, 'unterminated quoted field'
+
+
+def to_row(book_data : BookCreateModel, user_id : str, now : datetime) -> dict:
+
+    return {
+        'id' : uuid.uuid4(),
+        'title' : book_data.title,
+        'author' : book_data.author,
+        'published_date' : datetime.strptime(book_data.published_date, "%Y-%m-%d").date(),  # same format create_book accepts
+        'page_count' : book_data.page_count,
+        'language' : book_data.language,
+        'user_id' : uuid.UUID(str(user_id)),
+        'created_at' : now,
+        'updated_at' : now
+    }
+
+
+def format_errors(e : ValidationError) -> str:
+
+    return '; '.join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors())
+
+
+async def import_books(chunks : AsyncIterator[bytes], file_format : str, user_id : str, session : AsyncSession,
+                       batch_size : int = Config.IMPORT_BATCH_SIZE, max_errors : int = Config.IMPORT_MAX_ERRORS) -> dict:
+    """
+    Imports books from a stream of bytes and returns a report with the number of imported
+    and failed rows plus the first `max_errors` row errors
+    """
+
+    if file_format not in FORMATS:
+        raise ValueError(f'format must be one of {FORMATS}')
+
+    records = iter_csv(iter_lines(chunks)) if file_format == 'csv' else iter_ndjson(iter_lines(chunks))
+
+    report = {'imported' : 0, 'failed' : 0, 'errors' : []}
+
+    def fail(line_number : int, message : str):
+
+        report['failed'] += 1
+
+        if len(report['errors']) < max_errors:
+            report['errors'].append({'line' : line_number, 'error' : message})
+
+    batch = []
+    batch_lines = []
+
+    async def write(rows : list, lines : list):
+        """Writes rows as one batch, a rejected batch is halved until only the rows the database rejects are left"""
+
+        try:
+            await book_service.bulk_insert(rows, session)
+            report['imported'] += len(rows)
+
+        except Exception as e:
+            await session.rollback()
+
+            if len(rows) == 1:
+                fail(lines[0], f'rejected by the database: {e}')
+                return
+
+            middle = len(rows) // 2
+
+            await write(rows[:middle], lines[:middle])
+            await write(rows[middle:], lines[middle:])
+
+    async def flush():
+
+        await write(list(batch), list(batch_lines))
+
+        batch.clear()
+        batch_lines.clear()
+
+    async for line_number, record, error in records:
+
+        if error is not None:
+            fail(line_number, error)
+            continue
+
+        try:
+            book_data = BookCreateModel(**record)
+            row = to_row(book_data, user_id, datetime.now())
+
+        except ValidationError as e:
+            fail(line_number, format_errors(e))
+            continue
+
+        except ValueError as e:
+            fail(line_number, f'published_date: {e}')
+            continue
+
+        batch.append(row)
+        batch_lines.append(line_number)
+
+        if len(batch) >= batch_size:
+            await flush()
+
+    if batch:
+        await flush()
+
+    report['truncated_errors'] = report['failed'] > len(report['errors'])
+
+    return report
+
+
+async def read_file(path : str, chunk_size : int = 64 * 1024) -> AsyncIterator[bytes]:
+
+    with open(path, 'rb') as file:
+        while chunk := file.read(chunk_size):
+            yield chunk
+
+
+async def main(argv : Optional[Iterable[str]] = None):
+
+    parser = argparse.ArgumentParser(description = 'Bulk import books from an NDJSON or CSV file')
+    parser.add_argument('path')
+    parser.add_argument('--user-id', required = True, help = 'owner of the imported books')
+    parser.add_argument('--format', choices = FORMATS, default = None, help = 'defaults to the file extension')
+    parser.add_argument('--batch-size', type = int, default = Config.IMPORT_BATCH_SIZE)
+
+    args = parser.parse_args(argv)
+
+    from src.db.main import async_session_maker, engine
+
+    async with async_session_maker() as session:
+        report = await import_books(
+            read_file(args.path),
+            file_format = args.format or detect_format(None, args.path),
+            user_id = args.user_id,
+            session = session,
+            batch_size = args.batch_size
+        )
+
+    await engine.dispose()
+
+    print(json.dumps(report, indent = 2))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,42 +1,76 @@
-from fastapi import APIRouter, status, Depends
+from fastapi import APIRouter, status, Depends, Query, Request, Response, Header
+from fastapi.responses import StreamingResponse, JSONResponse
 from sqlmodel.ext.asyncio.session import AsyncSession
 from fastapi.exceptions import HTTPException
-from typing import List
-from .structs import BookUpdateModel, BookCreateModel, BookResponse, BookDetailResponse
-from src.db.main import get_session
+from typing import FrozenSet, List, Optional
+from .structs import BookUpdateModel, BookCreateModel, BookResponse, BookDetailResponse, BookPage, BookSearchPage, BookFilter, BookBatchResponse
+from src.db.main import get_session, get_read_session
 from src.books.services import BookService
+from src.books.importer import import_books, detect_format, FORMATS
+from src.books.exporter import export_books, MEDIA_TYPES
+from datetime import date
 from src.auth.dependencies import AccessTokenBearer
 from src.auth.dependencies import RoleChecker
-from src.errors import BookNotFound
+from src.errors import BookNotFound, BatchTooLarge
+from src.etags import book_etag, book_page_etag, book_batch_etag, not_modified
+from src.fields import FieldSelector, dump_fields
+from src.config import Config
+from src.fast_json import FastJSONRoute
 
-book_router = APIRouter()
+book_router = APIRouter(route_class = FastJSONRoute)  # FAST_JSON skips response_model validation on these routes
 book_service = BookService() #declared service struct for connection purposes to bring service functions here
 access_token_bearer = AccessTokenBearer()  # Initialize the AccessTokenBearer for token validation
 role_checker = Depends(RoleChecker(['admin','user']))
+admin_checker = Depends(RoleChecker(['admin']))
+book_fields = Depends(FieldSelector(BookResponse))  # ?fields= of the listings
+book_detail_fields = Depends(FieldSelector(BookDetailResponse))
 
 
 #GET /books
-@book_router.get("/", response_model=List[BookResponse],dependencies = [role_checker], responses = {
+@book_router.get("/", response_model=BookPage,dependencies = [role_checker], responses = {
+      304:{'description' : 'Not Modified, the page still matches the ETag sent in If-None-Match'},
       500:{'description' : 'Internal Server Error', 'content':{'application/json' : {'example' : 
       {
         'message' : "Customized Error"}}}},
+      400:{'description' : 'Invalid Cursor or Fields', 'content':{'application/json' : {'example' : 
+      {
+        'message' : "Invalid pagination cursor"}}}},
       403:{'description' : 'Forbidden Access', 'content':{'application/json' : {'example' : 
       {
         'message' : "Token is invalid or expired"}}}}
     })
 async def get_all_books(
-    session: AsyncSession = Depends(get_session),
+    request : Request,
+    response : Response,
+    filters : BookFilter = Depends(),
+    cursor : Optional[str] = None,
+    limit : int = Query(default = Config.PAGE_SIZE_DEFAULT, ge = 1, le = Config.PAGE_SIZE_MAX),
+    fields : Optional[FrozenSet[str]] = book_fields,
+    session: AsyncSession = Depends(get_read_session),
     token_details : dict = Depends(access_token_bearer)
     ):
-    books = await book_service.get_all_books(session)  # Fetch all books using the service layer
-    return books # the list of books will be returned as a JSON response
+    books = await book_service.get_all_books(session, cursor = cursor, limit = limit, filters = filters, fields = fields)  # Fetch one filtered page of books using the service layer
+
+    unchanged = not_modified(request, response, book_page_etag(books))  # 304 without serializing the page when the client has it
+
+    if unchanged is not None:
+        return unchanged
+
+    if fields is not None:
+        return JSONResponse({**books, 'books' : dump_fields(BookResponse, fields, books['books'])}, headers = {'ETag' : response.headers['ETag']})
+
+    return books # the page of books will be returned as a JSON response
 
 
 #GET /books/user/{user_id}
-@book_router.get("/user/{user_id}", response_model=List[BookResponse],dependencies = [role_checker], responses = {
+@book_router.get("/user/{user_id}", response_model=BookPage,dependencies = [role_checker], responses = {
+      304:{'description' : 'Not Modified, the page still matches the ETag sent in If-None-Match'},
       500:{'description' : 'Internal Server Error', 'content':{'application/json' : {'example' : 
       {
         'message' : "Customized Error Message"}}}},
+      400:{'description' : 'Invalid Cursor or Fields', 'content':{'application/json' : {'example' : 
+      {
+        'message' : "Unknown field requested in fields"}}}},
       403:{'description' : 'Forbidden Access', 'content':{'application/json' : {'example' : 
       {
         'message' : "Token is invalid or expired"}}}},    
@@ -46,13 +80,124 @@ async def get_all_books(
     })
 async def get_user_books(
     user_id : str,
-    session: AsyncSession = Depends(get_session),
+    request : Request,
+    response : Response,
+    cursor : Optional[str] = None,
+    limit : int = Query(default = Config.PAGE_SIZE_DEFAULT, ge = 1, le = Config.PAGE_SIZE_MAX),
+    fields : Optional[FrozenSet[str]] = book_fields,
+    session: AsyncSession = Depends(get_read_session),
     token_details : dict = Depends(access_token_bearer),
     ):    
-    books = await book_service.get_user_books(user_id,session)  # Fetch all books using the service layer
+    books = await book_service.get_user_books(user_id,session, cursor = cursor, limit = limit, fields = fields)  # Fetch one page of the user's books using the service layer
+
+    unchanged = not_modified(request, response, book_page_etag(books))
+
+    if unchanged is not None:
+        return unchanged
+
+    if fields is not None:
+        return JSONResponse({**books, 'books' : dump_fields(BookResponse, fields, books['books'])}, headers = {'ETag' : response.headers['ETag']})
+
     return books # the list of books will be returned as a JSON response
 
 
+#GET /books/search
+@book_router.get("/search", response_model=BookSearchPage,dependencies = [role_checker], responses = {
+      500:{'description' : 'Internal Server Error', 'content':{'application/json' : {'example' : 
+      {
+        'message' : "Customized Error Message"}}}},
+      400:{'description' : 'Invalid Cursor or Fields', 'content':{'application/json' : {'example' : 
+      {
+        'message' : "Invalid pagination cursor"}}}},
+      403:{'description' : 'Forbidden Access', 'content':{'application/json' : {'example' : 
+      {
+        'message' : "Token is invalid or expired"}}}}
+    })
+async def search_books(
+    q : str = Query(min_length = 1, max_length = 200),
+    language : Optional[str] = None,
+    cursor : Optional[str] = None,
+    limit : int = Query(default = Config.PAGE_SIZE_DEFAULT, ge = 1, le = Config.PAGE_SIZE_MAX),
+    fields : Optional[FrozenSet[str]] = book_fields,
+    session: AsyncSession = Depends(get_read_session),
+    token_details : dict = Depends(access_token_bearer)
+    ):
+    books = await book_service.search_books(q, session, language = language, cursor = cursor, limit = limit, fields = fields)  # Ranked matches on title and author
+
+    if fields is not None:
+        return JSONResponse({**books, 'books' : dump_fields(BookResponse, fields, books['books'])})
+
+    return books
+
+
+#GET /books/batch
+@book_router.get("/batch", response_model=BookBatchResponse,dependencies = [role_checker], responses = {
+      304:{'description' : 'Not Modified, the batch still matches the ETag sent in If-None-Match'},
+      500:{'description' : 'Internal Server Error', 'content':{'application/json' : {'example' : 
+      {
+        'message' : "Customized Error Message"}}}},
+      400:{'description' : 'Too Many Ids or Invalid Fields', 'content':{'application/json' : {'example' : 
+      {
+        'message' : "Too many ids in one batch"}}}},
+      403:{'description' : 'Forbidden Access', 'content':{'application/json' : {'example' : 
+      {
+        'message' : "Token is invalid or expired"}}}}
+    })
+async def get_book_batch(
+    request : Request,
+    response : Response,
+    ids : str = Query(min_length = 1, description = f'Comma separated book ids, at most {Config.BOOK_BATCH_MAX}'),
+    fields : Optional[FrozenSet[str]] = book_detail_fields,
+    session: AsyncSession = Depends(get_read_session),
+    token_details : dict = Depends(access_token_bearer)
+    ):
+    """Book details of up to BOOK_BATCH_MAX ids in one call, in request order, with the ids that have no book listed in missing"""
+
+    book_ids = [book_id.strip() for book_id in ids.split(',') if book_id.strip()]
+
+    if len(book_ids) > Config.BOOK_BATCH_MAX:
+        raise BatchTooLarge()
+
+    batch = await book_service.get_books_by_ids(book_ids, session, fields = fields)  # one query for the books, one batched load each for reviews and tags
+
+    unchanged = not_modified(request, response, book_batch_etag(batch))
+
+    if unchanged is not None:
+        return unchanged
+
+    if fields is not None:
+        return JSONResponse({**batch, 'books' : dump_fields(BookDetailResponse, fields, batch['books'])}, headers = {'ETag' : response.headers['ETag']})
+
+    return batch
+
+
+#GET /books/export
+@book_router.get("/export", dependencies = [admin_checker], response_class = StreamingResponse, responses = {
+    200:{'description' : 'Book Export', 'content':{
+        'application/x-ndjson' : {'example' : '{"id": "...", "title": "...", "review_count": 3, "tag_count": 1}'},
+        'text/csv' : {'example' : 'id,title,author,published_date,page_count,language,user_id,created_at,updated_at,review_count,tag_count'}}},
+    500:{'description' : 'Internal Server Error', 'content':{'application/json' : {'example' : 
+      {
+        'message' : "Customized Error Message"}}}},
+    403:{'description' : 'Forbidden Access', 'content':{'application/json' : {'example' : 
+      {
+        'message' : "Your account does not have sufficient permissions to perform this action"}}}}
+})
+async def export_book_catalog(
+    format : str = Query(default = 'ndjson', pattern = f"^({'|'.join(FORMATS)})$"),
+    token_details : dict = Depends(access_token_bearer)
+    ):
+    """Streams every book with its review and tag counts, oldest first"""
+
+    filename = f'books-{date.today().isoformat()}.{format}'
+
+    return StreamingResponse(
+        export_books(format),  #opens its own session, the rows are read and sent chunk by chunk
+        media_type = MEDIA_TYPES[format],
+        headers = {'Content-Disposition' : f'attachment; filename="{filename}"'}
+    )
+
+
 #POST /books
 @book_router.post("/", status_code=status.HTTP_201_CREATED, response_model=BookResponse,dependencies = [role_checker], responses = {
     500:{'description' : 'Internal Server Error', 'content':{'application/json' : {'example' : 
@@ -75,12 +220,52 @@ async def post_books(book_data:BookCreateModel,session: AsyncSession = Depends(g
     return new_book
 
 
+#POST /books/import
+@book_router.post("/import", status_code=status.HTTP_200_OK, dependencies = [admin_checker], responses = {
+    200:{'description' : 'Import Report', 'content':{'application/json' : {'example' : 
+      {
+        'imported' : 998, 'failed' : 2, 'truncated_errors' : False,
+        'errors' : [{'line' : 17, 'error' : 'page_count: Input should be a valid integer'}]}}}},
+    500:{'description' : 'Internal Server Error', 'content':{'application/json' : {'example' : 
+      {
+        'message' : "Customized Error Message"}}}},
+    403:{'description' : 'Forbidden Access', 'content':{'application/json' : {'example' : 
+      {
+        'message' : "Your account does not have sufficient permissions to perform this action"}}}}
+})
+async def import_book_file(
+    request : Request,
+    format : Optional[str] = Query(default = None, pattern = f"^({'|'.join(FORMATS)})$"),
+    session: AsyncSession = Depends(get_session),
+    token_details : dict = Depends(access_token_bearer)
+    ):
+    """
+    Streams an NDJSON (one BookCreateModel object per line) or CSV (header row with the
+    BookCreateModel fields) request body into the books table. The format comes from
+    ?format= or the Content-Type header, valid rows are imported even when others fail
+    """
+
+    user_id = token_details.get('user')['user_id']
+
+    report = await import_books(
+        request.stream(),  #the body is consumed chunk by chunk, never held in memory as a whole
+        file_format = format or detect_format(request.headers.get('content-type')),
+        user_id = user_id,
+        session = session
+    )
+
+    return report
+
+
 #GET /books/{id}
 @book_router.get("/{book_id}", status_code = status.HTTP_200_OK, response_model = BookDetailResponse, dependencies = [role_checker], responses = {
-    
+      304:{'description' : 'Not Modified, the book still matches the ETag sent in If-None-Match'},
       500:{'description' : 'Internal Server Error', 'content':{'application/json' : {'example' : 
       {
         'message' : "Customized Error Message"}}}},
+      400:{'description' : 'Invalid Fields', 'content':{'application/json' : {'example' : 
+      {
+        'message' : "Unknown field requested in fields"}}}},
       403:{'description' : 'Forbidden Access', 'content':{'application/json' : {'example' : 
       {
         'message' : "Token is invalid or expired"}}}},    
@@ -88,17 +273,28 @@ async def post_books(book_data:BookCreateModel,session: AsyncSession = Depends(g
       {
         'message' : "Book not found"}}}}
     })
-async def get_book_by_id(book_id:str, session: AsyncSession = Depends(get_session),token_details : dict = Depends(access_token_bearer)):
+async def get_book_by_id(book_id:str, request : Request, response : Response, fields : Optional[FrozenSet[str]] = book_detail_fields, session: AsyncSession = Depends(get_read_session),token_details : dict = Depends(access_token_bearer)):
     
-    book = await book_service.get_book_by_id(book_id,session)
+    book = await book_service.get_book_detail(book_id,session, fields = fields)  # with ?fields= only those columns are read and only the requested collections loaded
 
-    if book:
-        return book # Return the book if found
-    else:
+    if not book:
         raise BookNotFound()
 
+    unchanged = not_modified(request, response, book_etag(book))
+
+    if unchanged is not None:
+        return unchanged
+
+    if fields is not None:
+        return JSONResponse(dump_fields(BookDetailResponse, fields, book), headers = {'ETag' : response.headers['ETag']})
+
+    return book # Return the book if found
+
 #PUT /books/{id}
 @book_router.patch("/{book_id}",response_model=BookResponse,dependencies = [role_checker], responses = {
+      412:{'description' : 'Precondition Failed', 'content':{'application/json' : {'example' : 
+      {
+        'message' : "The resource was changed since it was last fetched"}}}},
       500:{'description' : 'Internal Server Error', 'content':{'application/json' : {'example' : 
       {
         'message' : "Customized Error Message"}}}},
@@ -109,11 +305,12 @@ async def get_book_by_id(book_id:str, session: AsyncSession = Depends(get_sessio
       {
         'message' : "Book not found"}}}}
     })
-async def update_book(book_id:str, book_update_data:BookUpdateModel,session: AsyncSession = Depends(get_session),token_details : dict = Depends(access_token_bearer)) -> dict:
+async def update_book(book_id:str, book_update_data:BookUpdateModel, response : Response, if_match : Optional[str] = Header(default = None), session: AsyncSession = Depends(get_session),token_details : dict = Depends(access_token_bearer)) -> dict:
     
-    updated_book =await book_service.update_book(book_id,book_update_data, session)
+    updated_book =await book_service.update_book(book_id,book_update_data, session, if_match = if_match)  # If-Match makes the update conditional on the ETag the client last saw
     
     if updated_book:
+        response.headers['ETag'] = book_etag(updated_book)
         return updated_book
     else:
         raise BookNotFound()
@@ -123,6 +320,9 @@ async def update_book(book_id:str, book_update_data:BookUpdateModel,session: Asy
 
 #DELETE /books/{id}
 @book_router.delete("/{book_id}",dependencies = [role_checker], responses = {
+      412:{'description' : 'Precondition Failed', 'content':{'application/json' : {'example' : 
+      {
+        'message' : "The resource was changed since it was last fetched"}}}},
       200: {
             "description": "Successful Response",
             "content": {
@@ -143,8 +343,8 @@ async def update_book(book_id:str, book_update_data:BookUpdateModel,session: Asy
       {
         'message' : "Book not found"}}}}
     })
-async def delete_book(book_id:str,session: AsyncSession = Depends(get_session),token_details : dict = Depends(access_token_bearer)):
-    delete_book = await book_service.delete_book(book_id, session)
+async def delete_book(book_id:str, if_match : Optional[str] = Header(default = None), session: AsyncSession = Depends(get_session),token_details : dict = Depends(access_token_bearer)):
+    delete_book = await book_service.delete_book(book_id, session, if_match = if_match)
 
     if delete_book is None:
         raise BookNotFound()
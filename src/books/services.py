@@ -1,27 +1,186 @@
 from sqlmodel.ext.asyncio.session import AsyncSession
-from .structs import BookCreateModel, BookUpdateModel
-from src.db.models import Book
-from sqlmodel import select, desc
+from .structs import BookCreateModel, BookUpdateModel, BookDetailResponse, BookFilter
+from src.db.models import Book, Review, BookTags, Tag
+from src.pagination import keyset_paginate, keyset_page
+from src.cache import cache, book_detail_key, book_generation_key, book_generation_ttl, invalidate_book_detail
+from src.db.main import is_replica_session
+from src.etags import if_match_versions
+from src.errors import PreconditionFailed
+from src.fields import load_fields
+from src.config import Config
+from sqlmodel import select
+from sqlalchemy import func, insert, update, delete, any_, bindparam, REAL
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 from datetime import datetime
+from typing import AsyncIterator, FrozenSet, List, Optional
+import time
+import uuid
+
+BOOK_PAGE_ORDER = (Book.created_at, Book.id)  # newest first, id breaks ties between equal timestamps
+BOOK_SORTS = {  # keyset order and direction of each sort of the book listing, every one is backed by an index
+    'newest' : (BOOK_PAGE_ORDER, True),
+    'oldest' : (BOOK_PAGE_ORDER, False),
+    'rating' : ((Book.rating_avg, Book.id), True),
+    'published' : ((Book.published_date, Book.id), True),
+}
+BOOK_DETAIL_LOAD = (selectinload(Book.reviews), selectinload(Book.tags))  # relations BookDetailResponse serializes
+SEARCH_VECTOR = Book.__table__.c.search_vector  # generated tsvector over title and author, GIN indexed
+BULK_INSERT_COLUMNS = ('id', 'title', 'author', 'published_date', 'page_count', 'language', 'user_id', 'created_at', 'updated_at')
+
+def book_fields(fields: Optional[FrozenSet[str]], order = ()) -> tuple:
+    """Loader options of a sparse book read, ETags need id and version and the next cursor the sort columns"""
+
+    return load_fields(Book, fields, always = ('id', 'version', *[column.key for column in order]))
+
+def filter_books(statement, filters: BookFilter):
+    """
+    Adds the WHERE clauses of a BookFilter. Columns are compared bare (no functions or casts around them)
+    so the composite indexes starting with author, language or published_date can serve them
+    """
+
+    if filters.author is not None:
+        statement = statement.where(Book.author == filters.author)
+
+    if filters.language is not None:
+        statement = statement.where(Book.language == filters.language)
+
+    if filters.published_from is not None:
+        statement = statement.where(Book.published_date >= filters.published_from)
+
+    if filters.published_to is not None:
+        statement = statement.where(Book.published_date <= filters.published_to)
+
+    if filters.min_page_count is not None:
+        statement = statement.where(Book.page_count >= filters.min_page_count)
+
+    if filters.tag is not None:  #semi join through booktags, a book with the tag is returned once
+        tagged = select(BookTags.book_id).join(Tag, Tag.id == BookTags.tag_id).where(BookTags.book_id == Book.id, Tag.name == filters.tag)
+
+        statement = statement.where(tagged.exists())
+
+    return statement
+
+
+def parse_book_id(book_id: str) -> Optional[uuid.UUID]:
+    """uuid of a book id sent by a client, None when it is malformed and so can not match any book"""
+
+    try:
+        return uuid.UUID(book_id)
+    except ValueError:
+        return None
+
 
 class BookService:
-    async def get_all_books(self, session: AsyncSession): #this session is an obj used for interaction with db
-        statement = select(Book).order_by(desc(Book.created_at))  #this is the ORM use in python where SQLMODEL allows sql in form of python code
+    async def get_all_books(self, session: AsyncSession, cursor: Optional[str] = None, limit: int = 20, filters: Optional[BookFilter] = None, fields: Optional[FrozenSet[str]] = None): #this session is an obj used for interaction with db
+        filters = filters or BookFilter()
+
+        order, descending = BOOK_SORTS[filters.sort]
+
+        statement = select(Book).options(*book_fields(fields, order))  #with ?fields= only those columns are read
+
+        statement = keyset_paginate(filter_books(statement, filters), order, cursor, limit, descending = descending, scope = filters.sort)  #this is the ORM use in python where SQLMODEL allows sql in form of python code
         
         result = await session.exec(statement)  #exec is used to execute the statement in db
 
-        return result.all()
+        books, next_cursor = keyset_page(result.all(), order, limit, scope = filters.sort)
+
+        return {'books' : books, 'next_cursor' : next_cursor}
     
 
-    async def get_user_books(self, user_id: str, session: AsyncSession):
-        statement = select(Book).where(Book.user_id == user_id).order_by(desc(Book.created_at))  #this is the ORM use in python where SQLMODEL allows sql in form of python code
+    async def get_user_books(self, user_id: str, session: AsyncSession, cursor: Optional[str] = None, limit: int = 20, fields: Optional[FrozenSet[str]] = None):
+        statement = select(Book).where(Book.user_id == user_id).options(*book_fields(fields, BOOK_PAGE_ORDER))
+
+        statement = keyset_paginate(statement, BOOK_PAGE_ORDER, cursor, limit)  #this is the ORM use in python where SQLMODEL allows sql in form of python code
         
         result = await session.exec(statement)  #exec is used to execute the statement in db
 
-        return result.all()
+        books, next_cursor = keyset_page(result.all(), BOOK_PAGE_ORDER, limit)
+
+        return {'books' : books, 'next_cursor' : next_cursor}
     
-    async def get_book_by_id(self, book_id:str, session: AsyncSession):
-        statement = select(Book).where(Book.id == book_id)
+    async def search_books(self, query: str, session: AsyncSession, language: Optional[str] = None, cursor: Optional[str] = None, limit: int = 20, fields: Optional[FrozenSet[str]] = None):
+        ts_query = func.websearch_to_tsquery('simple', query)  #accepts user input as typed: words, "quoted phrases", or, -not
+
+        rank = func.ts_rank(SEARCH_VECTOR, ts_query, type_ = REAL)
+
+        order = (rank, Book.id)  #best match first, id breaks ties
+
+        statement = select(Book, rank).where(SEARCH_VECTOR.bool_op('@@')(ts_query)).options(*book_fields(fields))
+
+        if language is not None:
+            statement = statement.where(Book.language == language)
+
+        statement = keyset_paginate(statement, order, cursor, limit)
+
+        started = time.perf_counter()
+
+        result = await session.exec(statement)
+
+        rows = result.all()
+
+        took_ms = (time.perf_counter() - started) * 1000
+
+        rows, next_cursor = keyset_page(rows, order, limit, sort_key = lambda row: [row[1], row[0].id])
+
+        return {'books' : [book for book, _ in rows], 'next_cursor' : next_cursor, 'took_ms' : round(took_ms, 3)}
+
+    async def bump_versions(self, book_ids: list, session: AsyncSession) -> dict:
+        """
+        Changes the ETag of books whose reviews or tags changed, committed with the caller's write.
+        The increment happens in SQL so concurrent writers never hand out the same version
+        """
+
+        if not book_ids:
+            return {}
+
+        statement = update(Book).where(Book.id.in_(book_ids)).values(version = Book.version + 1).returning(Book.id, Book.version)
+
+        result = await session.exec(statement.execution_options(synchronize_session = False))
+
+        return {book_id: version for book_id, version in result.all()}
+
+    async def record_review(self, book_id: str, rating: int, session: AsyncSession, removed: bool = False):
+        """
+        Adds one review to the book's rating aggregates, or takes it away with removed=True.
+        A single UPDATE relative to the stored values, so concurrent reviews never lose a count
+        """
+
+        sign = -1 if removed else 1
+
+        statement = update(Book).where(Book.id == book_id).values(
+            review_count = Book.review_count + sign,
+            rating_sum = Book.rating_sum + sign * rating,
+            version = Book.version + 1
+        )
+
+        await session.exec(statement.execution_options(synchronize_session = False))
+
+    async def bump_version(self, book: Book, session: AsyncSession):
+        versions = await self.bump_versions([book.id], session)
+
+        set_committed_value(book, 'version', versions[book.id])  #the loaded book shows the new version without another SELECT
+
+    async def stream_books_with_counts(self, session: AsyncSession, chunk_size: int = 1000) -> AsyncIterator[list]:
+        """Yields every book with its review and tag counts in chunks of rows read through a server side cursor"""
+
+        review_count = select(func.count()).where(Review.book_id == Book.id).scalar_subquery()  #index only lookups per book, rows stream out without a big aggregate first
+        tag_count = select(func.count()).where(BookTags.book_id == Book.id).scalar_subquery()
+
+        statement = select(
+            Book.id, Book.title, Book.author, Book.published_date, Book.page_count, Book.language,
+            Book.user_id, Book.created_at, Book.updated_at,
+            review_count.label('review_count'), tag_count.label('tag_count')
+        ).order_by(*BOOK_PAGE_ORDER).execution_options(yield_per = chunk_size)  #fetch chunk_size rows per round trip instead of the whole result
+
+        result = await session.stream(statement)
+
+        async for rows in result.partitions():
+            yield rows
+
+    async def get_book_by_id(self, book_id:str, session: AsyncSession, options = ()):
+        statement = select(Book).where(Book.id == book_id).options(*options)  #options are loader options for the relations the caller needs
 
         result = await session.exec(statement)
 
@@ -29,6 +188,43 @@ class BookService:
 
         return book if book is not None else None  #if book is not found then return None
 
+    async def get_books_by_ids(self, book_ids: List[str], session: AsyncSession, fields: Optional[FrozenSet[str]] = None):
+        requested = [(book_id, parse_book_id(book_id)) for book_id in book_ids]
+
+        ids = bindparam('book_ids', list({parsed for _, parsed in requested if parsed is not None}), type_ = ARRAY(Book.__table__.c.id.type))  #one array parameter, the statement is the same for any number of ids
+
+        statement = select(Book).where(Book.id == any_(ids)).options(*(BOOK_DETAIL_LOAD if fields is None else book_fields(fields)))
+
+        result = await session.exec(statement)
+
+        found = {book.id : book for book in result.all()}
+
+        return {  #both in request order, a repeated id is listed once
+            'books' : list({parsed : found[parsed] for _, parsed in requested if parsed in found}.values()),
+            'missing' : list(dict.fromkeys(book_id for book_id, parsed in requested if parsed not in found))
+        }
+
+    async def get_book_detail(self, book_id:str, session: AsyncSession, fields: Optional[FrozenSet[str]] = None):
+        cached, generation = await cache.get_current(book_detail_key(book_id), book_generation_key(book_id), ttl = book_generation_ttl())  #read through, writes to the book, its reviews or tags start a new generation
+
+        if cached is not None:
+            return BookDetailResponse.model_validate_json(cached)
+
+        if fields is not None:  #a partial book is returned as loaded and never cached, the next full read fills the cache
+            return await self.get_book_by_id(book_id, session, options = book_fields(fields))
+
+        book = await self.get_book_by_id(book_id, session, options = BOOK_DETAIL_LOAD)
+
+        if book is None:
+            return None
+
+        detail = BookDetailResponse.model_validate(book, from_attributes = True)
+
+        if generation is not None and not is_replica_session(session):  #a lagging replica could re-cache the row a write just invalidated, for the whole TTL
+            await cache.set_current(book_detail_key(book_id), generation, detail.model_dump_json(), ttl = Config.CACHE_BOOK_DETAIL_TTL)  #a write committed since the read started the next generation, this entry is never served
+
+        return detail
+
     async def create_book(self, book_data: BookCreateModel, user_id: str, session: AsyncSession):
         book_data_dict = book_data.model_dump()  # Convert Pydantic model to dictionary
 
@@ -46,32 +242,79 @@ class BookService:
 
         return new_book
 
-    async def update_book(self, book_id: str, update_data: BookUpdateModel, session: AsyncSession):
-        book_to_update = await self.get_book_by_id(book_id, session)
+    async def bulk_insert(self, rows: List[dict], session: AsyncSession):
+        """Writes already validated book rows (keys of BULK_INSERT_COLUMNS) and commits them as one batch"""
+
+        connection = await session.connection()
 
-        if book_to_update is not None:
-            book_update_dict = update_data.model_dump()
+        raw_connection = await connection.get_raw_connection()
 
-            for key, values in book_update_dict.items(): #this gets both key and value of the dict
-                setattr(book_to_update, key, values) #this sets the value of every key to the value provided in the update_body
-            
-            await session.commit()  # Commit the changes to the database
+        driver_connection = raw_connection.driver_connection
 
-            return book_to_update
+        if hasattr(driver_connection, 'copy_records_to_table'):  #asyncpg, COPY skips per row parsing and planning
+            await driver_connection.copy_records_to_table(
+                Book.__tablename__,
+                records = [tuple(row[column] for column in BULK_INSERT_COLUMNS) for row in rows],
+                columns = BULK_INSERT_COLUMNS
+            )
         else:
-            print(f"Book with ID {book_id} not found.")  # If book is not found, return None or handle as needed
+            await session.exec(insert(Book.__table__), params = rows)  #one multi row INSERT for other drivers
+
+        await session.commit()
+
+    async def update_book(self, book_id: str, update_data: BookUpdateModel, session: AsyncSession, if_match: Optional[str] = None):
+        statement = update(Book).where(Book.id == book_id).values(
+            **update_data.model_dump(exclude_unset = True, exclude_none = True),  #only the fields the client sent, every column is NOT NULL
+            version = Book.version + 1,
+            updated_at = datetime.now()
+        ).returning(Book)  #one round trip writes the row and hands it back, no load before the write
+
+        versions = if_match_versions(if_match, book_id)
+
+        if versions is not None:
+            statement = statement.where(Book.version.in_(versions))  #the ETag check is part of the write, so it can not race
+
+        result = await session.exec(statement)
+
+        updated_book = result.scalars().first()
+
+        if updated_book is None:
+            await self.raise_if_exists(book_id, versions, session)
+
             return None
-        
 
-    async def delete_book(self, book_id: str, session: AsyncSession):
-        book_to_delete = await self.get_book_by_id(book_id, session)
+        await session.commit()  # Commit the changes to the database
 
-        if book_to_delete is not None:
-            await session.delete(book_to_delete)
-            
-            await session.commit()
+        await invalidate_book_detail(book_id)
 
-            return {}
+        return updated_book
+
+    async def delete_book(self, book_id: str, session: AsyncSession, if_match: Optional[str] = None):
+        statement = delete(Book).where(Book.id == book_id).returning(Book.id)  #reviews and tag links go with it through ON DELETE CASCADE
+
+        versions = if_match_versions(if_match, book_id)
+
+        if versions is not None:
+            statement = statement.where(Book.version.in_(versions))
+
+        result = await session.exec(statement)
+
+        if result.first() is None:
+            await self.raise_if_exists(book_id, versions, session)
 
-        else:
             return None  # If book is not found, return None or handle as needed
+
+        await session.commit()
+
+        await invalidate_book_detail(book_id)
+
+        return {}
+
+    async def raise_if_exists(self, book_id: str, versions: Optional[list], session: AsyncSession):
+        """A conditional write that touched no row either missed the book or its version"""
+
+        if versions is not None:
+            exists = await session.exec(select(Book.id).where(Book.id == book_id))
+
+            if exists.first() is not None:
+                raise PreconditionFailed()
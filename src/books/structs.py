@@ -1,7 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import uuid 
 from datetime import datetime, date
-from typing import List
+from typing import List, Literal, Optional
 from src.reviews.structs import ReviewResponse 
 from src.tags.structs import TagResponse
 
@@ -12,15 +12,32 @@ class BookResponse(BaseModel):
     published_date: date  # all fields data must match the type defined in the model
     page_count: int
     language: str
+    version: int  # changes whenever the book, its reviews or its tags change
+    review_count: int
+    rating_avg: float  # 0 while review_count is 0
     created_at: datetime
     updated_at: datetime
 
 
+class BookPage(BaseModel):
+    books : List[BookResponse]
+    next_cursor : Optional[str] = None  # pass it back as ?cursor= to get the next page, null on the last page
+
+
+class BookSearchPage(BookPage):
+    took_ms : float  # time the search query took in the database, in milliseconds
+
+
 class BookDetailResponse(BookResponse):
     reviews: List[ReviewResponse]
     tags : List[TagResponse]
 
 
+class BookBatchResponse(BaseModel):
+    books : List[BookDetailResponse]  # in the order the ids were requested
+    missing : List[str]  # requested ids with no book, as they were sent
+
+
 class BookCreateModel(BaseModel):
     title:str
     author:str
@@ -28,8 +45,18 @@ class BookCreateModel(BaseModel):
     language:str
     published_date:str
 
-class BookUpdateModel(BaseModel):
-    title:str
-    author:str
-    page_count:int
-    language:str
+class BookUpdateModel(BaseModel):  # partial update, only the fields sent are written
+    title:Optional[str] = None
+    author:Optional[str] = None
+    page_count:Optional[int] = None
+    language:Optional[str] = None
+
+
+class BookFilter(BaseModel):  # query parameters of GET /books, every filter is optional and they combine with AND
+    author : Optional[str] = None  # exact match
+    language : Optional[str] = None
+    published_from : Optional[date] = None  # inclusive range on published_date, an inverted range matches nothing
+    published_to : Optional[date] = None
+    min_page_count : Optional[int] = Field(default = None, ge = 0)
+    tag : Optional[str] = None  # tag name
+    sort : Literal['newest', 'oldest', 'rating', 'published'] = 'newest'  # a cursor only continues the sort it was issued for
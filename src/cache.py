@@ -0,0 +1,270 @@
+"""
+Read-through cache for serialized responses.
+
+Redis is used when REDIS_URL is set, otherwise entries live in the memory of the worker
+process (tests and single worker setups). A cache failure never fails a request, a
+broken Redis only turns every lookup into a miss.
+"""
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from typing import Dict, List, Optional, Tuple
+from src.config import Config
+import logging
+import time
+import uuid
+
+
+class MemoryBackend:
+    """Process local backend, the oldest entries are dropped beyond `max_entries`"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries : int = 10000):
+
+        self.max_entries = max_entries
+        self.entries : Dict[str, Tuple[float, str]] = {}
+
+    async def get(self, key : str) -> Optional[str]:
+
+        entry = self.entries.get(key)
+
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+
+        if expires_at <= time.monotonic():
+            self.entries.pop(key, None)
+            return None
+
+        return value
+
+    async def set(self, key : str, value : str, ttl : int) -> None:
+
+        self.entries.pop(key, None)
+
+        if len(self.entries) >= self.max_entries:
+            self.entries.pop(next(iter(self.entries)))  # dicts keep insertion order, so this is the oldest entry
+
+        self.entries[key] = (time.monotonic() + ttl, value)
+
+    async def delete(self, *keys : str) -> None:
+
+        for key in keys:
+            self.entries.pop(key, None)
+
+    async def get_many(self, keys : List[str]) -> List[Optional[str]]:
+
+        return [await self.get(key) for key in keys]
+
+    async def add(self, key : str, value : str, ttl : int) -> bool:
+        """Sets `key` only when it is missing, True when it was set"""
+
+        if await self.get(key) is not None:
+            return False
+
+        await self.set(key, value, ttl)
+
+        return True
+
+    async def set_many(self, values : Dict[str, str], ttl : int) -> None:
+
+        for key, value in values.items():
+            await self.set(key, value, ttl)
+
+
+class RedisBackend:
+
+    name = 'redis'
+
+    def __init__(self, url : str):
+
+        self.client = Redis.from_url(url, decode_responses = True)
+
+    async def get(self, key : str) -> Optional[str]:
+
+        return await self.client.get(key)
+
+    async def set(self, key : str, value : str, ttl : int) -> None:
+
+        await self.client.set(key, value, ex = ttl)
+
+    async def delete(self, *keys : str) -> None:
+
+        await self.client.delete(*keys)
+
+    async def get_many(self, keys : List[str]) -> List[Optional[str]]:
+
+        return await self.client.mget(keys)
+
+    async def add(self, key : str, value : str, ttl : int) -> bool:
+
+        return bool(await self.client.set(key, value, ex = ttl, nx = True))
+
+    async def set_many(self, values : Dict[str, str], ttl : int) -> None:
+
+        async with self.client.pipeline(transaction = False) as pipeline:
+            for key, value in values.items():
+                pipeline.set(key, value, ex = ttl)
+
+            await pipeline.execute()
+
+
+class Cache:
+    """Counts hits and misses of a backend and turns backend errors into misses"""
+
+    def __init__(self, backend):
+
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def get(self, key : str) -> Optional[str]:
+
+        try:
+            value = await self.backend.get(key)
+
+        except (RedisError, OSError) as e:
+            self.errors += 1
+            logging.warning(f'Cache get of {key} failed: {e}')
+            value = None
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return value
+
+    async def set(self, key : str, value : str, ttl : int) -> None:
+
+        try:
+            await self.backend.set(key, value, ttl)
+
+        except (RedisError, OSError) as e:
+            self.errors += 1
+            logging.warning(f'Cache set of {key} failed: {e}')
+
+    async def delete(self, *keys : str) -> None:
+
+        if not keys:
+            return
+
+        try:
+            await self.backend.delete(*keys)
+
+        except (RedisError, OSError) as e:
+            self.errors += 1
+            logging.warning(f'Cache delete of {keys} failed, entries expire after their TTL: {e}')
+
+    async def get_current(self, key : str, generation_key : str, ttl : int) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Value of `key` if it was set in the current generation of `generation_key`, and that generation
+        for set_current. A generation (living `ttl` seconds) is started when there is none, (None, None)
+        when the backend fails
+        """
+
+        try:
+            generation, entry = await self.backend.get_many([generation_key, key])
+
+            if generation is None:
+                await self.backend.add(generation_key, uuid.uuid4().hex, ttl)
+
+                generation = await self.backend.get(generation_key)  # ours, or the one another reader started first
+
+        except (RedisError, OSError) as e:
+            self.errors += 1
+            self.misses += 1
+            logging.warning(f'Cache get of {key} failed: {e}')
+            return None, None
+
+        value = None
+
+        if entry is not None and generation is not None:
+            entry_generation, _, entry_value = entry.partition(':')
+
+            value = entry_value if entry_generation == generation else None  # set before the last new_generation, by a read that may have raced a write
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return value, generation
+
+    async def set_current(self, key : str, generation : str, value : str, ttl : int) -> None:
+
+        await self.set(key, f'{generation}:{value}', ttl)
+
+    async def new_generation(self, *generation_keys : str, ttl : int) -> None:
+        """Starts a new generation of each key, values set in an earlier one are never returned again"""
+
+        if not generation_keys:
+            return
+
+        try:
+            await self.backend.set_many({key : uuid.uuid4().hex for key in generation_keys}, ttl)
+
+        except (RedisError, OSError) as e:
+            self.errors += 1
+            logging.warning(f'Cache generation of {generation_keys} failed, entries expire after their TTL: {e}')
+
+    def stats(self) -> dict:
+
+        lookups = self.hits + self.misses
+
+        return {
+            'backend' : self.backend.name,
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'errors' : self.errors,
+            'hit_ratio' : round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+def canonical_book_id(book_id) -> str:
+    """A uuid in any spelling (upper case, no hyphens) gives the same keys as the one its writes invalidate"""
+
+    try:
+        return str(uuid.UUID(str(book_id)))
+    except ValueError:
+        return str(book_id)  # a malformed id matches no book, so nothing is ever cached under it
+
+
+def book_detail_key(book_id) -> str:
+
+    return f'bookly:book:{canonical_book_id(book_id)}:detail'
+
+
+def book_generation_key(book_id) -> str:
+
+    return f'bookly:book:{canonical_book_id(book_id)}:generation'
+
+
+def book_generation_ttl() -> int:
+
+    return 2 * Config.CACHE_BOOK_DETAIL_TTL  # outlives the entries tagged with it
+
+
+async def invalidate_book_detail(*book_ids) -> None:
+    """
+    Starts a new generation of the cached detail of the given books, called after the write is committed.
+    A detail read before the write and cached after this is tagged with the old generation and never served
+    """
+
+    await cache.new_generation(*[book_generation_key(book_id) for book_id in book_ids], ttl = book_generation_ttl())
+
+
+def principal_key(user_id) -> str:
+
+    return f'bookly:user:{user_id}:principal'
+
+
+async def invalidate_principal(*user_ids) -> None:
+    """Drops the cached principal of the given users, called after a change to the user is committed"""
+
+    await cache.delete(*[principal_key(user_id) for user_id in user_ids])
+
+
+cache = Cache(RedisBackend(Config.REDIS_URL) if Config.REDIS_URL else MemoryBackend())
@@ -16,6 +16,41 @@ class Settings(BaseSettings):
     USE_CREDENTIALS : bool  = True
     VALIDATE_CERTS : bool= True
     DOMAIN : str
+    DB_POOL_SIZE : int = 5  # Connections kept open per worker process
+    DB_MAX_OVERFLOW : int = 10  # Extra connections allowed above the pool size under load
+    DB_POOL_TIMEOUT : int = 30  # Seconds to wait for a free connection before giving up
+    DB_POOL_RECYCLE : int = 1800  # Seconds after which a connection is replaced
+    DB_POOL_PRE_PING : bool = True  # Check a connection is alive before handing it out
+    DATABASE_REPLICA_URLS : str = ''  # Comma separated read replica URLs, reads use the primary when empty
+    REPLICA_RETRY_AFTER : int = 30  # Seconds an unreachable replica is skipped before it is tried again
+    READ_YOUR_WRITES_SECONDS : int = 0  # Send a user's reads to the primary for this long after they write, 0 disables it
+    PAGE_SIZE_DEFAULT : int = 20  # Items per page when a listing is called without limit
+    PAGE_SIZE_MAX : int = 100  # Largest limit a listing accepts
+    IMPORT_BATCH_SIZE : int = 1000  # Rows written per COPY batch by the bulk book import
+    IMPORT_MAX_ERRORS : int = 1000  # Row errors listed in an import report, the rest are only counted
+    EXPORT_CHUNK_SIZE : int = 1000  # Rows fetched per round trip from the server side cursor of the book export
+    REDIS_URL : str = ''  # e.g. redis://localhost:6379/0, the cache is kept in process memory when empty
+    CACHE_BOOK_DETAIL_TTL : int = 300  # Seconds a cached book detail response is served before it is reloaded
+    CACHE_PRINCIPAL_TTL : int = 60  # Seconds the id, role and verified flag of a caller are served from the cache
+    BOOK_BATCH_MAX : int = 100  # Most ids GET /books/batch accepts in one request
+    TOKEN_CACHE_SIZE : int = 10000  # Verified JWTs whose claims are kept in process memory until they expire, 0 disables the cache
+    BCRYPT_ROUNDS : int = 12  # bcrypt cost of new password hashes, python -m src.auth.calibrate recommends one for the host
+    PASSWORD_POOL_SIZE : int = 4  # Threads hashing and checking passwords with bcrypt, per worker process
+    PASSWORD_POOL_QUEUE : int = 64  # Password calls allowed to wait for a thread, beyond that they answer 503
+    BLOCKLIST_FILTER_CAPACITY : int = 100000  # Revoked tokens the Bloom filter of each worker is sized for at least, it grows to twice the revocations it loads
+    BLOCKLIST_FILTER_ERROR_RATE : float = 0.001  # Share of never revoked tokens that still need a blocklist lookup
+    BLOCKLIST_FAIL_OPEN : bool = False  # Let every token through while the blocklist store is down, by default only tokens the local filter rules out are
+    RATE_LIMIT_WINDOW : int = 60  # Seconds of the sliding window of the login, signup and password reset limits
+    RATE_LIMIT_PER_EMAIL : int = 5  # Attempts per email and window on each of login, signup and password reset, 0 disables it
+    RATE_LIMIT_PER_IP : int = 20  # Attempts per client IP and window on each of login, signup and password reset, 0 disables it
+    CELERY_BROKER_URL : str = ''  # e.g. redis://localhost:6379/1, mail is queued for the Celery workers, sent from the API process after the response when empty
+    MAIL_POOL_SIZE : int = 2  # SMTP connections kept open per mail sending process
+    MAIL_CONNECTION_MAX_MESSAGES : int = 100  # Messages sent over one SMTP connection before it is replaced
+    MAIL_CONNECTION_IDLE : int = 60  # Seconds an unused SMTP connection is kept open
+    MAIL_MAX_RETRIES : int = 5  # Tries after the first for a message the SMTP server refused for now or could not be reached for
+    MAIL_RETRY_BACKOFF : int = 30  # Seconds before the first retry of a message, doubled for every further one
+    MAIL_DEAD_LETTER_MAX : int = 1000  # Undeliverable messages kept on the dead letter list, the oldest are dropped first
+    FAST_JSON : bool = False  # Serialize book, review and tag responses with compiled serializers and orjson instead of response_model validation
 
     model_config = SettingsConfigDict(
         env_file = ".env",
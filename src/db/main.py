@@ -1,40 +1,234 @@
 from sqlmodel import  create_engine, text, SQLModel
 from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.orm import sessionmaker
+from fastapi import Request
+from typing import List, Optional
 from src.config import Config
+import logging
 import ssl
+import time
 
 
 
 ssl_context = ssl.create_default_context()
 
 
-engine = AsyncEngine(
-    create_engine(
-    url=Config.DATABASE_URL,
-    # echo=True,  # Echo SQL statements to the console for debugging + logging purposes
-    connect_args={'ssl' : ssl_context}
-))
+class MonitoredQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that also counts the callers currently waiting for a connection"""
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waiting = 0
 
+    def _do_get(self):
+        # Only a caller finding no idle connection with the overflow used up blocks, the
+        # same condition QueuePool waits on, every other checkout is served right away
+        if not self._pool.empty() or self._max_overflow == -1 or self._overflow < self._max_overflow:
+            return super()._do_get()
 
-#DB connection function 
+        self.waiting += 1
+
+        try:
+            return super()._do_get()
+        finally:
+            self.waiting -= 1
+
+
+def create_db_engine(url : str) -> AsyncEngine:
+
+    return AsyncEngine(
+        create_engine(
+        url=url,
+        # echo=True,  # Echo SQL statements to the console for debugging + logging purposes
+        connect_args={'ssl' : ssl_context},
+        poolclass = MonitoredQueuePool,
+        pool_size = Config.DB_POOL_SIZE,
+        max_overflow = Config.DB_MAX_OVERFLOW,
+        pool_timeout = Config.DB_POOL_TIMEOUT,
+        pool_recycle = Config.DB_POOL_RECYCLE,
+        pool_pre_ping = Config.DB_POOL_PRE_PING
+    ))
+
+
+def create_session_maker(bind : AsyncEngine) -> sessionmaker:
+
+    return sessionmaker(
+        bind = bind,
+        class_ = AsyncSession,
+        expire_on_commit = False,  # This means that the session will not expire the objects after commit, allowing you to access them later without reloading from the database
+    )
+
+
+engine = create_db_engine(Config.DATABASE_URL)
+
+replica_engines = [create_db_engine(url.strip()) for url in Config.DATABASE_REPLICA_URLS.split(',') if url.strip()]
+
+
+# One session factory for the whole process, every request borrows its connection from the engine pool
+async_session_maker = create_session_maker(engine)
+
+
+class ReplicaRouter:
+    """
+    Hands out replica sessions in round robin order. A replica that fails to give
+    a connection is skipped for `retry_after` seconds, when none is usable the
+    caller falls back to the primary
+    """
+
+    def __init__(self, session_makers : List[sessionmaker], retry_after : int):
+
+        self.session_makers = session_makers
+        self.retry_after = retry_after
+        self.unhealthy_until = [0.0] * len(session_makers)
+        self.next_index = 0
+
+    def candidates(self) -> List[int]:
+
+        count = len(self.session_makers)
+
+        start = self.next_index
+        self.next_index = (self.next_index + 1) % count if count else 0
+
+        now = time.monotonic()
+
+        return [(start + offset) % count for offset in range(count) if self.unhealthy_until[(start + offset) % count] <= now]
+
+    def mark_unhealthy(self, index : int) -> None:
+
+        self.unhealthy_until[index] = time.monotonic() + self.retry_after
+
+    async def connect(self) -> Optional[AsyncSession]:
+        """Returns a replica session that already holds a connection, or None"""
+
+        for index in self.candidates():
+            session = self.session_makers[index]()
+
+            try:
+                await session.connection()  # checks out (and pre-pings) a connection right away
+
+                session.info['replica'] = True  # see is_replica_session
+
+                return session
+
+            except (DBAPIError, PoolTimeoutError, OSError) as e:
+                logging.warning(f'Read replica {index} is unavailable, skipping it for {self.retry_after}s: {e}')
+
+                await session.close()
+
+                self.mark_unhealthy(index)
+
+        return None
+
+
+def is_replica_session(session : AsyncSession) -> bool:
+    """
+    True for a session handed out by the replica router. Its reads may lag behind the
+    primary, so they must not fill shared caches that writes invalidate
+    """
+
+    return session.info.get('replica', False)
+
+
+replica_router = ReplicaRouter(
+    session_makers = [create_session_maker(replica) for replica in replica_engines],
+    retry_after = Config.REPLICA_RETRY_AFTER
+)
+
+
+class RecentWrites:
+    """Remembers which users wrote recently so their reads can be pinned to the primary"""
+
+    def __init__(self, window : int):
+
+        self.window = window
+        self.expires_at = {}
+
+    def _user_id(self, request : Request) -> Optional[str]:
+
+        token_data = getattr(request.state, 'token_data', None)  # stored by TokenBearer
+
+        if not token_data:
+            return None
+
+        return token_data.get('user', {}).get('user_id')
+
+    def mark(self, request : Request) -> None:
+
+        user_id = self._user_id(request)
+
+        if self.window <= 0 or user_id is None:
+            return
+
+        now = time.monotonic()
+
+        if len(self.expires_at) > 10000:
+            self.expires_at = {key: value for key, value in self.expires_at.items() if value > now}
+
+        self.expires_at[user_id] = now + self.window
+
+    def is_recent(self, request : Request) -> bool:
+
+        user_id = self._user_id(request)
+
+        if self.window <= 0 or user_id is None:
+            return False
+
+        return self.expires_at.get(user_id, 0.0) > time.monotonic()
+
+
+recent_writes = RecentWrites(window = Config.READ_YOUR_WRITES_SECONDS)
+
+
+
+#DB connection function
 async def init_db():
     async with engine.begin() as conn: #connection object created
         from src.db.models import Book
 
         await conn.run_sync(SQLModel.metadata.create_all)  # Create all tables in the database migrations jesa hai golang ki hisab se
-        
 
-async def get_session() -> AsyncSession:
 
-    Session = sessionmaker(
-        bind = engine,
-        class_ = AsyncSession,
-        expire_on_commit = False,  # This means that the session will not expire the objects after commit, allowing you to access them later without reloading from the database
-    )
+async def get_session(request : Request) -> AsyncSession:
 
-    async with Session() as session:
+    async with async_session_maker() as session:
         yield session # This will yield the session object to be used in the route handlers, allowing you to use it in your CRUD operations
         # The session will be automatically closed after the block is exited
+
+    if request.method != 'GET':
+        recent_writes.mark(request)
+
+
+async def get_read_session(request : Request) -> AsyncSession:
+    """
+    Session for read only routes, served by a replica when one is configured and healthy.
+    Reads of users inside their read-your-writes window go to the primary
+    """
+
+    session = None
+
+    if not recent_writes.is_recent(request):
+        session = await replica_router.connect()
+
+    if session is None:
+        session = async_session_maker()
+
+    async with session:
+        yield session
+
+
+def get_pool_stats() -> dict:
+    """Snapshot of the connection pool of this worker process"""
+
+    pool = engine.sync_engine.pool
+
+    return {
+        'pool_size' : pool.size(),
+        'max_overflow' : Config.DB_MAX_OVERFLOW,
+        'checked_out' : pool.checkedout(),
+        'idle' : pool.checkedin(),
+        'overflow' : max(pool.overflow(), 0),  # overflow() is negative while the pool is not full yet
+        'waiting' : pool.waiting
+    }
@@ -1,4 +1,5 @@
-from sqlmodel import SQLModel,Field,Column,Relationship
+from sqlmodel import SQLModel,Field,Column,Relationship,Index
+from sqlalchemy import Computed
 import sqlalchemy.dialects.postgresql as pg
 import uuid # this is the unique id generator uuid is unique id
 from datetime import datetime, date
@@ -16,25 +17,29 @@ class User(SQLModel,table=True):
     ))
     username : str
     password : str = Field(exclude=True)  # Exclude password from the model representation
-    email:str  # Email should be unique, consider adding a unique constraint in the database
+    email:str = Field(unique = True, index = True)  # Looked up on every login, signup and password reset
     first_name:str
     last_name:str
     role : str = Field(sa_column = Column(pg.VARCHAR, nullable = False, server_default = 'user')) # Default role is user, can be updated later
     is_verified:bool = Field(default=False)  # Default to False, can be updated later
     created_at: datetime = Field(sa_column=Column(pg.TIMESTAMP,default=datetime.now))
     updated_at: datetime = Field(sa_column=Column(pg.TIMESTAMP,default=datetime.now))
-    books : List['Book']  = Relationship(back_populates = 'user',sa_relationship_kwargs = {'lazy': 'selectin'})
-    reviews : List['Review']  = Relationship(back_populates = 'user',sa_relationship_kwargs = {'lazy': 'selectin'})
+    books : List['Book']  = Relationship(back_populates = 'user',sa_relationship_kwargs = {'lazy': 'noload'})
+    reviews : List['Review']  = Relationship(back_populates = 'user',sa_relationship_kwargs = {'lazy': 'noload'})
 
     def __repr__(self):
         return f"<User {self.username}>" 
     
 
 class BookTags(SQLModel, table = True):
+    __table_args__ = (
+        Index('ix_booktags_tag_id_book_id', 'tag_id', 'book_id'),  # books of a tag, the primary key only serves tags of a book
+    )
     
     book_id : uuid.UUID = Field(
             primary_key = True,
             foreign_key = 'books.id',
+            ondelete = 'CASCADE',  # deleting a book drops its tag links in the same statement
             default = None
         )
     
@@ -58,13 +63,13 @@ class Tag(SQLModel, table = True):
             default = uuid.uuid4
         )
     )
-    name : str
+    name : str = Field(unique = True, index = True)
     created_at : datetime = Field(sa_column = Column(pg.TIMESTAMP, default = datetime.now()))
     #updated at not created tags aren't updated they are either used or unused 
     books : List['Book'] = Relationship( # created for filteration purposes usally
         link_model = BookTags,
         back_populates = 'tags',
-        sa_relationship_kwargs = {'lazy' : 'selectin'},
+        sa_relationship_kwargs = {'lazy' : 'noload'},
     )
 
     def __repr__(self):
@@ -73,6 +78,16 @@ class Tag(SQLModel, table = True):
 
 class Book(SQLModel, table=True):
     __tablename__ = "books"  # Define the table name in the database
+    __table_args__ = (
+        Index('ix_books_created_at_id', 'created_at', 'id'),  # keyset pagination order of the book listings
+        Index('ix_books_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        Index('ix_books_rating_avg_id', 'rating_avg', 'id'),  # keyset pagination of the listing sorted by rating
+        Index('ix_books_published_date_id', 'published_date', 'id'),  # published sort and published_date ranges
+        Index('ix_books_author_created_at_id', 'author', 'created_at', 'id'),  # filter column first, then the sort it is listed in
+        Index('ix_books_author_rating_avg_id', 'author', 'rating_avg', 'id'),
+        Index('ix_books_language_created_at_id', 'language', 'created_at', 'id'),
+        Index('ix_books_language_rating_avg_id', 'language', 'rating_avg', 'id'),
+    )
 
     id: uuid.UUID = Field(
         sa_column=Column(
@@ -88,24 +103,49 @@ class Book(SQLModel, table=True):
     page_count: int
     language: str
     user_id : Optional[uuid.UUID] = Field(default = None, foreign_key = 'users.id')
+    version : int = Field(sa_column = Column(pg.INTEGER, nullable = False, default = 1, server_default = '1'))  # bumped by every write that changes the book detail, feeds the ETag
+    review_count : int = Field(sa_column = Column(pg.INTEGER, nullable = False, default = 0, server_default = '0'))  # kept in step with the reviews by ReviewService in the same transaction
+    rating_sum : int = Field(sa_column = Column(pg.INTEGER, nullable = False, default = 0, server_default = '0'))
+    rating_avg : float = Field(sa_column = Column(
+        pg.DOUBLE_PRECISION,
+        Computed('CASE WHEN review_count > 0 THEN rating_sum::double precision / review_count ELSE 0 END', persisted = True),
+        nullable = False
+    ))  # 0 until the first review, review_count tells the two apart
     created_at: datetime = Field(sa_column=Column(pg.TIMESTAMP,default=(datetime.now))) 
     updated_at: datetime = Field(sa_column=Column(pg.TIMESTAMP,default=(datetime.now))) 
     user : Optional['User']  = Relationship(back_populates = 'books')
-    reviews : List['Review']  = Relationship(back_populates = 'book',sa_relationship_kwargs = {'lazy': 'selectin'}) #back_populates contains the key name defined in the origin model
+    reviews : List['Review']  = Relationship(back_populates = 'book',sa_relationship_kwargs = {'lazy': 'noload'}) #back_populates contains the key name defined in the origin model
     tags : List['Tag'] = Relationship(
         link_model = BookTags,
         back_populates = 'books',
-        sa_relationship_kwargs = {'lazy': 'selectin'}, 
+        sa_relationship_kwargs = {'lazy': 'noload'}, 
     )
     
     #Column is used to define a pydantic column in db
     #sa_column is used to define a sqlalchemy column in db
+    #relationships are never loaded by default, services opt in with selectinload() where a response needs them
 
     def __repr__(self):
         return f"<Book {self.title}>"
 
+
+# Full text search document over title and author, computed and stored by Postgres itself.
+# It is appended to the table after mapping so the ORM never selects it along with a Book
+Book.__table__.append_column(
+    Column(
+        'search_vector',
+        pg.TSVECTOR,
+        Computed("to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(author, ''))", persisted = True)
+    )
+)
+Index('ix_books_search_vector', Book.__table__.c.search_vector, postgresql_using = 'gin')
+
 class Review(SQLModel, table=True):
     __tablename__ = "reviews"  # Define the table name in the database
+    __table_args__ = (
+        Index('ix_reviews_book_id_created_at', 'book_id', 'created_at'),
+        Index('ix_reviews_user_id_created_at', 'user_id', 'created_at'),  # reviews of a user, and the user side of the foreign key
+    )
 
     id: uuid.UUID = Field(
         sa_column=Column(
@@ -118,7 +158,7 @@ class Review(SQLModel, table=True):
     rating : int = Field(lt = 5)
     review : str = Field(sa_column = Column(pg.VARCHAR, nullable = False))
     user_id : Optional[uuid.UUID] = Field(default = None, foreign_key = 'users.id')
-    book_id : Optional[uuid.UUID] = Field(default = None, foreign_key = 'books.id')
+    book_id : Optional[uuid.UUID] = Field(default = None, foreign_key = 'books.id', ondelete = 'CASCADE')  # reviews go with their book
     created_at: datetime = Field(sa_column=Column(pg.TIMESTAMP,default=(datetime.now))) 
     updated_at: datetime = Field(sa_column=Column(pg.TIMESTAMP,default=(datetime.now))) 
     user : Optional['User']  = Relationship(back_populates = 'reviews')
@@ -54,6 +54,34 @@ class TagAlreadyExists(BooklyException):
 class AccountNotVerified(BooklyException):
     '''User's Account Is Not Verified'''
 
+class InvalidCursor(BooklyException):
+    """Pagination cursor is malformed or does not belong to this listing"""
+    pass
+
+class PreconditionFailed(BooklyException):
+    """If-Match header does not match the current version of the resource"""
+    pass
+
+class InvalidFields(BooklyException):
+    """?fields= names a field the response does not have"""
+    pass
+
+class PasswordPoolBusy(BooklyException):
+    """Every bcrypt thread is busy and the queue in front of them is full"""
+    pass
+
+class RateLimited(BooklyException):
+    """Too many attempts at a credential endpoint from one email or IP"""
+
+    def __init__(self, retry_after : int):
+
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+class BatchTooLarge(BooklyException):
+    """More ids were sent to a batch read than BOOK_BATCH_MAX"""
+    pass
+
 def create_error_handler(status_code : int , initial_detail: Any) -> Callable[[Request, Exception], JSONResponse]:
 
     async def error_handler(request: Request, exc: BooklyException):
@@ -186,6 +214,74 @@ def register_all_errors(app : FastAPI):
         )
     )
 
+    app.add_exception_handler(
+        InvalidCursor,
+        create_error_handler(
+            status_code = status.HTTP_400_BAD_REQUEST,
+            initial_detail = {
+                'message' : 'Invalid pagination cursor',
+                'Resolution' : 'Use the next_cursor returned by the previous page'
+            }
+        )
+    )
+
+    app.add_exception_handler(
+        InvalidFields,
+        create_error_handler(
+            status_code = status.HTTP_400_BAD_REQUEST,
+            initial_detail = {
+                'message' : 'Unknown field requested in fields',
+                'Resolution' : 'Use comma separated field names of the response schema'
+            }
+        )
+    )
+
+    app.add_exception_handler(
+        PasswordPoolBusy,
+        create_error_handler(
+            status_code = status.HTTP_503_SERVICE_UNAVAILABLE,
+            initial_detail = {
+                'message' : 'Too many logins in progress',
+                'Resolution' : 'Try again in a few seconds'
+            }
+        )
+    )
+
+    async def rate_limited_handler(request : Request, exc : RateLimited):
+
+        return JSONResponse(
+            status_code = status.HTTP_429_TOO_MANY_REQUESTS,
+            content = {
+                'message' : 'Too many attempts',
+                'Resolution' : f'Try again in {exc.retry_after} seconds'
+            },
+            headers = {'Retry-After' : str(exc.retry_after)}
+        )
+
+    app.add_exception_handler(RateLimited, rate_limited_handler)
+
+    app.add_exception_handler(
+        BatchTooLarge,
+        create_error_handler(
+            status_code = status.HTTP_400_BAD_REQUEST,
+            initial_detail = {
+                'message' : 'Too many ids in one batch',
+                'Resolution' : 'Split the ids over several requests'
+            }
+        )
+    )
+
+    app.add_exception_handler(
+        PreconditionFailed,
+        create_error_handler(
+            status_code = status.HTTP_412_PRECONDITION_FAILED,
+            initial_detail = {
+                'message' : 'The resource was changed since it was last fetched',
+                'Resolution' : 'Fetch it again and retry with the new ETag in If-Match'
+            }
+        )
+    )
+
     app.add_exception_handler(
         InsufficientPermission,
         create_error_handler(
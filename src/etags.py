@@ -0,0 +1,101 @@
+"""
+Strong ETags for book and tag reads and the conditional request checks around them.
+
+A book's ETag is its id and version, the version is bumped by every write that changes
+what its detail shows. List ETags hash the id and version (or name for tags) of every
+item on the page, so a 304 only needs the rows, never the serialized body.
+"""
+from fastapi import Request, Response, status
+from typing import Iterable, List, Optional
+import hashlib
+
+
+def book_etag(book) -> str:
+
+    return f'"{book.id}-{book.version}"'
+
+
+def list_etag(parts : Iterable) -> str:
+
+    digest = hashlib.sha256()
+
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b'\x00')
+
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def book_page_etag(page : dict) -> str:
+
+    return list_etag([f'{book.id}-{book.version}' for book in page['books']] + [page.get('next_cursor')])
+
+
+def book_batch_etag(batch : dict) -> str:
+
+    return list_etag([f'{book.id}-{book.version}' for book in batch['books']] + batch['missing'])
+
+
+def tag_list_etag(tags : Iterable) -> str:
+
+    return list_etag(f'{tag.id}-{tag.name}' for tag in tags)
+
+
+def etag_matches(header : Optional[str], etag : str, weak : bool = True) -> bool:
+    """
+    True when the If-None-Match / If-Match header lists the ETag or is `*`.
+    If-None-Match compares weakly (W/ prefixes ignored), If-Match strongly
+    """
+
+    if header is None:
+        return False
+
+    if header.strip() == '*':
+        return True
+
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+
+        if candidate.startswith('W/'):
+            if not weak:
+                continue
+
+            candidate = candidate[2:]
+
+        if candidate == etag:
+            return True
+
+    return False
+
+
+def not_modified(request : Request, response : Response, etag : str) -> Optional[Response]:
+    """Sets the ETag on the response and returns a bodiless 304 when the client already has it"""
+
+    response.headers['ETag'] = etag
+
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return Response(status_code = status.HTTP_304_NOT_MODIFIED, headers = {'ETag' : etag})
+
+    return None
+
+
+def if_match_versions(if_match : Optional[str], book_id : str) -> Optional[List[int]]:
+    """
+    Versions of the book listed in an If-Match header, to be checked in the WHERE clause
+    of the write itself. None when the header is missing or `*`, i.e. any version will do
+    """
+
+    if if_match is None or if_match.strip() == '*':
+        return None
+
+    prefix = f'"{str(book_id).lower()}-'
+
+    versions = []
+
+    for candidate in if_match.split(','):
+        candidate = candidate.strip()  # weak ETags never match If-Match
+
+        if candidate.startswith(prefix) and candidate.endswith('"') and candidate[len(prefix):-1].isdigit():
+            versions.append(int(candidate[len(prefix):-1]))
+
+    return versions
@@ -0,0 +1,77 @@
+"""
+Sparse fieldsets, `?fields=id,title` on book, review and user reads.
+
+FieldSelector checks the requested names against the response model, load_fields turns
+them into loader options so the SELECT only reads those columns and only the requested
+relations are loaded, and dump_fields serializes just those keys through a partial copy
+of the response model. Without ?fields= the endpoints behave as before.
+"""
+from fastapi import Query
+from pydantic import BaseModel, create_model
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only, selectinload
+from typing import FrozenSet, Iterable, Optional, Type
+from functools import lru_cache
+from src.errors import InvalidFields
+
+
+class FieldSelector:
+    """Dependency parsing ?fields= into a frozenset of field names of `model`, None when absent"""
+
+    def __init__(self, model : Type[BaseModel]):
+
+        self.model = model
+        self.allowed = frozenset(name for name, info in model.model_fields.items() if not info.exclude)  # excluded fields (password) are never selectable
+
+    def __call__(self, fields : Optional[str] = Query(default = None, description = 'Comma separated fields to return, e.g. id,title')) -> Optional[FrozenSet[str]]:
+
+        if fields is None or not fields.strip():
+            return None
+
+        requested = frozenset(name.strip() for name in fields.split(',') if name.strip())
+
+        if not requested or not requested <= self.allowed:
+            raise InvalidFields()
+
+        return requested
+
+
+def load_fields(model, fields : Optional[FrozenSet[str]], always : Iterable[str] = ('id',)) -> tuple:
+    """
+    Loader options for a SELECT of the ORM `model` that only reads the requested columns,
+    plus `always` (keys the caller needs for cursors or ETags), and batch loads the
+    requested relations. No options when every field is wanted
+    """
+
+    if fields is None:
+        return ()
+
+    mapper = inspect(model)
+
+    wanted = fields | frozenset(always)
+
+    columns = [getattr(model, name) for name in mapper.column_attrs.keys() if name in wanted]
+    relations = [selectinload(getattr(model, name)) for name in mapper.relationships.keys() if name in fields]
+
+    return (load_only(*columns), *relations)
+
+
+@lru_cache(maxsize = 256)
+def partial_model(model : Type[BaseModel], fields : FrozenSet[str]) -> Type[BaseModel]:
+    """Copy of `model` with only `fields`, built once per model and field set"""
+
+    return create_model(
+        f'{model.__name__}Fields',
+        **{name: (info.annotation, info) for name, info in model.model_fields.items() if name in fields}
+    )
+
+
+def dump_fields(model : Type[BaseModel], fields : FrozenSet[str], value):
+    """JSON ready dict (or list of dicts for a list) of the requested fields of ORM objects or models, nested ones included"""
+
+    partial = partial_model(model, fields)
+
+    if isinstance(value, list):
+        return [partial.model_validate(item, from_attributes = True).model_dump(mode = 'json') for item in value]
+
+    return partial.model_validate(value, from_attributes = True).model_dump(mode = 'json')
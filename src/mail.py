@@ -1,36 +1,62 @@
-from fastapi_mail import FastMail, ConnectionConfig, MessageSchema, MessageType
-from src.config import Config
+from fastapi_mail import MessageSchema, MessageType
+from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
 from pathlib import Path
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
 
 BASE_DIR = Path(__file__).resolve().parent
 
-mail_config = ConnectionConfig(
-    MAIL_USERNAME = Config.MAIL_USERNAME,
-    MAIL_PASSWORD = Config.MAIL_PASSWORD,
-    MAIL_FROM = Config.MAIL_FROM,
-    MAIL_PORT = 587,
-    MAIL_SERVER = Config.MAIL_SERVER,
-    MAIL_FROM_NAME = Config.MAIL_FROM_NAME,
-    MAIL_STARTTLS = True,
-    MAIL_SSL_TLS = False,
-    USE_CREDENTIALS = True,
-    VALIDATE_CERTS = True,
-    TEMPLATE_FOLDER = Path(BASE_DIR, 'templates')
-)
+TEMPLATE_FOLDER = Path(BASE_DIR, 'templates')
 
-mail = FastMail(
-    config = mail_config
+# FastMail builds a new jinja Environment (so recompiles the template) on every send, this one is
+# built once and compiles every template of TEMPLATE_FOLDER at startup
+template_env = Environment(
+    loader = FileSystemLoader(TEMPLATE_FOLDER),
+    autoescape = select_autoescape(['html']),
+    trim_blocks = True,
+    lstrip_blocks = True,
+    auto_reload = False,  # a changed template file is picked up on restart, lookups never stat the file
+    cache_size = -1  # no template is ever evicted
 )
 
+mail_templates : Dict[str, Template] = {name : template_env.get_template(name) for name in template_env.list_templates(extensions = ['html'])}
+
+
+def render_template(template_name : str, template_body : Optional[dict] = None) -> str:
+
+    return mail_templates[template_name].render(year = datetime.now().year, **(template_body or {}))
+
+
+def create_message(receipients : list[str], subject : str, body : str = None, template_name : str = None, template_body : dict = None):
+    """An html message, its body is `body` or `template_name` rendered with `template_body`"""
+
+    if template_name is not None:
+        body = render_template(template_name, template_body)
 
-def create_message(receipients : list[str], subject : str, body : str):
-    
     message = MessageSchema(
         recipients = receipients,
         subject = subject,
         body = body,
+        template_body = template_body,
         subtype = MessageType.html 
     )
 
     return message
 
+
+def create_messages(subject : str, template_name : str, messages : Iterable[Tuple[List[str], dict]]) -> List[MessageSchema]:
+    """One message per (recipients, template_body) pair from a single template lookup, for batched sends through one queue_mail call"""
+
+    template = mail_templates[template_name]
+    year = datetime.now().year
+
+    return [
+        MessageSchema(
+            recipients = receipients,
+            subject = subject,
+            body = template.render(year = year, **template_body),
+            template_body = template_body,
+            subtype = MessageType.html
+        )
+        for receipients, template_body in messages
+    ]
@@ -0,0 +1,410 @@
+"""
+Outbound mail queue.
+
+Routes hand their messages to queue_mail, which publishes a send_mail task to the Celery
+broker in CELERY_BROKER_URL before the response goes out, so mail survives a restart of
+the API and a slow SMTP server never holds an API worker. Workers are started with
+
+    celery -A src.mail_queue worker --loglevel info
+
+Each worker process keeps up to MAIL_POOL_SIZE SMTP connections open and sends every
+message of a task over one of them, a connection is replaced after
+MAIL_CONNECTION_MAX_MESSAGES messages or MAIL_CONNECTION_IDLE idle seconds. A message the
+server refuses for now (4xx, lost connection) is retried with exponential backoff up to
+MAIL_MAX_RETRIES times, a permanent refusal (5xx) or the last failed try puts it on the
+dead letter list, in Redis when REDIS_URL is set and in process memory otherwise.
+
+Without a broker the messages are sent from the API process after the response, as
+before, with a single try.
+"""
+from celery import Celery
+from collections import deque
+from email.message import EmailMessage
+from email.utils import formataddr, formatdate, make_msgid
+from fastapi import BackgroundTasks
+from fastapi_mail import MessageSchema
+from itertools import islice
+from kombu.exceptions import OperationalError
+from redis import Redis
+from redis.exceptions import RedisError
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, List
+from src.config import Config
+from datetime import datetime
+import json
+import logging
+import random
+import smtplib
+import ssl
+import threading
+import time
+
+CHECK_AFTER = 5  # seconds idle after which a pooled connection is checked with NOOP before it is reused
+MAX_RETRY_DELAY = 3600
+
+
+class PooledConnection:
+
+    def __init__(self, smtp : smtplib.SMTP):
+
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPPool:
+    """SMTP connections of one process, reused across tasks, at most `size` in use at once"""
+
+    def __init__(self, host : str, port : int, username : str = '', password : str = '', starttls : bool = True,
+                 ssl_tls : bool = False, validate_certs : bool = True, size : int = 2, max_messages : int = 100,
+                 idle_timeout : int = 60, timeout : int = 30):
+
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.ssl_tls = ssl_tls
+        self.validate_certs = validate_certs
+        self.size = size
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.idle : List[PooledConnection] = []
+        self.opened = 0
+        self.reused = 0
+        self.sent = 0
+        self.failed = 0
+
+    def open(self) -> smtplib.SMTP:
+
+        context = ssl.create_default_context()
+
+        if not self.validate_certs:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+
+        if self.ssl_tls:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout = self.timeout, context = context)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout = self.timeout)
+
+        try:
+            if self.starttls and not self.ssl_tls:
+                smtp.starttls(context = context)
+
+            if self.username:
+                smtp.login(self.username, self.password)
+
+        except BaseException:
+            smtp.close()
+            raise
+
+        return smtp
+
+    def alive(self, connection : PooledConnection) -> bool:
+
+        try:
+            return connection.smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def close(self, connection : PooledConnection) -> None:
+
+        try:
+            connection.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.smtp.close()
+
+    def checkout(self) -> PooledConnection:
+
+        while True:
+            with self.lock:
+                connection = self.idle.pop() if self.idle else None
+
+            if connection is None:
+                break
+
+            idle_for = time.monotonic() - connection.last_used
+
+            if idle_for < self.idle_timeout and (idle_for < CHECK_AFTER or self.alive(connection)):
+                self.reused += 1
+                return connection
+
+            self.close(connection)  # the server may have dropped it already
+
+        connection = PooledConnection(self.open())
+        self.opened += 1
+
+        return connection
+
+    def checkin(self, connection : PooledConnection) -> None:
+
+        if connection.sent >= self.max_messages:
+            self.close(connection)
+            return
+
+        connection.last_used = time.monotonic()
+
+        with self.lock:
+            self.idle.append(connection)
+
+    def send_batch(self, messages : List[EmailMessage]) -> Dict[int, Exception]:
+        """Sends `messages` over one connection, returns the errors by message index, the other messages were accepted"""
+
+        errors = {}
+
+        with self.slots:
+            try:
+                connection = self.checkout()
+            except (smtplib.SMTPException, OSError) as e:
+                self.failed += len(messages)
+                return {index : e for index in range(len(messages))}
+
+            for index, message in enumerate(messages):
+                try:
+                    connection.smtp.send_message(message)
+
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                    errors[index] = e  # this message was refused, the connection is still usable
+
+                except (smtplib.SMTPException, OSError) as e:
+                    connection.smtp.close()  # the connection is gone, so is every message left in the batch
+                    errors.update({rest : e for rest in range(index, len(messages))})
+                    break
+
+                else:
+                    connection.sent += 1
+                    self.sent += 1
+
+            else:
+                self.checkin(connection)
+
+        self.failed += len(errors)
+
+        return errors
+
+    def close_all(self) -> None:
+
+        with self.lock:
+            idle, self.idle = self.idle, []
+
+        for connection in idle:
+            self.close(connection)
+
+    def stats(self) -> dict:
+
+        return {
+            'size' : self.size,
+            'idle' : len(self.idle),
+            'opened' : self.opened,
+            'reused' : self.reused,
+            'sent' : self.sent,
+            'failed' : self.failed
+        }
+
+
+class MemoryDeadLetters:
+
+    name = 'memory'
+
+    def __init__(self, limit : int):
+
+        self.entries = deque(maxlen = limit)
+
+    def push(self, entry : dict) -> None:
+
+        self.entries.appendleft(entry)
+
+    def recent(self, count : int) -> List[dict]:
+
+        return list(islice(self.entries, count))
+
+    def size(self) -> int:
+
+        return len(self.entries)
+
+
+class RedisDeadLetters:
+
+    name = 'redis'
+    key = 'bookly:mail:dead'
+
+    def __init__(self, url : str, limit : int):
+
+        self.client = Redis.from_url(url, decode_responses = True)
+        self.limit = limit
+
+    def push(self, entry : dict) -> None:
+
+        with self.client.pipeline(transaction = False) as pipeline:
+            pipeline.lpush(self.key, json.dumps(entry))
+            pipeline.ltrim(self.key, 0, self.limit - 1)
+            pipeline.execute()
+
+    def recent(self, count : int) -> List[dict]:
+
+        return [json.loads(entry) for entry in self.client.lrange(self.key, 0, count - 1)]
+
+    def size(self) -> int:
+
+        return self.client.llen(self.key)
+
+
+def message_payload(message : MessageSchema) -> dict:
+    """JSON safe form of a message for the broker, the Message-ID is fixed here so every try sends the same one"""
+
+    return {
+        'message_id' : make_msgid(domain = Config.MAIL_FROM.rpartition('@')[2] or None),
+        'date' : formatdate(localtime = True),
+        'recipients' : [str(recipient) for recipient in message.recipients],
+        'cc' : [str(recipient) for recipient in message.cc],
+        'bcc' : [str(recipient) for recipient in message.bcc],
+        'subject' : message.subject,
+        'body' : message.body or '',
+        'subtype' : message.subtype.value if message.subtype else 'plain'
+    }
+
+
+def build_message(payload : dict) -> EmailMessage:
+
+    message = EmailMessage()
+
+    message['Message-ID'] = payload['message_id']
+    message['Date'] = payload['date']
+    message['From'] = formataddr((Config.MAIL_FROM_NAME, Config.MAIL_FROM))
+    message['To'] = ', '.join(payload['recipients'])
+    message['Subject'] = payload['subject']
+
+    if payload['cc']:
+        message['Cc'] = ', '.join(payload['cc'])
+
+    message.set_content(payload['body'], subtype = payload['subtype'])
+
+    if payload['bcc']:
+        message['Bcc'] = ', '.join(payload['bcc'])  # send_message uses it for the envelope and strips it from the message
+
+    return message
+
+
+def is_permanent(error : Exception) -> bool:
+
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, response in error.recipients.values())
+
+    if isinstance(error, smtplib.SMTPAuthenticationError):  # wrong credentials are fixed in the configuration, the mail can wait
+        return False
+
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def deliver(payloads : List[dict], attempt : int, final : bool) -> List[dict]:
+    """
+    Sends `payloads` over one pooled connection. Permanent failures, and every failure
+    when `final`, go to the dead letter list, the payloads to try again are returned
+    """
+
+    errors = smtp_pool.send_batch([build_message(payload) for payload in payloads])
+
+    retry = []
+
+    for index, error in errors.items():
+        payload = payloads[index]
+
+        if final or is_permanent(error):
+            logging.error(f'Mail {payload["message_id"]} to {payload["recipients"]} dead lettered after {attempt} tries: {error!r}')
+
+            try:
+                dead_letters.push({'message' : payload, 'error' : repr(error), 'attempts' : attempt, 'failed_at' : datetime.now().isoformat()})
+            except (RedisError, OSError) as e:
+                logging.error(f'Dead letter of mail {payload["message_id"]} was not stored: {e}')
+
+        else:
+            logging.warning(f'Mail {payload["message_id"]} to {payload["recipients"]} failed, try {attempt} of {Config.MAIL_MAX_RETRIES + 1}: {error!r}')
+            retry.append(payload)
+
+    return retry
+
+
+def retry_delay(retries : int) -> int:
+    """Seconds before the next try, doubled each time and spread by 20% so a recovered server is not hit by every task at once"""
+
+    delay = min(Config.MAIL_RETRY_BACKOFF * 2 ** retries, MAX_RETRY_DELAY)
+
+    return max(1, round(delay * random.uniform(0.8, 1.2)))
+
+
+celery_app = Celery('bookly', broker = Config.CELERY_BROKER_URL or 'memory://')
+
+celery_app.conf.update(
+    task_serializer = 'json',
+    accept_content = ['json'],
+    task_ignore_result = True,
+    task_acks_late = True,  # a task is only taken off the broker once it finished, a worker killed mid send does not lose it
+    task_reject_on_worker_lost = True,
+    worker_prefetch_multiplier = 1,
+    broker_connection_retry_on_startup = True
+)
+
+
+@celery_app.task(bind = True, name = 'bookly.send_mail', max_retries = Config.MAIL_MAX_RETRIES)
+def send_mail(self, payloads : List[dict]):
+
+    retry = deliver(payloads, attempt = self.request.retries + 1, final = self.request.retries >= self.max_retries)
+
+    if retry:
+        raise self.retry(args = (retry,), countdown = retry_delay(self.request.retries))  # only the messages that failed
+
+
+async def queue_mail(background_tasks : BackgroundTasks, *messages : MessageSchema) -> None:
+    """Publishes `messages` as one send_mail task, sends them after the response when there is no broker"""
+
+    payloads = [message_payload(message) for message in messages]
+
+    if Config.CELERY_BROKER_URL:
+        try:
+            await run_in_threadpool(send_mail.apply_async, args = (payloads,))
+            return
+
+        except (OperationalError, OSError) as e:
+            logging.warning(f'Mail broker unreachable, sending from the API process: {e}')
+
+    background_tasks.add_task(deliver, payloads, attempt = 1, final = True)
+
+
+def mail_stats() -> dict:
+    """Queue mode, dead letters and the SMTP pool of this process (the pools of the workers are their own)"""
+
+    try:
+        size, recent = dead_letters.size(), dead_letters.recent(10)
+    except (RedisError, OSError) as e:
+        logging.warning(f'Dead letter list could not be read: {e}')
+        size, recent = None, []
+
+    return {
+        'queue' : 'celery' if Config.CELERY_BROKER_URL else 'in-process',
+        'dead_letters' : {
+            'backend' : dead_letters.name,
+            'size' : size,
+            'recent' : recent
+        },
+        'smtp' : smtp_pool.stats()
+    }
+
+
+smtp_pool = SMTPPool(
+    Config.MAIL_SERVER,
+    Config.MAIL_PORT,
+    username = Config.MAIL_USERNAME if Config.USE_CREDENTIALS else '',
+    password = Config.MAIL_PASSWORD,
+    starttls = Config.MAIL_STARTTLS,
+    ssl_tls = Config.MAIL_SSL_TLS,
+    validate_certs = Config.VALIDATE_CERTS,
+    size = Config.MAIL_POOL_SIZE,
+    max_messages = Config.MAIL_CONNECTION_MAX_MESSAGES,
+    idle_timeout = Config.MAIL_CONNECTION_IDLE
+)
+
+dead_letters = RedisDeadLetters(Config.REDIS_URL, Config.MAIL_DEAD_LETTER_MAX) if Config.REDIS_URL else MemoryDeadLetters(Config.MAIL_DEAD_LETTER_MAX)
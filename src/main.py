@@ -3,6 +3,7 @@ from src.books.routes import book_router
 from src.auth.routes import auth_router
 from src.reviews.routes import review_router
 from src.tags.routes import tag_router
+from src.metrics.routes import metrics_router
 from contextlib import asynccontextmanager
 from src.db.main import init_db
 from src.errors import register_all_errors
@@ -51,5 +52,6 @@ app.include_router(book_router, prefix=f"/api/{version}/books", tags=["books"])
 app.include_router(auth_router, prefix=f"/api/{version}/auth", tags=["auth"])
 app.include_router(review_router, prefix = f'/api/{version}/reviews', tags = ['reviews'])
 app.include_router(tag_router, prefix = f'/api/{version}/tags', tags = ['tags'])
+app.include_router(metrics_router, prefix = f'/api/{version}/metrics', tags = ['metrics'])
 
 #------------------All Routers Handled------------------#
\ No newline at end of file
@@ -0,0 +1,101 @@
+from fastapi import APIRouter, Depends, status
+from src.auth.dependencies import RoleChecker
+from src.db.main import get_pool_stats
+from src.cache import cache
+from src.auth.token_cache import token_cache
+from src.auth.blocklist import token_blocklist
+from src.auth.password_pool import password_pool
+from src.auth.rate_limit import rate_limiter
+from src.mail_queue import mail_stats
+
+metrics_router = APIRouter()
+admin_checker = Depends(RoleChecker(['admin']))  # the stored role, not the token claim, decides, so a revoked admin loses access with the token still valid
+
+
+#GET /metrics/db-pool
+@metrics_router.get('/db-pool', status_code = status.HTTP_200_OK, dependencies = [admin_checker], responses = {
+    200:{'description' : 'Connection Pool Stats', 'content':{'application/json' : {'example' :
+      {
+        'pool_size' : 5, 'max_overflow' : 10, 'checked_out' : 3, 'idle' : 2, 'overflow' : 0, 'waiting' : 0}}}},
+    403:{'description' : 'Forbidden Access', 'content':{'application/json' : {'example' :
+      {
+        'message' : "Token is invalid or expired"}}}}
+})
+async def db_pool_stats():
+
+    return get_pool_stats()
+
+
+#GET /metrics/cache
+@metrics_router.get('/cache', status_code = status.HTTP_200_OK, dependencies = [admin_checker], responses = {
+    200:{'description' : 'Cache Stats', 'content':{'application/json' : {'example' :
+      {
+        'backend' : 'redis', 'hits' : 950, 'misses' : 50, 'errors' : 0, 'hit_ratio' : 0.95}}}},
+    403:{'description' : 'Forbidden Access', 'content':{'application/json' : {'example' :
+      {
+        'message' : "Token is invalid or expired"}}}}
+})
+async def cache_stats():
+
+    return cache.stats()
+
+
+#GET /metrics/tokens
+@metrics_router.get('/tokens', status_code = status.HTTP_200_OK, dependencies = [admin_checker], responses = {
+    200:{'description' : 'Token Cache Stats', 'content':{'application/json' : {'example' :
+      {
+        'entries' : 120, 'hits' : 9880, 'misses' : 120, 'verifications' : 120, 'verifications_saved' : 9880, 'hit_ratio' : 0.988,
+        'blocklist' : {'backend' : 'redis', 'lookups' : 10000, 'filtered' : 9990, 'false_positives' : 2, 'errors' : 0, 'filter_entries' : 35}}}}},
+    403:{'description' : 'Forbidden Access', 'content':{'application/json' : {'example' :
+      {
+        'message' : "Token is invalid or expired"}}}}
+})
+async def token_cache_stats():
+
+    return {**token_cache.stats(), 'blocklist' : token_blocklist.stats()}
+
+
+#GET /metrics/passwords
+@metrics_router.get('/passwords', status_code = status.HTTP_200_OK, dependencies = [admin_checker], responses = {
+    200:{'description' : 'Password Pool Stats', 'content':{'application/json' : {'example' :
+      {
+        'size' : 4, 'queue_limit' : 64, 'running' : 4, 'queued' : 12, 'completed' : 5300, 'rejected' : 0,
+        'latency_ms' : {'p50' : 210.4, 'p99' : 245.9, 'max' : 260.1}}}}},
+    403:{'description' : 'Forbidden Access', 'content':{'application/json' : {'example' :
+      {
+        'message' : "Token is invalid or expired"}}}}
+})
+async def password_pool_stats():
+
+    return password_pool.stats()
+
+
+#GET /metrics/rate-limits
+@metrics_router.get('/rate-limits', status_code = status.HTTP_200_OK, dependencies = [admin_checker], responses = {
+    200:{'description' : 'Rate Limit Stats', 'content':{'application/json' : {'example' :
+      {
+        'backend' : 'redis', 'window' : 60, 'rejections' : {'login:email' : 42, 'login:ip' : 310, 'signup:ip' : 3}, 'errors' : 0}}}},
+    403:{'description' : 'Forbidden Access', 'content':{'application/json' : {'example' :
+      {
+        'message' : "Token is invalid or expired"}}}}
+})
+async def rate_limit_stats():
+
+    return rate_limiter.stats()
+
+
+#GET /metrics/mail
+@metrics_router.get('/mail', status_code = status.HTTP_200_OK, dependencies = [admin_checker], responses = {
+    200:{'description' : 'Mail Queue Stats', 'content':{'application/json' : {'example' :
+      {
+        'queue' : 'celery',
+        'dead_letters' : {'backend' : 'redis', 'size' : 1, 'recent' : [{'message' : {'message_id' : '<172.1.2@bookly.com>', 'recipients' : ['user@example.com'], 'subject' : 'Verify Your Account'},
+                                                                       'error' : "SMTPRecipientsRefused({'user@example.com': (550, b'No such user')})", 'attempts' : 1, 'failed_at' : '2025-08-08T12:00:00'}]},
+        'smtp' : {'size' : 2, 'idle' : 0, 'opened' : 0, 'reused' : 0, 'sent' : 0, 'failed' : 0}}}}},
+    403:{'description' : 'Forbidden Access', 'content':{'application/json' : {'example' :
+      {
+        'message' : "Token is invalid or expired"}}}}
+})
+def mail_queue_stats():  # a plain def, FastAPI runs it on the thread pool since the dead letter list is read with the blocking Redis client
+
+    return mail_stats()
@@ -0,0 +1,110 @@
+from sqlalchemy import tuple_
+from sqlmodel.sql.expression import SelectOfScalar
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from datetime import datetime, date
+from src.errors import InvalidCursor
+import base64
+import binascii
+import json
+import uuid
+
+
+def _json_default(value : Any):
+
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+
+    if isinstance(value, uuid.UUID):
+        return str(value)
+
+    raise TypeError(f'{type(value).__name__} can not be used in a cursor')
+
+
+def _from_json(value : Any, python_type : type):
+
+    if value is None:
+        return None
+
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+
+    if python_type is date:
+        return date.fromisoformat(value)
+
+    if python_type is uuid.UUID:
+        return uuid.UUID(value)
+
+    return python_type(value)
+
+
+def encode_cursor(values : Sequence[Any], scope : Optional[str] = None) -> str:
+    """
+    Packs the sort key of the last row of a page into an opaque url safe string.
+    A scope (e.g. the sort name) is stored with it so the cursor only continues the listing it came from
+    """
+
+    values = list(values) if scope is None else [scope, *values]
+
+    raw = json.dumps(values, default = _json_default, separators = (',', ':'))
+
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor : str, columns : Sequence, scope : Optional[str] = None) -> List[Any]:
+    """Unpacks a cursor made by encode_cursor back into typed values for the given columns"""
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+
+        values = json.loads(raw)
+
+        if scope is not None:
+            if not isinstance(values, list) or not values or values[0] != scope:
+                raise InvalidCursor()
+
+            values = values[1:]
+
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise InvalidCursor()
+
+        return [_from_json(value, column.type.python_type) for value, column in zip(values, columns)]
+
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise InvalidCursor()
+
+
+def keyset_paginate(statement : SelectOfScalar, columns : Sequence, cursor : Optional[str], limit : int, descending : bool = True, scope : Optional[str] = None) -> SelectOfScalar:
+    """
+    Orders the statement by `columns` and continues after the cursor with a row value
+    comparison, so an index on the same columns serves any page in O(page size).
+    One extra row is fetched to know whether there is a next page
+    """
+
+    if cursor is not None:
+        key = tuple_(*columns)
+        after = tuple_(*decode_cursor(cursor, columns, scope))
+
+        statement = statement.where(key < after if descending else key > after)
+
+    order = [column.desc() if descending else column.asc() for column in columns]
+
+    return statement.order_by(*order).limit(limit + 1)
+
+
+def keyset_page(rows : Sequence, columns : Sequence, limit : int, sort_key : Optional[Callable[[Any], List[Any]]] = None, scope : Optional[str] = None) -> Tuple[List, Optional[str]]:
+    """
+    Cuts the extra row fetched by keyset_paginate and builds the cursor of the next page.
+    `sort_key` returns the values of `columns` for a row, by default they are read as attributes
+    """
+
+    rows = list(rows)
+
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+
+    if sort_key is None:
+        sort_key = lambda row: [getattr(row, column.key) for column in columns]
+
+    return rows, encode_cursor(sort_key(rows[-1]), scope)
@@ -1,16 +1,20 @@
 from fastapi import APIRouter, Depends, status
+from fastapi.responses import JSONResponse
 from src.db.models import User
-from src.db.main import get_session
+from src.db.main import get_session, get_read_session
 from .structs import ReviewCreateModel, ReviewResponse
 from src.auth.dependencies import get_current_user, AccessTokenBearer
 from sqlmodel.ext.asyncio.session import AsyncSession
 from .services import ReviewService
 from fastapi.exceptions import HTTPException
-from typing import List
+from typing import FrozenSet, List, Optional
+from src.fields import FieldSelector, dump_fields
+from src.fast_json import FastJSONRoute
 
 review_service = ReviewService()
-review_router = APIRouter()
+review_router = APIRouter(route_class = FastJSONRoute)  # FAST_JSON skips response_model validation on these routes
 access_token_bearer = AccessTokenBearer()
+review_fields = Depends(FieldSelector(ReviewResponse))  # ?fields= of the review reads
 
 
 @review_router.post('/book/{book_id}',status_code = status.HTTP_201_CREATED, response_model = ReviewResponse, responses = {
@@ -33,13 +37,19 @@ async def add_review(book_id:str, review_data : ReviewCreateModel, current_user:
     500:{'description' : 'Internal Server Error', 'content':{'application/json' : {'example' : 
       {
         'message' : "Customized Error Message"}}}},
+    400:{'description' : 'Invalid Fields', 'content':{'application/json' : {'example' : 
+      {
+        'message' : "Unknown field requested in fields"}}}},
     403:{'description' : 'Forbidden Access', 'content':{'application/json' : {'example' : 
       {
         'message' : "Token is invalid or expired"}}}}
 })
-async def get_all_reviews(token_details = Depends(access_token_bearer),session : AsyncSession = Depends(get_session)):
+async def get_all_reviews(fields : Optional[FrozenSet[str]] = review_fields, token_details = Depends(access_token_bearer),session : AsyncSession = Depends(get_read_session)):
+
+    books = await review_service.get_all_reviews(session, fields = fields)
 
-    books = await review_service.get_all_reviews(session)
+    if fields is not None:
+        return JSONResponse(dump_fields(ReviewResponse, fields, books))
 
     return books
 
@@ -47,6 +57,9 @@ async def get_all_reviews(token_details = Depends(access_token_bearer),session :
     500:{'description' : 'Internal Server Error', 'content':{'application/json' : {'example' : 
       {
         'message' : "Customized Error Message"}}}},
+    400:{'description' : 'Invalid Fields', 'content':{'application/json' : {'example' : 
+      {
+        'message' : "Unknown field requested in fields"}}}},
     403:{'description' : 'Forbidden Access', 'content':{'application/json' : {'example' : 
       {
         'message' : "Token is invalid or expired"}}}},
@@ -54,9 +67,12 @@ async def get_all_reviews(token_details = Depends(access_token_bearer),session :
       {
         'message' : "Review not found"}}}}
 })
-async def get_review_by_id(review_id : str,  token_details = Depends(access_token_bearer), session : AsyncSession = Depends(get_session)):
+async def get_review_by_id(review_id : str, fields : Optional[FrozenSet[str]] = review_fields, token_details = Depends(access_token_bearer), session : AsyncSession = Depends(get_read_session)):
+
+    review = await review_service.get_review_by_id(review_id, session, fields = fields)
 
-    review = await review_service.get_review_by_id(review_id, session)
+    if fields is not None and review is not None:
+        return JSONResponse(dump_fields(ReviewResponse, fields, review))
 
     return review
 
@@ -1,11 +1,14 @@
 from src.db.models import Review
 from src.auth.services import UserService
 from src.books.services import BookService
+from src.cache import invalidate_book_detail
+from src.fields import load_fields
 from sqlmodel.ext.asyncio.session import AsyncSession 
 from .structs import ReviewCreateModel
 from fastapi.exceptions import HTTPException
 from fastapi import status
 from sqlmodel import select, desc
+from typing import FrozenSet, Optional
 
 
 book_service = BookService
@@ -45,8 +48,12 @@ class ReviewService:
 
             session.add(new_review)
 
+            await book_service.record_review(book_service, book.id, new_review.rating, session)  #committed together with the review
+
             await session.commit()
 
+            await invalidate_book_detail(book_id)
+
             return new_review
 
         except Exception as e:
@@ -55,10 +62,10 @@ class ReviewService:
                 detail = str(e)
             )
     
-    async def get_all_reviews(self, session : AsyncSession):
+    async def get_all_reviews(self, session : AsyncSession, fields : Optional[FrozenSet[str]] = None):
 
         try:
-            statement = select(Review).order_by(desc(Review.created_at))
+            statement = select(Review).options(*load_fields(Review, fields)).order_by(desc(Review.created_at))  #with ?fields= only those columns are read
 
             result = await session.exec(statement)
 
@@ -75,11 +82,11 @@ class ReviewService:
             )
     
 
-    async def get_review_by_id(self, review_id : str, session : AsyncSession):
+    async def get_review_by_id(self, review_id : str, session : AsyncSession, fields : Optional[FrozenSet[str]] = None):
 
         try:
             if review_id is not None:
-                statement = select(Review).where(Review.id == review_id)
+                statement = select(Review).where(Review.id == review_id).options(*load_fields(Review, fields))
 
                 result = await session.exec(statement)
 
@@ -117,8 +124,12 @@ class ReviewService:
 
                 await session.delete(review)
 
+                await book_service.record_review(book_service, review.book_id, review.rating, session, removed = True)
+
                 await session.commit()
 
+                await invalidate_book_detail(review.book_id)
+
                 return review
             
             else:
@@ -1,21 +1,24 @@
-from fastapi import APIRouter, Depends, status, HTTPException
+from fastapi import APIRouter, Depends, status, HTTPException, Request, Response
 from fastapi.responses import JSONResponse
 from src.auth.dependencies import AccessTokenBearer
 from .services import TagService
 from .structs import TagCreateRequest, TagAddRequest, TagResponse
 from src.books.structs import BookResponse,BookDetailResponse
 from sqlmodel.ext.asyncio.session import AsyncSession
-from src.db.main import get_session
+from src.db.main import get_session, get_read_session
 from typing import List
 from src.errors import TagNotFound, BookNotFound
+from src.etags import tag_list_etag, not_modified
+from src.fast_json import FastJSONRoute
 
-tag_router = APIRouter()
+tag_router = APIRouter(route_class = FastJSONRoute)  # FAST_JSON skips response_model validation on these routes
 tags_service = TagService()
 access_token_bearer = AccessTokenBearer()
 
 
 
 @tag_router.get('/', response_model = List[TagResponse], responses = {
+      304:{'description' : 'Not Modified, the tags still match the ETag sent in If-None-Match'},
       500:{'description' : 'Internal Server Error', 'content':{'application/json' : {'example' : 
       {
         'message' : "Customized Error"}}}},
@@ -24,10 +27,15 @@ access_token_bearer = AccessTokenBearer()
         'message' : "Token is invalid or expired"}}}}
     }
 )
-async def get_all_tags(token_details = Depends(access_token_bearer), session : AsyncSession = Depends(get_session)):
+async def get_all_tags(request : Request, response : Response, token_details = Depends(access_token_bearer), session : AsyncSession = Depends(get_read_session)):
     
     try:
         tags = await tags_service.get_all_tags(session)
+
+        unchanged = not_modified(request, response, tag_list_etag(tags))
+
+        if unchanged is not None:
+            return unchanged
     
         return tags
     
@@ -50,7 +58,7 @@ async def get_all_tags(token_details = Depends(access_token_bearer), session : A
         'message' : "Tag not found"}}}}
     }
   )
-async def get_tag_by_id(tag_id : str, token_details = Depends(access_token_bearer), session : AsyncSession = Depends(get_session)):
+async def get_tag_by_id(tag_id : str, token_details = Depends(access_token_bearer), session : AsyncSession = Depends(get_read_session)):
 
     tag = await tags_service.get_tag_by_id(tag_id,session)
 
@@ -1,10 +1,12 @@
 from sqlmodel import select, desc
+from sqlalchemy.orm import selectinload
 from src.db.models import Tag, BookTags
 from fastapi import status, HTTPException
 from fastapi.responses import JSONResponse
 from .structs import TagCreateRequest, TagAddRequest
 from sqlmodel.ext.asyncio.session import AsyncSession
-from src.books.services import BookService
+from src.books.services import BookService, BOOK_DETAIL_LOAD
+from src.cache import invalidate_book_detail
 from src.errors import TagNotFound, BookNotFound, TagAlreadyExists
 
 book_service = BookService()
@@ -79,7 +81,7 @@ class TagService:
     async def add_tag_to_book(self, book_id: str, tag_data: TagAddRequest, session: AsyncSession):
         
         try:
-            book = await book_service.get_book_by_id(book_id=book_id, session=session)
+            book = await book_service.get_book_by_id(book_id=book_id, session=session, options=BOOK_DETAIL_LOAD) #BookDetailResponse is returned
 
             if not book:
                 raise BookNotFound()
@@ -92,16 +94,18 @@ class TagService:
 
                 if not tag:
                     tag = Tag(name=tag_item.name)
-                    
-                book.tags.append(tag)
+
+                if tag not in book.tags:
+                    book.tags.append(tag)
 
             session.add(book)
 
-            await session.commit()
-            
-            await session.refresh(book)
+            await book_service.bump_version(book, session)
+
+            await session.commit() #objects are not expired on commit so the loaded reviews and tags are returned as they are
+
+            await invalidate_book_detail(book_id)
 
-                
             return book
         
         except Exception as e:
@@ -128,6 +132,16 @@ class TagService:
                     await session.commit()
 
                     await session.refresh(tag)
+
+                book_ids = await session.exec(select(BookTags.book_id).where(BookTags.tag_id == tag.id))
+
+                book_ids = book_ids.all()
+
+                await book_service.bump_versions(book_ids, session) #the details of tagged books show the old name
+
+                await session.commit()
+
+                await invalidate_book_detail(*book_ids)
                 
                 return tag
             
@@ -144,13 +158,23 @@ class TagService:
     
     async def delete_tag(self, tag_id : str, session : AsyncSession):
 
-        delete_tag = await self.get_tag_by_id(tag_id = tag_id, session = session)
+        statement = select(Tag).where(Tag.id == tag_id).options(selectinload(Tag.books)) #the flush has to see the tag's book links to clear them
+
+        result = await session.exec(statement)
+
+        delete_tag = result.first()
 
         if delete_tag is not None:
+            book_ids = [book.id for book in delete_tag.books]
+
+            await book_service.bump_versions(book_ids, session)
+
             await session.delete(delete_tag)
 
             await session.commit()
 
+            await invalidate_book_detail(*book_ids)
+
             return {'message' : 'Tag Successfully deleted'}
         else:
             raise TagNotFound()
@@ -1,8 +1,8 @@
-from src.db.main import get_session
-from src import app
+from src.db.main import get_session, get_read_session
+from src.main import app
 from src.auth.dependencies import AccessTokenBearer, RefreshTokenBearer, RoleChecker
 from fastapi.testclient import TestClient
-from unittest.mock import Mock
+from unittest.mock import AsyncMock, Mock, patch
 import pytest
 
 mock_session = Mock()
@@ -19,6 +19,7 @@ refresh_token_bearer = RefreshTokenBearer()
 role_checker = RoleChecker(['admin'])
 
 app.dependency_overrides[get_session] = get_session_mock # here we are overriding the get_session dependency with our mock session dependency
+app.dependency_overrides[get_read_session] = get_session_mock
 app.dependency_overrides[role_checker] = Mock()
 app.dependency_overrides[refresh_token_bearer] = Mock()
 
@@ -43,3 +44,12 @@ def test_client():
 
     return TestClient(app)
 
+
+@pytest.fixture
+def principals():
+    """user id -> Principal served to the role checks instead of the database"""
+
+    known = {}
+
+    with patch('src.auth.dependencies.user_service.get_principal', new = AsyncMock(side_effect = lambda user_id, session: known.get(user_id))):
+        yield known
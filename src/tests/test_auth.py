@@ -1,4 +1,10 @@
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, Mock, patch
+from passlib.hash import bcrypt
+from src.main import app
 from src.auth.structs import UserCreateModel
+from src.auth.calibrate import calibrate, MIN_ROUNDS
+import uuid
 
 
 auth_prefix = f'/api/v1/auth'
@@ -23,9 +29,29 @@ def test_user_create(fake_session, fake_user_service, test_client):
 
     user_data = UserCreateModel(**signup_data)
 
-    assert fake_user_service.user_exists_called_once()
-    assert fake_user_service.user_exists_called_once_with(signup_data['email'], fake_session)
-    
     assert fake_user_service.create_user_called_once()
     assert fake_user_service.create_user_called_once_with(user_data, fake_session)
-    
\ No newline at end of file
+    
+
+def test_login_rehashes_an_outdated_hash_after_the_response():
+
+    old_hash = bcrypt.using(rounds = 4).hash('PrimeToBe##1')  # another cost than BCRYPT_ROUNDS
+    user = Mock(id = uuid.uuid4(), email = 'rehash@bookly.com', role = 'user', password = old_hash)
+
+    with patch('src.auth.routes.user_service.get_user_by_email', new = AsyncMock(return_value = user)), \
+         patch('src.auth.routes.user_service.rehash_password', new = AsyncMock()) as rehash:
+
+        response = TestClient(app, base_url = 'http://localhost').post(url = f'{auth_prefix}/login', json = {'email' : user.email, 'password' : 'PrimeToBe##1'})
+
+    assert response.status_code == 200
+    rehash.assert_awaited_once_with(user.id, 'PrimeToBe##1', old_hash)
+
+
+def test_calibrate_recommends_a_cost_within_the_target():
+
+    recommended, timings = calibrate(target_ms = 20, samples = 1, max_rounds = 8)
+
+    measured = dict(timings)
+
+    assert MIN_ROUNDS <= recommended <= 8
+    assert recommended == MIN_ROUNDS or measured[recommended] <= 20
@@ -0,0 +1,259 @@
+from fastapi.testclient import TestClient
+from src.main import app
+from src.auth import blocklist as blocklist_module
+from src.auth.blocklist import BloomFilter, MemoryBlocklistBackend, TokenBlocklist, revocation_id
+from src.auth.utils import create_access_token, decode_token
+from src.auth.structs import Principal
+from datetime import timedelta
+import asyncio
+import time
+import uuid
+
+
+user_data = {'email' : 'admin@bookly.com', 'user_id' : '3fa85f64-5717-4562-b3fc-2c963f66afa6', 'role' : 'admin'}
+
+
+class CountingBackend(MemoryBlocklistBackend):
+
+    def __init__(self):
+        super().__init__()
+        self.lookups = 0
+
+    async def exists(self, jti : str) -> bool:
+        self.lookups += 1
+        return await super().exists(jti)
+
+
+class FailingBackend(MemoryBlocklistBackend):
+    """Store that goes down once `down` is set"""
+
+    def __init__(self):
+        super().__init__()
+        self.down = False
+
+    async def exists(self, jti : str) -> bool:
+        if self.down:
+            raise ConnectionError('store is down')
+        return await super().exists(jti)
+
+    async def members(self) -> list:
+        if self.down:
+            raise ConnectionError('store is down')
+        return await super().members()
+
+
+class Clock:
+    """time of the blocklist module, monotonic() only moves when the test moves it"""
+
+    def __init__(self):
+        self.elapsed = 0.0
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return 1000.0 + self.elapsed
+
+
+class LoadCountingBackend(MemoryBlocklistBackend):
+
+    def __init__(self):
+        super().__init__()
+        self.loads = 0
+
+    async def members(self) -> list:
+        self.loads += 1
+        return await super().members()
+
+
+def test_every_token_gets_its_own_jti():
+
+    first, second = decode_token(create_access_token(user_data)), decode_token(create_access_token(user_data))
+
+    assert first['jti'] != second['jti']
+    assert revocation_id(first) == str(uuid.UUID(first['jti']))
+
+
+def test_bloom_filter_has_no_false_negatives():
+
+    bloom = BloomFilter(capacity = 1000, error_rate = 0.01)
+    added = [str(uuid.uuid4()) for _ in range(1000)]
+
+    for item in added:
+        bloom.add(item)
+
+    assert all(item in bloom for item in added)
+    assert sum(str(uuid.uuid4()) in bloom for _ in range(10000)) < 300
+
+
+def test_bloom_filter_counts_an_item_once():
+
+    bloom = BloomFilter(capacity = 10, error_rate = 0.01)
+
+    for _ in range(3):
+        bloom.add('jti')
+
+    assert bloom.count == 1
+
+
+def test_more_revocations_than_capacity_do_not_reload_per_request():
+
+    backend = LoadCountingBackend()
+    blocklist = TokenBlocklist(backend, capacity = 8)
+    revoked = [decode_token(create_access_token(user_data)) for _ in range(20)]
+    other = decode_token(create_access_token(user_data))
+
+    async def check():
+        for token_data in revoked:
+            await blocklist.revoke(token_data)
+
+        for _ in range(50):
+            await blocklist.is_revoked(other)
+
+        loads = backend.loads
+
+        for token_data in revoked:
+            await blocklist.revoke(token_data)  # the same revocations again, e.g. pub/sub redelivering them
+
+        for _ in range(50):
+            await blocklist.is_revoked(other)
+
+        return loads, all([await blocklist.is_revoked(token_data) for token_data in revoked])
+
+    assert asyncio.run(check()) == (1, True)
+    assert backend.loads == 1
+    assert blocklist.bloom.capacity == 40 and blocklist.bloom.count == 20
+
+
+def test_full_filter_is_rebuilt_at_most_every_interval(monkeypatch):
+
+    backend = LoadCountingBackend()
+    blocklist = TokenBlocklist(backend, capacity = 8)
+    clock = Clock()
+    monkeypatch.setattr(blocklist_module, 'time', clock)
+
+    async def check():
+        await blocklist.sync()
+
+        for _ in range(10):  # fills the filter sized for the empty store
+            await blocklist.revoke(decode_token(create_access_token(user_data)))
+
+        for _ in range(5):
+            await blocklist.sync()
+
+        before = backend.loads
+
+        clock.elapsed += blocklist_module.REBUILD_INTERVAL
+
+        for _ in range(5):
+            await blocklist.sync()
+
+        return before, backend.loads
+
+    assert asyncio.run(check()) == (1, 2)
+    assert blocklist.bloom.capacity == 20
+
+
+def test_revoked_token_is_rejected_and_others_skip_the_store():
+
+    backend = CountingBackend()
+    blocklist = TokenBlocklist(backend)
+    revoked, other = decode_token(create_access_token(user_data)), decode_token(create_access_token(user_data))
+
+    async def check():
+        await blocklist.revoke(revoked)
+
+        return await blocklist.is_revoked(revoked), await blocklist.is_revoked(other)
+
+    assert asyncio.run(check()) == (True, False)
+    assert backend.lookups == 1  # only the filter hit was confirmed
+    assert blocklist.stats()['filtered'] == 1
+
+
+def test_blocklist_entry_lives_as_long_as_the_token():
+
+    backend = MemoryBlocklistBackend()
+    token = decode_token(create_access_token(user_data, expiry = timedelta(seconds = 600)))
+
+    asyncio.run(TokenBlocklist(backend).revoke(token))
+
+    assert 595 <= backend.entries[revocation_id(token)] - time.monotonic() <= 601
+
+
+def test_revocations_reach_other_workers():
+
+    backend = MemoryBlocklistBackend()
+    first, second = TokenBlocklist(backend), TokenBlocklist(backend)
+    earlier, later = decode_token(create_access_token(user_data)), decode_token(create_access_token(user_data))
+
+    async def check():
+        await first.revoke(earlier)
+        await second.sync()  # loads the revocations made so far and follows the next ones
+        await first.revoke(later)
+
+        return await second.is_revoked(earlier), revocation_id(later) in second.bloom
+
+    assert asyncio.run(check()) == (True, True)
+
+
+def test_store_outage_rejects_what_the_filter_can_not_rule_out():
+
+    backend = FailingBackend()
+    blocklist, unloaded = TokenBlocklist(backend), TokenBlocklist(backend)
+    revoked, other = decode_token(create_access_token(user_data)), decode_token(create_access_token(user_data))
+
+    async def check():
+        await blocklist.revoke(revoked)
+        await blocklist.sync()
+
+        backend.down = True
+
+        return await blocklist.is_revoked(revoked), await blocklist.is_revoked(other), await unloaded.is_revoked(other)
+
+    assert asyncio.run(check()) == (True, False, True)  # the failed reload kept the loaded filter, the other worker never had one
+    assert blocklist.stats()['errors'] == 2
+
+
+def test_store_outage_lets_everything_through_when_failing_open():
+
+    backend = FailingBackend()
+    blocklist = TokenBlocklist(backend, fail_open = True)
+    revoked = decode_token(create_access_token(user_data))
+
+    async def check():
+        await blocklist.revoke(revoked)
+
+        backend.down = True
+
+        return await blocklist.is_revoked(revoked)
+
+    assert asyncio.run(check()) is False
+
+
+def test_logout_revokes_access_and_refresh_tokens(principals):
+
+    principals[user_data['user_id']] = Principal(id = user_data['user_id'], role = 'admin', is_verified = True)
+    client = TestClient(app, base_url = 'http://localhost')
+    access = create_access_token(user_data)
+    refresh = create_access_token({'email' : user_data['email'], 'user_id' : user_data['user_id']}, refresh = True)
+
+    assert client.get('/api/v1/metrics/db-pool', headers = {'Authorization' : f'Bearer {access}'}).status_code == 200
+
+    response = client.post('/api/v1/auth/logout', json = {'refresh_token' : refresh}, headers = {'Authorization' : f'Bearer {access}'})
+
+    assert response.status_code == 200
+    assert client.get('/api/v1/metrics/db-pool', headers = {'Authorization' : f'Bearer {access}'}).status_code == 401
+    assert client.get('/api/v1/auth/refresh-token', headers = {'Authorization' : f'Bearer {refresh}'}).status_code == 401
+
+
+def test_logout_rejects_a_refresh_token_of_another_user(principals):
+
+    principals[user_data['user_id']] = Principal(id = user_data['user_id'], role = 'admin', is_verified = True)
+    client = TestClient(app, base_url = 'http://localhost')
+    access = create_access_token(user_data)
+    refresh = create_access_token({'email' : 'other@bookly.com', 'user_id' : str(uuid.uuid4())}, refresh = True)
+
+    response = client.post('/api/v1/auth/logout', json = {'refresh_token' : refresh}, headers = {'Authorization' : f'Bearer {access}'})
+
+    assert response.status_code == 403
+    assert client.get('/api/v1/metrics/db-pool', headers = {'Authorization' : f'Bearer {access}'}).status_code == 200
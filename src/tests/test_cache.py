@@ -0,0 +1,114 @@
+from src.cache import Cache, MemoryBackend, book_detail_key, book_generation_key, invalidate_book_detail, cache
+from src.books.services import BookService
+from src.db.models import Book
+from unittest.mock import AsyncMock, Mock, patch
+from datetime import date, datetime
+import asyncio
+import uuid
+
+
+def test_memory_backend_expires_and_evicts():
+
+    backend = MemoryBackend(max_entries = 2)
+
+    async def run():
+        with patch('src.cache.time.monotonic', return_value = 100.0):
+            await backend.set('a', '1', ttl = 10)
+            await backend.set('b', '2', ttl = 60)
+            await backend.set('c', '3', ttl = 60)  # evicts a, the oldest entry
+
+            assert await backend.get('a') is None
+            assert await backend.get('b') == '2'
+
+        with patch('src.cache.time.monotonic', return_value = 161.0):
+            assert await backend.get('b') is None
+
+    asyncio.run(run())
+
+
+def test_cache_counts_hits_and_misses():
+
+    counted = Cache(MemoryBackend())
+
+    async def run():
+        assert await counted.get('key') is None
+
+        await counted.set('key', 'value', ttl = 60)
+
+        assert await counted.get('key') == 'value'
+
+    asyncio.run(run())
+
+    assert counted.stats() == {'backend' : 'memory', 'hits' : 1, 'misses' : 1, 'errors' : 0, 'hit_ratio' : 0.5}
+
+
+def test_invalidate_book_detail():
+
+    async def current(book_id):
+        return await cache.get_current(book_detail_key(book_id), book_generation_key(book_id), ttl = 60)
+
+    async def run():
+        for book_id in ('one', 'two'):
+            value, generation = await current(book_id)
+            await cache.set_current(book_detail_key(book_id), generation, '{}', ttl = 60)
+
+            assert (await current(book_id))[0] == '{}'
+
+        await invalidate_book_detail('one', 'two')
+
+        assert (await current('one'))[0] is None
+        assert (await current('two'))[0] is None
+
+    asyncio.run(run())
+
+
+def test_book_detail_is_cached_from_the_primary_only():
+
+    book = Book(id = uuid.uuid4(), title = 'Cached', author = 'Bookly', published_date = date(2020, 1, 1), page_count = 1, language = 'en',
+                user_id = uuid.uuid4(), version = 1, review_count = 0, rating_sum = 0, rating_avg = 0, created_at = datetime(2025, 1, 1), updated_at = datetime(2025, 1, 1))
+    book.reviews, book.tags = [], []
+
+    fresh = Cache(MemoryBackend())
+
+    async def read(session):
+        return await BookService().get_book_detail(str(book.id), session)
+
+    async def cached():
+        return (await fresh.get_current(book_detail_key(book.id), book_generation_key(book.id), ttl = 60))[0]
+
+    with patch('src.books.services.cache', fresh), patch.object(BookService, 'get_book_by_id', new = AsyncMock(return_value = book)):
+        asyncio.run(read(Mock(info = {'replica' : True})))  # a replica may still serve the row a write just invalidated
+
+        assert asyncio.run(cached()) is None
+
+        asyncio.run(read(Mock(info = {})))
+
+        assert asyncio.run(cached()) is not None
+
+
+def test_book_detail_read_racing_a_write_is_not_served():
+
+    book = Book(id = uuid.uuid4(), title = 'Before', author = 'Bookly', published_date = date(2020, 1, 1), page_count = 1, language = 'en',
+                user_id = uuid.uuid4(), version = 1, review_count = 0, rating_sum = 0, rating_avg = 0, created_at = datetime(2025, 1, 1), updated_at = datetime(2025, 1, 1))
+    book.reviews, book.tags = [], []
+
+    fresh = Cache(MemoryBackend())
+
+    async def committed_meanwhile(service, book_id, session, options = ()):
+        await invalidate_book_detail(book_id)  # a write commits while the old row is on its way
+        return book
+
+    async def read():
+        return await BookService().get_book_detail(str(book.id).upper(), Mock(info = {}))
+
+    with patch('src.books.services.cache', fresh), patch('src.cache.cache', fresh):
+        with patch.object(BookService, 'get_book_by_id', new = committed_meanwhile):
+            assert asyncio.run(read()).title == 'Before'
+
+        book.title = 'After'
+
+        with patch.object(BookService, 'get_book_by_id', new = AsyncMock(return_value = book)) as load:
+            assert asyncio.run(read()).title == 'After'  # the old row was cached under the old generation
+            assert asyncio.run(read()).title == 'After'
+
+        assert load.await_count == 1
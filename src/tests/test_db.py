@@ -0,0 +1,113 @@
+from src.db.main import ReplicaRouter, RecentWrites, MonitoredQueuePool, is_replica_session
+from sqlalchemy.util import await_only, greenlet_spawn
+from types import SimpleNamespace
+from unittest.mock import Mock
+import asyncio
+
+
+class FakeSession:
+
+    def __init__(self, name : str, healthy : bool = True):
+        self.name = name
+        self.healthy = healthy
+        self.closed = False
+        self.info = {}
+
+    async def connection(self):
+
+        if not self.healthy:
+            raise OSError('connection refused')
+
+    async def close(self):
+
+        self.closed = True
+
+
+def fake_request(user_id : str = None):
+
+    token_data = {'user' : {'user_id' : user_id}} if user_id else None
+
+    return SimpleNamespace(state = SimpleNamespace(token_data = token_data))
+
+
+def test_replicas_are_used_round_robin():
+
+    router = ReplicaRouter(
+        session_makers = [lambda: FakeSession('a'), lambda: FakeSession('b')],
+        retry_after = 30
+    )
+
+    sessions = [asyncio.run(router.connect()) for _ in range(4)]
+
+    assert [session.name for session in sessions] == ['a', 'b', 'a', 'b']
+    assert all(is_replica_session(session) for session in sessions)
+
+
+def test_unhealthy_replica_is_skipped():
+
+    router = ReplicaRouter(
+        session_makers = [lambda: FakeSession('a', healthy = False), lambda: FakeSession('b')],
+        retry_after = 30
+    )
+
+    names = [asyncio.run(router.connect()).name for _ in range(3)]
+
+    assert names == ['b', 'b', 'b']
+    assert router.unhealthy_until[0] > 0
+
+
+def test_no_healthy_replica_falls_back_to_primary():
+
+    router = ReplicaRouter(
+        session_makers = [lambda: FakeSession('a', healthy = False)],
+        retry_after = 30
+    )
+
+    assert asyncio.run(router.connect()) is None
+    assert asyncio.run(ReplicaRouter([], retry_after = 30).connect()) is None
+
+
+def test_read_your_writes_window():
+
+    writes = RecentWrites(window = 5)
+
+    writes.mark(fake_request('user-1'))
+
+    assert writes.is_recent(fake_request('user-1'))
+    assert not writes.is_recent(fake_request('user-2'))
+    assert not writes.is_recent(fake_request())
+
+    disabled = RecentWrites(window = 0)
+
+    disabled.mark(fake_request('user-1'))
+
+    assert not disabled.is_recent(fake_request('user-1'))
+
+
+def test_pool_counts_only_blocked_callers_as_waiting():
+
+    def connect():
+        await_only(asyncio.sleep(0.05))  # opening a connection takes a round trip, like asyncpg
+        return Mock()
+
+    pool = MonitoredQueuePool(connect, pool_size = 1, max_overflow = 0, timeout = 5)
+
+    async def checkouts():
+        opening = asyncio.create_task(greenlet_spawn(pool.connect))  # the pool has room, it opens a connection
+        await asyncio.sleep(0.01)
+
+        waiting_while_opening = pool.waiting
+
+        first = await opening
+        blocked = asyncio.create_task(greenlet_spawn(pool.connect))  # the only connection is checked out
+        await asyncio.sleep(0.01)
+
+        waiting_while_blocked = pool.waiting
+
+        await greenlet_spawn(first.close)
+        await greenlet_spawn((await blocked).close)
+
+        return waiting_while_opening, waiting_while_blocked
+
+    assert asyncio.run(checkouts()) == (0, 1)
+    assert pool.waiting == 0
@@ -0,0 +1,36 @@
+from src.etags import book_etag, book_page_etag, etag_matches, if_match_versions
+from types import SimpleNamespace
+import uuid
+import pytest
+
+
+book = SimpleNamespace(id = uuid.uuid4(), version = 3)
+
+
+@pytest.mark.parametrize('header, weak, expected', [
+    (None, True, False),
+    ('*', True, True),
+    (f'"other", {book_etag(book)}', True, True),
+    (f'W/{book_etag(book)}', True, True),
+    (f'W/{book_etag(book)}', False, False),
+    (f'"{book.id}-2"', True, False),
+])
+def test_etag_matches(header, weak, expected):
+
+    assert etag_matches(header, book_etag(book), weak = weak) is expected
+
+
+def test_if_match_versions():
+
+    assert if_match_versions(None, book.id) is None
+    assert if_match_versions('*', book.id) is None
+    assert if_match_versions(f'{book_etag(book)}, "{book.id}-5", "{uuid.uuid4()}-7"', book.id) == [3, 5]
+    assert if_match_versions(f'W/{book_etag(book)}', book.id) == []
+
+
+def test_book_page_etag_follows_versions():
+
+    newer = SimpleNamespace(id = book.id, version = 4)
+
+    assert book_page_etag({'books' : [book], 'next_cursor' : None}) != book_page_etag({'books' : [newer], 'next_cursor' : None})
+    assert book_page_etag({'books' : [book], 'next_cursor' : None}) == book_page_etag({'books' : [book], 'next_cursor' : None})
@@ -0,0 +1,29 @@
+from src.books.exporter import encode_ndjson, encode_csv, COLUMNS
+from collections import namedtuple
+from datetime import datetime, date
+import csv
+import io
+import json
+import uuid
+
+
+ExportRow = namedtuple('ExportRow', COLUMNS)
+
+row = ExportRow(uuid.uuid4(), 'Title, with comma', 'Bookly', date(2020, 1, 2), 100, 'en', uuid.uuid4(), datetime(2025, 8, 8, 12, 30), datetime(2025, 8, 8, 12, 30), 3, 1)
+
+
+def test_encode_ndjson():
+
+    lines = encode_ndjson([row, row]).splitlines()
+
+    assert len(lines) == 2
+    assert json.loads(lines[0]) == {**row._asdict(), 'id' : str(row.id), 'user_id' : str(row.user_id), 'published_date' : '2020-01-02', 'created_at' : '2025-08-08T12:30:00', 'updated_at' : '2025-08-08T12:30:00'}
+
+
+def test_encode_csv():
+
+    header, values = list(csv.reader(io.StringIO(encode_csv([row], header = True))))
+
+    assert header == list(COLUMNS)
+    assert values[:4] == [str(row.id), 'Title, with comma', 'Bookly', '2020-01-02']
+    assert values[-2:] == ['3', '1']
@@ -0,0 +1,76 @@
+from fastapi import APIRouter, FastAPI, Response, status
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+from src.fast_json import FastJSONRoute
+from src.books.structs import BookPage, BookDetailResponse, BookSearchPage
+from src.reviews.structs import ReviewResponse
+from src.tags.structs import TagResponse
+from src.db.models import Book, Review, Tag
+from src.config import Config
+from datetime import date, datetime
+from typing import List
+import uuid
+
+
+def make_book(i : int) -> Book:
+
+    book = Book(
+        id = uuid.uuid4(), title = f'Book {i} – “ünïcode”', author = 'Bookly', published_date = date(2020, 1, i % 28 + 1),
+        page_count = 100 + i, language = 'en', user_id = uuid.uuid4(), version = i + 1, review_count = i, rating_sum = 3 * i,
+        created_at = datetime(2025, 1, 1, 12, 0, i % 60, i * 1000), updated_at = datetime(2025, 1, 2)
+    )
+    book.rating_avg = 3 if i else 0  # an int where the schema wants a float, as the default path writes 3.0
+    book.reviews = [Review(id = uuid.uuid4(), rating = 4, review = 'Good\n"quoted"', user_id = None, book_id = book.id, created_at = datetime(2025, 3, 1, 8, 30, 0, 250), updated_at = datetime(2025, 3, 1))]
+    book.tags = [Tag(id = uuid.uuid4(), name = 'scifi', created_at = datetime(2024, 12, 31, 23, 59, 59, 999999))]
+
+    return book
+
+
+books = [make_book(i) for i in range(5)]
+
+
+def build_app(route_class) -> FastAPI:
+
+    router = APIRouter(route_class = route_class)
+
+    @router.get('/books', response_model = BookPage)
+    async def page(response : Response):
+        response.headers['ETag'] = '"page"'
+        return {'books' : books, 'next_cursor' : 'abc'}
+
+    @router.get('/search', response_model = BookSearchPage)
+    async def search():
+        return {'books' : books[:2], 'next_cursor' : None, 'took_ms' : 1.25}
+
+    @router.get('/book', response_model = BookDetailResponse)
+    async def detail():
+        return books[1]
+
+    @router.post('/reviews', status_code = status.HTTP_201_CREATED, response_model = List[ReviewResponse])
+    async def reviews():
+        return [review for book in books for review in book.reviews]
+
+    @router.get('/tag', response_model = TagResponse)
+    async def tag():
+        return Response(status_code = status.HTTP_304_NOT_MODIFIED)
+
+    app = FastAPI()
+    app.include_router(router)
+
+    return app
+
+
+def test_fast_json_matches_default_output(monkeypatch):
+
+    default = TestClient(build_app(APIRoute))
+
+    monkeypatch.setattr(Config, 'FAST_JSON', True)
+    fast = TestClient(build_app(FastJSONRoute))
+
+    for method, url in [('GET', '/books'), ('GET', '/search'), ('GET', '/book'), ('POST', '/reviews'), ('GET', '/tag')]:
+        expected = default.request(method, url)
+        actual = fast.request(method, url)
+
+        assert actual.status_code == expected.status_code
+        assert actual.content == expected.content, url
+        assert actual.headers == expected.headers
@@ -0,0 +1,41 @@
+from src.fields import FieldSelector, load_fields, dump_fields
+from src.books.structs import BookDetailResponse
+from src.auth.structs import UserBooks
+from src.db.models import Book
+from src.errors import InvalidFields
+from datetime import datetime
+from types import SimpleNamespace
+import uuid
+import pytest
+
+
+def test_field_selector():
+
+    select_fields = FieldSelector(UserBooks)
+
+    assert select_fields(None) is None
+    assert select_fields(' ') is None
+    assert select_fields('id, username,') == {'id', 'username'}
+
+    for fields in ('id,nope', 'password', ','):
+        with pytest.raises(InvalidFields):
+            select_fields(fields)
+
+
+def test_load_fields_adds_keys_and_requested_relations():
+
+    options = load_fields(Book, frozenset({'title', 'tags'}), always = ('id', 'version'))
+
+    assert len(options) == 2  # load_only and one selectinload, reviews are not loaded
+
+    assert load_fields(Book, None) == ()
+
+
+def test_dump_fields_nested():
+
+    tag = SimpleNamespace(id = uuid.uuid4(), name = 'scifi', created_at = datetime(2025, 1, 1))
+    book = SimpleNamespace(id = uuid.uuid4(), title = 'Dune', tags = [tag])  # only what was loaded
+
+    assert dump_fields(BookDetailResponse, frozenset({'title', 'tags'}), [book]) == [
+        {'title' : 'Dune', 'tags' : [{'id' : str(tag.id), 'name' : 'scifi', 'created_at' : '2025-01-01T00:00:00'}]}
+    ]
@@ -0,0 +1,80 @@
+from src.books import importer
+from unittest.mock import AsyncMock
+import asyncio
+import json
+import uuid
+
+
+async def chunked(data : bytes, size : int = 7):
+
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def run_import(monkeypatch, data : bytes, file_format : str, batch_size : int = 2, max_errors : int = 10, rejected : tuple = ()):
+    """The database stand-in rejects any batch holding a row titled as in `rejected`"""
+
+    batches = []
+
+    async def bulk_insert(rows, session):
+        for row in rows:
+            if row['title'] in rejected:
+                raise ValueError(f'value too long for {row["title"]}')
+
+        batches.append(list(rows))
+
+    monkeypatch.setattr(importer.book_service, 'bulk_insert', bulk_insert)
+
+    report = asyncio.run(importer.import_books(chunked(data), file_format, str(uuid.uuid4()), AsyncMock(), batch_size = batch_size, max_errors = max_errors))
+
+    return report, batches
+
+
+def book(title : str, **overrides) -> dict:
+
+    return {'title' : title, 'author' : 'Bookly', 'page_count' : 100, 'language' : 'en', 'published_date' : '2020-01-01', **overrides}
+
+
+def test_ndjson_import_reports_bad_rows(monkeypatch):
+
+    lines = [json.dumps(book('One')), '{oops', json.dumps(book('Two', page_count = 'many')), '', json.dumps(book('Three')), json.dumps(book('Four'))]
+
+    report, batches = run_import(monkeypatch, '\n'.join(lines).encode(), 'ndjson')
+
+    assert report['imported'] == 3
+    assert [error['line'] for error in report['errors']] == [2, 3]
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert [row['title'] for batch in batches for row in batch] == ['One', 'Three', 'Four']
+
+
+def test_csv_import_handles_quoted_newlines(monkeypatch):
+
+    data = 'title,author,page_count,language,published_date\r\n"Two\nLines",Bookly,10,en,2020-01-01\r\nShort,row\r\nBad,Bookly,10,en,01/01/2020\r\n'
+
+    report, batches = run_import(monkeypatch, data.encode('utf-8-sig'), 'csv')
+
+    assert report['imported'] == 1
+    assert batches[0][0]['title'] == 'Two\nLines'
+    assert [error['line'] for error in report['errors']] == [4, 5]
+
+
+def test_error_report_is_capped(monkeypatch):
+
+    data = '\n'.join(['not json'] * 5).encode()
+
+    report, batches = run_import(monkeypatch, data, 'ndjson', max_errors = 2)
+
+    assert report['failed'] == 5
+    assert len(report['errors']) == 2
+    assert report['truncated_errors'] is True
+
+
+def test_rejected_batch_reports_only_its_bad_rows(monkeypatch):
+
+    lines = [json.dumps(book(title)) for title in ('One', 'Two', 'Bad', 'Four', 'Five', 'Worse', 'Seven')]
+
+    report, batches = run_import(monkeypatch, '\n'.join(lines).encode(), 'ndjson', batch_size = 4, rejected = ('Bad', 'Worse'))
+
+    assert report['imported'] == 5 and report['failed'] == 2
+    assert report['errors'] == [{'line' : 3, 'error' : 'rejected by the database: value too long for Bad'}, {'line' : 6, 'error' : 'rejected by the database: value too long for Worse'}]
+    assert sorted(row['title'] for batch in batches for row in batch) == ['Five', 'Four', 'One', 'Seven', 'Two']
@@ -0,0 +1,22 @@
+from unittest.mock import patch
+from src.mail import create_message, create_messages
+from src import mail as mail_module
+
+
+def test_templates_are_compiled_once():
+
+    with patch.object(mail_module.template_env.loader, 'get_source') as get_source:
+        message = create_message(receipients = ['reader@bookly.com'], subject = 'Verify Your Account', template_name = 'verify_email.html', template_body = {'link' : 'http://localhost/verify/a?b&c'})
+
+    get_source.assert_not_called()  # neither the template nor base.html it extends is read again
+    assert 'Verify Your Email' in message.body
+    assert 'href="http://localhost/verify/a?b&amp;c"' in message.body  # autoescaped
+    assert message.template_body == {'link' : 'http://localhost/verify/a?b&c'}
+
+
+def test_create_messages_renders_one_message_per_recipient():
+
+    messages = create_messages(subject = 'Welcome', template_name = 'welcome.html', messages = [([f'reader{i}@bookly.com'], {'email' : f'reader{i}@bookly.com'}) for i in range(3)])
+
+    assert [message.recipients for message in messages] == [[f'reader{i}@bookly.com'] for i in range(3)]
+    assert all(f'Hi reader{i}@bookly.com' in message.body for i, message in enumerate(messages))
@@ -0,0 +1,169 @@
+from aiosmtpd.controller import Controller
+from fastapi import BackgroundTasks
+from unittest.mock import patch
+from src.mail import create_message
+from src import mail_queue
+from src.mail_queue import SMTPPool, MemoryDeadLetters, send_mail, queue_mail, message_payload, retry_delay
+from src.config import Config
+import asyncio
+import pytest
+import socket
+
+
+class RecordingHandler:
+    """Stand-in SMTP server, answers DATA from `replies` in order and accepts once they run out"""
+
+    def __init__(self):
+
+        self.messages = []
+        self.peers = []
+        self.replies = []
+
+    async def handle_DATA(self, server, session, envelope):
+
+        if self.replies:
+            return self.replies.pop(0)
+
+        self.messages.append(envelope)
+        self.peers.append(session.peer)
+
+        return '250 Message accepted for delivery'
+
+
+@pytest.fixture
+def smtp_server():
+
+    with socket.socket() as probe:  # a free port, the controller can not be started on port 0
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname = '127.0.0.1', port = port)
+    controller.start()
+
+    pool = SMTPPool(controller.hostname, controller.port, starttls = False, size = 1, max_messages = 3)
+    dead_letters = MemoryDeadLetters(10)
+
+    with patch.object(mail_queue, 'smtp_pool', pool), patch.object(mail_queue, 'dead_letters', dead_letters):
+        yield handler, pool, dead_letters
+
+    pool.close_all()
+    controller.stop()
+
+
+def payloads(count : int) -> list:
+
+    return [message_payload(create_message(receipients = [f'reader{i}@bookly.com'], subject = f'Message {i}', body = f'<p>{i}</p>')) for i in range(count)]
+
+
+def test_messages_share_a_pooled_connection(smtp_server):
+
+    handler, pool, dead_letters = smtp_server
+
+    send_mail.apply(args = (payloads(2),))
+    send_mail.apply(args = (payloads(1),))  # reuses the connection of the first task
+    send_mail.apply(args = (payloads(2),))  # the connection reached max_messages, a new one is opened
+
+    assert len(handler.messages) == 5
+    assert len(set(handler.peers[:3])) == 1 and handler.peers[3] != handler.peers[2]
+    assert pool.stats() == {'size' : 1, 'idle' : 1, 'opened' : 2, 'reused' : 1, 'sent' : 5, 'failed' : 0}
+    assert handler.messages[0].rcpt_tos == ['reader0@bookly.com']
+    assert f'From: {Config.MAIL_FROM_NAME} <{Config.MAIL_FROM}>' in handler.messages[0].content.decode()
+
+
+def test_refused_for_now_is_retried(smtp_server):
+
+    handler, pool, dead_letters = smtp_server
+
+    handler.replies = ['451 Try again later', '451 Try again later']
+
+    batch = payloads(2)
+
+    send_mail.apply(args = (batch,))  # eager, every retry runs right away
+
+    assert [message.content.decode().count(payload['message_id']) for message, payload in zip(handler.messages, batch)] == [1, 1]
+    assert dead_letters.size() == 0
+
+
+def test_refused_for_good_is_dead_lettered(smtp_server):
+
+    handler, pool, dead_letters = smtp_server
+
+    handler.replies = ['550 No such user']
+
+    batch = payloads(2)
+
+    send_mail.apply(args = (batch,))
+
+    assert len(handler.messages) == 1
+    assert dead_letters.size() == 1
+
+    entry = dead_letters.recent(1)[0]
+
+    assert entry['message']['message_id'] == batch[0]['message_id']
+    assert entry['attempts'] == 1 and '550' in entry['error']
+
+
+def test_dead_lettered_when_retries_run_out(smtp_server):
+
+    handler, pool, dead_letters = smtp_server
+
+    handler.replies = ['451 Try again later'] * (send_mail.max_retries + 1)
+
+    send_mail.apply(args = (payloads(1),))
+
+    assert handler.messages == []
+    assert dead_letters.recent(1)[0]['attempts'] == send_mail.max_retries + 1
+
+
+def test_unreachable_server_is_retried():
+
+    pool = SMTPPool('127.0.0.1', 1, starttls = False)  # nothing listens on port 1
+
+    dead_letters = MemoryDeadLetters(10)
+
+    batch = payloads(2)
+
+    with patch.object(mail_queue, 'smtp_pool', pool), patch.object(mail_queue, 'dead_letters', dead_letters):
+        assert mail_queue.deliver(batch, attempt = 1, final = False) == batch
+
+    assert pool.stats()['failed'] == 2
+    assert dead_letters.size() == 0
+
+
+def test_queue_mail_without_broker_sends_after_the_response(smtp_server):
+
+    handler, pool, dead_letters = smtp_server
+
+    background_tasks = BackgroundTasks()
+
+    with patch.object(Config, 'CELERY_BROKER_URL', ''), patch.object(send_mail, 'apply_async') as publish:
+        asyncio.run(queue_mail(background_tasks, create_message(receipients = ['reader@bookly.com'], subject = 'Hi', body = '<p>Hi</p>')))
+
+        assert handler.messages == []
+
+        asyncio.run(background_tasks())
+
+    publish.assert_not_called()
+    assert len(handler.messages) == 1
+
+
+def test_queue_mail_publishes_one_task():
+
+    background_tasks = BackgroundTasks()
+
+    with patch.object(Config, 'CELERY_BROKER_URL', 'redis://localhost:6379/1'), patch.object(send_mail, 'apply_async') as publish:
+        asyncio.run(queue_mail(background_tasks, *[create_message(receipients = [f'reader{i}@bookly.com'], subject = 'Hi', body = '<p>Hi</p>') for i in range(2)]))
+
+    sent = publish.call_args.kwargs['args'][0]
+
+    assert [payload['recipients'] for payload in sent] == [['reader0@bookly.com'], ['reader1@bookly.com']]
+    assert background_tasks.tasks == []
+
+
+def test_retry_delay_doubles():
+
+    with patch.object(Config, 'MAIL_RETRY_BACKOFF', 30):
+        assert 24 <= retry_delay(0) <= 36
+        assert 96 <= retry_delay(2) <= 144
+        assert retry_delay(20) <= mail_queue.MAX_RETRY_DELAY * 1.2
@@ -0,0 +1,81 @@
+from fastapi.testclient import TestClient
+from src.main import app
+from src.auth.utils import create_access_token
+from src.auth.structs import Principal
+import pytest
+
+
+metrics_prefix = '/api/v1/metrics'
+
+
+USER_IDS = {'admin' : '3fa85f64-5717-4562-b3fc-2c963f66afa6', 'user' : '8d1c2f0e-4b7a-4c55-9e0f-2a6b1f3d9c71'}
+
+
+@pytest.fixture(autouse = True)
+def stored_roles(principals):
+
+    for role, user_id in USER_IDS.items():
+        principals[user_id] = Principal(id = user_id, role = role, is_verified = True)
+
+    return principals
+
+
+def make_token(role : str, user_id : str = None) -> str:
+
+    return create_access_token(
+        user_data = {
+            'email' : 'admin@bookly.com',
+            'user_id' : user_id or USER_IDS[role],
+            'role' : role
+        }
+    )
+
+
+def test_db_pool_stats():
+
+    client = TestClient(app, base_url = 'http://localhost')
+
+    response = client.get(
+        url = f'{metrics_prefix}/db-pool',
+        headers = {'Authorization' : f'Bearer {make_token("admin")}'}
+    )
+
+    assert response.status_code == 200
+    assert set(response.json()) == {'pool_size', 'max_overflow', 'checked_out', 'idle', 'overflow', 'waiting'}
+
+
+def test_db_pool_stats_requires_admin():
+
+    client = TestClient(app, base_url = 'http://localhost')
+
+    response = client.get(
+        url = f'{metrics_prefix}/db-pool',
+        headers = {'Authorization' : f'Bearer {make_token("user")}'}
+    )
+
+    assert response.status_code == 403
+
+
+def test_metrics_follow_the_stored_role(stored_roles):
+
+    client = TestClient(app, base_url = 'http://localhost')
+
+    token = make_token('admin')  # the token still claims admin
+
+    stored_roles[USER_IDS['admin']] = Principal(id = USER_IDS['admin'], role = 'user', is_verified = True)  # the role was revoked since
+
+    response = client.get(url = f'{metrics_prefix}/db-pool', headers = {'Authorization' : f'Bearer {token}'})
+
+    assert response.status_code == 403
+
+
+def test_token_cache_stats():
+
+    client = TestClient(app, base_url = 'http://localhost')
+    headers = {'Authorization' : f'Bearer {make_token("admin")}'}
+
+    before = client.get(url = f'{metrics_prefix}/tokens', headers = headers).json()
+    after = client.get(url = f'{metrics_prefix}/tokens', headers = headers).json()
+
+    assert after['verifications_saved'] == before['verifications_saved'] + 1
+    assert after['verifications'] == before['verifications']
@@ -0,0 +1,49 @@
+from src.pagination import encode_cursor, decode_cursor, keyset_page
+from src.books.services import BOOK_PAGE_ORDER
+from src.errors import InvalidCursor
+from datetime import datetime
+from types import SimpleNamespace
+import uuid
+import pytest
+
+
+def test_cursor_round_trip():
+
+    values = [datetime(2025, 8, 8, 12, 30, 1, 250), uuid.uuid4()]
+
+    assert decode_cursor(encode_cursor(values), BOOK_PAGE_ORDER) == values
+
+
+@pytest.mark.parametrize('cursor', ['not-a-cursor', encode_cursor(['2025-08-08T12:00:00']), encode_cursor(['yesterday', 'nope'])])
+def test_invalid_cursor(cursor):
+
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, BOOK_PAGE_ORDER)
+
+
+def test_keyset_page_cuts_extra_row():
+
+    rows = [SimpleNamespace(created_at = datetime(2025, 8, day), id = uuid.uuid4()) for day in range(3, 0, -1)]
+
+    page, next_cursor = keyset_page(rows, BOOK_PAGE_ORDER, limit = 2)
+
+    assert page == rows[:2]
+    assert decode_cursor(next_cursor, BOOK_PAGE_ORDER) == [rows[1].created_at, rows[1].id]
+
+    page, next_cursor = keyset_page(rows, BOOK_PAGE_ORDER, limit = 3)
+
+    assert page == rows
+    assert next_cursor is None
+
+
+def test_scoped_cursor_only_continues_its_sort():
+
+    values = [datetime(2025, 8, 8, 12, 30), uuid.uuid4()]
+
+    cursor = encode_cursor(values, scope = 'oldest')
+
+    assert decode_cursor(cursor, BOOK_PAGE_ORDER, scope = 'oldest') == values
+
+    for scope in ('newest', None):
+        with pytest.raises(InvalidCursor):
+            decode_cursor(cursor, BOOK_PAGE_ORDER, scope = scope)
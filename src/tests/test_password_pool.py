@@ -0,0 +1,45 @@
+from src.auth.password_pool import PasswordPool
+from src.errors import PasswordPoolBusy
+import asyncio
+import threading
+import pytest
+
+
+def test_hash_and_verify_off_the_event_loop():
+
+    pool = PasswordPool(size = 2, queue = 2)
+
+    async def roundtrip():
+        hashed = await pool.hash('s3cret-password')
+
+        return await pool.verify('s3cret-password', hashed), await pool.verify('wrong-password', hashed)
+
+    assert asyncio.run(roundtrip()) == (True, False)
+    assert pool.stats()['completed'] == 3
+
+
+def test_saturated_pool_rejects():
+
+    pool = PasswordPool(size = 1, queue = 1)
+    release = threading.Event()
+
+    async def saturate():
+        running = asyncio.ensure_future(pool.run(release.wait))
+        queued = asyncio.ensure_future(pool.run(release.wait))
+        await asyncio.sleep(0.05)
+
+        stats = pool.stats()
+
+        with pytest.raises(PasswordPoolBusy):
+            await pool.run(release.wait)
+
+        release.set()
+        await asyncio.gather(running, queued)
+
+        return stats
+
+    stats = asyncio.run(saturate())
+
+    assert (stats['running'], stats['queued']) == (1, 1)
+    assert pool.stats()['rejected'] == 1
+    assert pool.stats()['queued'] == 0
@@ -0,0 +1,286 @@
+"""
+Counts the SQL statements each read endpoint sends, so relation loading that
+creeps back in (e.g. a relationship loaded for a response that never shows it)
+fails loudly.
+
+Needs a PostgreSQL database migrated to head in TEST_DATABASE_URL, see test_indexes.py.
+"""
+from fastapi.testclient import TestClient
+from sqlalchemy import event, delete
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.main import app
+from src.db.main import get_session, get_read_session
+from src.db.models import User, Book, Review, Tag, BookTags
+from src.auth.utils import create_access_token
+from src.cache import invalidate_book_detail, invalidate_principal
+from src.auth.services import UserService
+from datetime import date
+import asyncio
+import os
+import uuid
+import pytest
+
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+
+pytestmark = pytest.mark.skipif(TEST_DATABASE_URL is None, reason = 'needs a PostgreSQL database in TEST_DATABASE_URL')
+
+
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+
+
+@pytest.fixture(scope = 'module')
+def seeded():
+
+    engine = create_async_engine(TEST_DATABASE_URL, poolclass = NullPool)
+
+    async def seed():
+        async with AsyncSession(engine, expire_on_commit = False) as session:
+            user = User(username = 'query_count', password = 'x', email = f'{uuid.uuid4()}@bookly.com', first_name = 'Query', last_name = 'Count', role = 'user', is_verified = True)
+            session.add(user)
+            await session.flush()
+
+            tag = Tag(name = f'tag-{uuid.uuid4()}')
+
+            books = [Book(title = f'Book {i}', author = 'Bookly', published_date = date(2020, 1, 1), page_count = 100, language = 'en', user_id = user.id, tags = [tag]) for i in range(3)]
+            session.add_all(books)
+            await session.flush()
+
+            session.add_all([Review(rating = 4, review = 'Good', user_id = user.id, book_id = book.id) for book in books])
+            await session.commit()
+
+            return user, books, tag
+
+    async def cleanup(user, books, tag):
+        async with AsyncSession(engine) as session:
+            book_ids = [book.id for book in books]
+            await session.exec(delete(Review).where(Review.book_id.in_(book_ids)))
+            await session.exec(delete(BookTags).where(BookTags.book_id.in_(book_ids)))
+            await session.exec(delete(Book).where(Book.id.in_(book_ids)))
+            await session.exec(delete(Tag).where(Tag.id == tag.id))
+            await session.exec(delete(User).where(User.id == user.id))
+            await session.commit()
+
+    user, books, tag = asyncio.run(seed())
+
+    async def test_session():
+        async with AsyncSession(engine, expire_on_commit = False) as session:
+            yield session
+
+    overrides = dict(app.dependency_overrides)
+    app.dependency_overrides[get_session] = test_session
+    app.dependency_overrides[get_read_session] = test_session
+
+    counter = QueryCounter()
+    event.listen(engine.sync_engine, 'before_cursor_execute', counter)
+
+    token = create_access_token(user_data = {'email' : user.email, 'user_id' : str(user.id), 'role' : user.role})
+
+    with TestClient(app, base_url = 'http://localhost') as client:
+        client.headers['Authorization'] = f'Bearer {token}'
+
+        client.get('/api/v1/books/', params = {'limit' : 1})  # caches the principal, the counts below are of the endpoints themselves
+
+        yield client, counter, user, books
+
+    event.remove(engine.sync_engine, 'before_cursor_execute', counter)
+    app.dependency_overrides.clear()
+    app.dependency_overrides.update(overrides)
+
+    asyncio.run(cleanup(user, books, tag))
+    asyncio.run(engine.dispose())
+
+
+def count_queries(seeded, url : str, method : str = 'GET', **kwargs) -> int:
+
+    client, counter, user, books = seeded
+
+    counter.count = 0
+    counter.statements.clear()
+
+    response = client.request(method, url, **kwargs)
+
+    assert response.status_code == 200, response.text
+
+    return counter.count
+
+
+# the page of books only, the role check is served by the cached principal and no reviews or tags are loaded
+def test_book_listing_queries(seeded):
+
+    assert count_queries(seeded, '/api/v1/books/') == 1
+
+
+# without a cached principal the role check reads id, role and is_verified, never the whole user
+def test_principal_queries(seeded):
+
+    client, counter, user, books = seeded
+
+    asyncio.run(invalidate_principal(user.id))
+
+    assert count_queries(seeded, '/api/v1/books/') == 2
+    assert 'users.password' not in counter.statements[0]
+
+    assert count_queries(seeded, '/api/v1/books/') == 1
+
+
+def test_update_user_drops_principal(seeded):
+
+    client, counter, user, books = seeded
+
+    async def update():
+        engine = create_async_engine(TEST_DATABASE_URL, poolclass = NullPool)
+
+        async with AsyncSession(engine, expire_on_commit = False) as session:
+            current = await session.get(User, user.id)
+            await UserService().update_user(current, {'first_name' : 'Updated'}, session)
+
+        await engine.dispose()
+
+    asyncio.run(update())
+
+    assert count_queries(seeded, '/api/v1/books/') == 2
+
+
+def test_user_books_queries(seeded):
+
+    client, counter, user, books = seeded
+
+    assert count_queries(seeded, f'/api/v1/books/user/{user.id}') == 1
+
+
+# book + one batched load each for reviews and tags
+def test_book_detail_queries(seeded):
+
+    client, counter, user, books = seeded
+
+    asyncio.run(invalidate_book_detail(books[0].id))
+
+    assert count_queries(seeded, f'/api/v1/books/{books[0].id}') == 3
+
+
+# a cached detail with a cached principal needs no query at all
+def test_cached_book_detail_queries(seeded):
+
+    client, counter, user, books = seeded
+
+    asyncio.run(invalidate_book_detail(books[1].id))
+
+    count_queries(seeded, f'/api/v1/books/{books[1].id}')
+
+    assert count_queries(seeded, f'/api/v1/books/{books[1].id}') == 0
+
+
+# ?fields= without collections skips the review and tag loads and reads only the requested columns
+def test_sparse_book_detail_queries(seeded):
+
+    client, counter, user, books = seeded
+
+    asyncio.run(invalidate_book_detail(books[0].id))
+
+    assert count_queries(seeded, f'/api/v1/books/{books[0].id}', params = {'fields' : 'id,title'}) == 1
+
+    book_select = counter.statements[-1]
+
+    assert 'books.title' in book_select and 'books.author' not in book_select
+
+
+def test_sparse_book_listing(seeded):
+
+    client, counter, user, books = seeded
+
+    response = client.get('/api/v1/books/', params = {'fields' : 'title', 'limit' : 2})
+
+    assert [set(book) for book in response.json()['books']] == [{'title'}, {'title'}]
+    assert 'books.page_count' not in counter.statements[-1]
+
+    next_page = client.get('/api/v1/books/', params = {'fields' : 'title', 'limit' : 2, 'cursor' : response.json()['next_cursor']})
+
+    assert next_page.status_code == 200
+
+    assert client.get('/api/v1/books/', params = {'fields' : 'title,password'}).status_code == 400
+
+
+def test_tag_listing_queries(seeded):
+
+    assert count_queries(seeded, '/api/v1/tags/') == 1
+
+
+def test_review_listing_queries(seeded):
+
+    assert count_queries(seeded, '/api/v1/reviews/') == 1
+
+
+# current user, then the user again with one batched load each for books and reviews
+def test_me_queries(seeded):
+
+    assert count_queries(seeded, '/api/v1/auth/me') == 4
+
+
+# the current user is already loaded, only a requested collection costs a query
+def test_sparse_me_queries(seeded):
+
+    assert count_queries(seeded, '/api/v1/auth/me', params = {'fields' : 'username,email'}) == 1
+    assert count_queries(seeded, '/api/v1/auth/me', params = {'fields' : 'username,books'}) == 3
+
+
+# one WHERE id = ANY(...) for every book + one batched load each for reviews and tags
+def test_book_batch_queries(seeded):
+
+    client, counter, user, books = seeded
+
+    unknown = str(uuid.uuid4())
+    ids = [str(books[2].id), unknown, str(books[0].id), 'not-a-uuid', str(books[2].id)]
+
+    assert count_queries(seeded, '/api/v1/books/batch', params = {'ids' : ','.join(ids)}) == 3
+
+    batch = client.get('/api/v1/books/batch', params = {'ids' : ','.join(ids)}).json()
+
+    assert [book['id'] for book in batch['books']] == [str(books[2].id), str(books[0].id)]
+    assert [len(book['reviews']) for book in batch['books']] == [1, 1]
+    assert batch['missing'] == [unknown, 'not-a-uuid']
+
+    assert client.get('/api/v1/books/batch', params = {'ids' : ','.join(str(uuid.uuid4()) for _ in range(101))}).status_code == 400
+
+
+# the detail of an id sent in another spelling is cached under the same key the review and tag writes drop
+def test_book_detail_of_any_id_spelling_is_invalidated(seeded):
+
+    client, counter, user, books = seeded
+
+    book_id = str(books[1].id).upper()
+
+    before = client.get(f'/api/v1/books/{book_id}').json()
+
+    assert client.post(f'/api/v1/reviews/book/{books[1].id}', json = {'rating' : 4, 'review' : 'Better'}).status_code == 201
+
+    after = client.get(f'/api/v1/books/{book_id}').json()
+
+    assert after['version'] == before['version'] + 1
+    assert len(after['reviews']) == len(before['reviews']) + 1
+
+
+# one UPDATE ... RETURNING, the book is never loaded first
+def test_update_book_queries(seeded):
+
+    client, counter, user, books = seeded
+
+    assert count_queries(seeded, f'/api/v1/books/{books[2].id}', 'PATCH', json = {'page_count' : 120}) == 1
+
+
+# one DELETE ... RETURNING, reviews and tag links go through ON DELETE CASCADE
+def test_delete_book_queries(seeded):
+
+    client, counter, user, books = seeded
+
+    assert count_queries(seeded, f'/api/v1/books/{books[2].id}', 'DELETE') == 1
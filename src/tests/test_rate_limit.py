@@ -0,0 +1,107 @@
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+from src.main import app
+from src.auth import rate_limit
+from src.auth.rate_limit import RateLimiter, MemoryCounterBackend
+from src.errors import RateLimited
+import asyncio
+import uuid
+import pytest
+
+
+class Clock:
+
+    def __init__(self, now : float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+def test_sliding_window(monkeypatch):
+
+    clock = Clock(6000.0)  # start of a window
+    monkeypatch.setattr(rate_limit, 'time', clock)
+
+    limiter = RateLimiter(MemoryCounterBackend(), window = 60)
+    limits = {'email' : ('reader@bookly.com', 3)}
+
+    async def attempt():
+        await limiter.hit('login', limits)
+
+    for _ in range(3):
+        asyncio.run(attempt())
+
+    with pytest.raises(RateLimited) as rejected:
+        asyncio.run(attempt())
+
+    assert rejected.value.retry_after == 90  # the rejected attempt counts too: 60s for the window to end, then half of the 4 previous attempts have to slide out
+
+    clock.now += 70  # 10s into the next window 3.33 attempts still count, this one makes it 4.33
+    with pytest.raises(RateLimited) as rejected:
+        asyncio.run(attempt())
+
+    assert rejected.value.retry_after == 35  # until 4 * (1 - 45 / 60) + 1 leaves room for one more
+
+    clock.now += 35
+    asyncio.run(attempt())
+
+    assert limiter.stats()['rejections'] == {'login:email' : 2}
+
+
+class RoundTripBackend(MemoryCounterBackend):
+    """Yields to the event loop around every call, like a trip to Redis"""
+
+    async def increment(self, keys, ttl):
+        await asyncio.sleep(0)
+        counts = await super().increment(keys, ttl)
+        await asyncio.sleep(0)
+        return counts
+
+
+def test_concurrent_attempts_can_not_exceed_the_limit(monkeypatch):
+
+    monkeypatch.setattr(rate_limit, 'time', Clock(6000.0))
+
+    limiter = RateLimiter(RoundTripBackend(), window = 60)
+
+    async def storm():
+        return await asyncio.gather(*[limiter.hit('login', {'email' : ('reader@bookly.com', 5)}) for _ in range(20)], return_exceptions = True)
+
+    results = asyncio.run(storm())
+
+    assert results.count(None) == 5
+    assert all(isinstance(result, RateLimited) for result in results if result is not None)
+
+
+def test_limits_are_per_key(monkeypatch):
+
+    monkeypatch.setattr(rate_limit, 'time', Clock(6000.0))
+
+    limiter = RateLimiter(MemoryCounterBackend(), window = 60)
+
+    async def attempt(email):
+        await limiter.hit('login', {'email' : (email, 1), 'ip' : ('10.0.0.1', 0)})  # a limit of 0 is off
+
+    asyncio.run(attempt('first@bookly.com'))
+    asyncio.run(attempt('second@bookly.com'))
+
+    with pytest.raises(RateLimited):
+        asyncio.run(attempt('first@bookly.com'))
+
+
+def test_login_is_rejected_before_the_user_lookup(monkeypatch):
+
+    monkeypatch.setattr(rate_limit.rate_limiter, 'backend', MemoryCounterBackend())
+
+    client = TestClient(app, base_url = 'http://localhost')
+    credentials = {'email' : f'{uuid.uuid4()}@bookly.com', 'password' : 'wrong-password'}
+
+    with patch('src.auth.routes.user_service.get_user_by_email', new = AsyncMock(return_value = None)) as lookup:
+        statuses = [client.post('/api/v1/auth/login', json = credentials).status_code for _ in range(6)]
+
+        response = client.post('/api/v1/auth/login', json = credentials)
+
+    assert statuses == [400] * 5 + [429]
+    assert int(response.headers['Retry-After']) > 0
+    assert lookup.await_count == 5
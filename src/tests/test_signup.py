@@ -0,0 +1,64 @@
+"""
+Signups racing for the same email, only the unique index on users.email can settle them.
+
+Needs a PostgreSQL database migrated to head in TEST_DATABASE_URL, see test_indexes.py.
+"""
+from sqlalchemy import delete, func
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from unittest.mock import AsyncMock, patch
+from src.db.models import User
+from src.auth.services import UserService
+from src.auth.structs import UserCreateModel
+from src.errors import UserAlreadyExists
+import asyncio
+import os
+import uuid
+import pytest
+
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+
+pytestmark = pytest.mark.skipif(TEST_DATABASE_URL is None, reason = 'needs a PostgreSQL database in TEST_DATABASE_URL')
+
+SIGNUPS = 8
+
+
+def test_concurrent_signups_create_one_user():
+
+    email = f'{uuid.uuid4()}@bookly.com'
+
+    user_data = UserCreateModel(username = 'racer', email = email, password = 'PrimeToBe##1', first_name = 'Race', last_name = 'Condition')
+
+    async def race():
+        engine = create_async_engine(TEST_DATABASE_URL, poolclass = NullPool)
+
+        async def signup():
+            async with AsyncSession(engine, expire_on_commit = False) as session:
+                return await UserService().create_user(user_data, session)
+
+        try:
+            results = await asyncio.gather(*[signup() for _ in range(SIGNUPS)], return_exceptions = True)
+
+            async with AsyncSession(engine) as session:
+                stored = (await session.exec(select(func.count()).select_from(User).where(User.email == email))).one()
+
+                await session.exec(delete(User).where(User.email == email))
+                await session.commit()
+
+        finally:
+            await engine.dispose()
+
+        return results, stored
+
+    with patch('src.auth.services.password_pool.hash', new = AsyncMock(return_value = 'hashed')):  # no bcrypt, the inserts start together
+        results, stored = asyncio.run(race())
+
+    created = [result for result in results if isinstance(result, User)]
+
+    assert stored == 1
+    assert len(created) == 1
+    assert created[0].email == email and created[0].role == 'user' and created[0].is_verified is False
+    assert all(isinstance(result, UserAlreadyExists) for result in results if result is not created[0])
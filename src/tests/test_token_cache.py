@@ -0,0 +1,88 @@
+from src.auth.token_cache import TokenCache
+from src.auth.utils import create_access_token, decode_token
+from datetime import timedelta
+import time
+
+
+user_data = {'email' : 'cache@bookly.com', 'user_id' : '3fa85f64-5717-4562-b3fc-2c963f66afa6', 'role' : 'user'}
+
+
+class CountingDecode:
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, token : str):
+        self.calls += 1
+        return decode_token(token)
+
+
+def test_token_is_verified_once():
+
+    decode = CountingDecode()
+    cache = TokenCache(decode = decode)
+    token = create_access_token(user_data)
+
+    claims = [cache.decode(token) for _ in range(3)]
+
+    assert decode.calls == 1
+    assert claims[0]['user'] == user_data and claims[0] is claims[2]
+    assert cache.stats()['verifications_saved'] == 2
+
+
+def test_invalid_token_is_not_cached():
+
+    decode = CountingDecode()
+    cache = TokenCache(decode = decode)
+
+    assert cache.decode('not-a-token') is None
+    assert cache.decode('not-a-token') is None
+    assert decode.calls == 2
+
+
+def test_entry_expires_with_the_token():
+
+    decode = CountingDecode()
+    cache = TokenCache(decode = decode)
+    token = create_access_token(user_data)
+
+    cache.decode(token)
+
+    key, (expires_at, claims) = next(iter(cache.entries.items()))
+    cache.entries[key] = (time.time() - 1, claims)  # as if exp had passed
+
+    cache.decode(token)
+
+    assert decode.calls == 2
+
+
+def test_least_recently_used_token_is_dropped():
+
+    cache = TokenCache(max_entries = 2)
+    tokens = [create_access_token(user_data, expiry = timedelta(seconds = 3600 + i)) for i in range(3)]
+
+    cache.decode(tokens[0])
+    cache.decode(tokens[1])
+    cache.decode(tokens[0])  # tokens[1] is now the least recently used
+    cache.decode(tokens[2])
+
+    misses = cache.misses
+
+    cache.decode(tokens[0])
+    cache.decode(tokens[1])
+
+    assert len(cache.entries) == 2
+    assert cache.misses == misses + 1
+
+
+def test_discard():
+
+    decode = CountingDecode()
+    cache = TokenCache(decode = decode)
+    token = create_access_token(user_data)
+
+    cache.decode(token)
+    cache.discard(token)
+    cache.decode(token)
+
+    assert decode.calls == 2